@@ -0,0 +1,37 @@
+import app as app_module
+from scheduler import scheduler
+
+# Test the factory registers every blueprint on the app it builds
+def test_create_app_blueprints(app):
+    assert {"users", "stripe", "azuredata", "azurevm", "internal", "profiles"} <= set(app.blueprints)
+    assert "seed" in app.cli.commands
+
+# Test the settings passed to the factory override the environment
+def test_create_app_config(app):
+    assert app.config["SQLALCHEMY_DATABASE_URI"] == "sqlite://"
+    assert app.config["SCHEDULER_ENABLED"] is False
+
+# Test every call builds its own app
+def test_create_app_independent(app):
+    other = app_module.create_app({**app.config, "API_TITLE": "other"})
+    assert other is not app and other.config["API_TITLE"] == "other"
+    assert app.config["API_TITLE"] == "test"
+
+# Test the first request starts the scheduler only when it is enabled
+def test_create_app_scheduler(app, client, monkeypatch):
+    started = []
+    monkeypatch.setattr(app_module, "init_scheduler", started.append)
+
+    client.get('/api/azuredata/locations')
+    assert started == []
+    assert not scheduler.running
+
+    app.config["SCHEDULER_ENABLED"] = True
+    client.get('/api/azuredata/locations')
+    assert started == [app]
+
+# Test unknown API paths answer a JSON 404
+def test_create_app_api_not_found(client):
+    response = client.get('/api/unknown')
+    assert response.status_code == 404
+    assert response.json == {"message": "Resource not found"}
@@ -40,3 +40,9 @@ def test_locations_correct(client):
     response = client.get('/api/azuredata/locations')
     assert response.status_code == 200
     assert 'locations' in response.json
+
+# Test locations endpoint answers 304 when the list has not changed
+def test_locations_not_modified(client):
+    etag = client.get('/api/azuredata/locations').headers['ETag']
+    response = client.get('/api/azuredata/locations', headers={'If-None-Match': etag})
+    assert response.status_code == 304
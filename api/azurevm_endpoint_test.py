@@ -6,6 +6,7 @@ import os
 from flask_jwt_extended import JWTManager, create_access_token
 from datetime import timedelta
 from database import db
+from user_identity import init_user_loader
 from flask_migrate import Migrate
 from controllers.azurevm import blp as AzureVmBlueprint
 from controllers.user import blp as UserBlueprint
@@ -29,6 +30,8 @@ api: Api = Api(app)
 
 jwt = JWTManager(app)
 
+init_user_loader(jwt)
+
 api.register_blueprint(UserBlueprint)
 api.register_blueprint(AzureVmBlueprint)
 
@@ -95,8 +98,9 @@ def test_azurevm_history_no_machines_correct(client, payload):
 
     headers = {'Authorization': f'Bearer {response.json["access_token"]}'}
     response = client.get('/api/azurevm/history', headers=headers)
-    assert response.status_code == 404
-    assert response.json["message"] == "No VMs found."
+    assert response.status_code == 200
+    assert response.json["vm_list"] == []
+    assert response.json["next_cursor"] is None
 
 # Test azurevm history endpoint when no token in the GET
 def test_azurevm_history_no_token(client):
@@ -108,4 +112,9 @@ def test_azurevm_history_token_expired(client, expired_token):
     headers = {'Authorization': f'Bearer {expired_token}'}
     response = client.get('/api/azurevm/history', headers=headers)
     assert response.status_code == 401
-    assert response.json['msg'] == "Token has expired"
\ No newline at end of file
+    assert response.json['msg'] == "Token has expired"
+
+# Test azurevm sweeper endpoint when no token in the GET
+def test_azurevm_sweeper_no_token(client):
+    response = client.get('/api/azurevm/sweeper')
+    assert response.status_code == 401
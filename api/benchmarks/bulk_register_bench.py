@@ -0,0 +1,107 @@
+"""
+Benchmark of the bulk registration against the per-request registration.
+
+Registers --users users in a temporary SQLite database three ways and reports
+the throughput of each one:
+
+- per-request: one POST /api/user/register per user, as the client does.
+- bulk, 1 process: one POST /api/user/bulk-register with the hashes made in
+  the worker, the gain of the batched queries and insert alone.
+- bulk, N processes: the same with the hashes spread over --processes
+  processes, one per core by default.
+
+Usage, from the api folder:
+
+    python benchmarks/bulk_register_bench.py
+    python benchmarks/bulk_register_bench.py --users 500 --processes 8
+"""
+from datetime import timedelta
+import argparse
+import warnings
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+PASSWORD = "Passw0rd!"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="Users registered by every method")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Processes of the bulk hashes")
+    return parser.parse_args()
+
+
+def batch(prefix, users):
+    return [{
+        "email": f"{prefix}{number}@bench.biocloudlabs.es",
+        "password": PASSWORD,
+        "name": "Bench",
+        "surname": f"Student {number}",
+        "location_id": 1,
+    } for number in range(users)]
+
+
+def main():
+    args = parse_args()
+    warnings.simplefilter("ignore")
+
+    workdir = tempfile.mkdtemp(prefix="bulk-register-bench-")
+    os.environ["TEST_SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("JWT_SECRET_KEY", "bulk-register-bench-secret-key-0123456789")
+    os.environ.setdefault("API_TITLE", "BioCloudLabs API")
+    os.environ.setdefault("API_VERSION", "v1")
+    os.environ.setdefault("OPENAPI_VERSION", "3.0.2")
+
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from database import db
+    from seed_data import seed
+    import passwords
+    import models
+
+    app = create_app({"RATE_LIMIT_ENABLED": False})
+    with app.app_context():
+        db.create_all()
+        seed()
+        db.session.add(models.UserModel(email="admin@bench.biocloudlabs.es", password="x", name="Bench",
+                                        surname="Admin", location_id=1, role_id=3))
+        db.session.commit()
+        admin = models.UserModel.query.filter_by(email="admin@bench.biocloudlabs.es").one()
+        token = create_access_token(identity=str(admin.id), expires_delta=timedelta(hours=1))
+
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    results = {}
+
+    start = time.perf_counter()
+    for user in batch("single", args.users):
+        assert client.post("/api/user/register", json=user).status_code == 201
+    results["per-request"] = time.perf_counter() - start
+
+    for processes in (1, args.processes):
+        name = f"bulk, {processes} process{'es' if processes > 1 else ''}"
+        if name in results:
+            continue
+        # The endpoint hashes with the processes of the passwords module
+        passwords.HASH_PROCESSES = processes
+        start = time.perf_counter()
+        res = client.post("/api/user/bulk-register", json=batch(f"bulk{processes}-", args.users), headers=headers)
+        results[name] = time.perf_counter() - start
+        assert res.status_code == 200 and res.json["summary"]["created"] == args.users, res.json
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.users} users, {os.cpu_count()} cores\n")
+    print(f"{'method':<22} {'seconds':>8} {'users/s':>9} {'speedup':>8}")
+    for name, seconds in results.items():
+        print(f"{name:<22} {seconds:>8.2f} {args.users / seconds:>9.1f} {results['per-request'] / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
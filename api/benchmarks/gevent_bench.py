@@ -0,0 +1,308 @@
+"""
+Benchmark of the sync and gevent gunicorn workers against a slow orchestrator.
+
+Seeds a temporary SQLite database with users that have a running VM each,
+starts a local orchestrator stub answering every call after --delay seconds
+and serves the app with gunicorn in every worker mode. For every mode it runs:
+
+- setup: every user asks for a VM at once and polls its job until it is done.
+  The orchestrator call runs on the scheduler, JOB_WORKERS per worker.
+- poweroff: every user powers off its VM at once, the orchestrator call runs
+  inside the request.
+
+While a scenario runs, a probe requests /api/user/credits in a loop. Its
+latency is the wait of the requests that call no external service behind
+the slow ones.
+
+Usage, from the api folder:
+
+    python benchmarks/gevent_bench.py
+    python benchmarks/gevent_bench.py --users 64 --delay 2 --workers 2 --job-workers 32
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import timedelta
+from urllib.parse import urljoin
+import subprocess
+import threading
+import argparse
+import warnings
+import tempfile
+import socket
+import shutil
+import uuid
+import json
+import time
+import sys
+import os
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from load_test import percentile
+
+JWT_SECRET_KEY = "gevent-bench-secret-key-0123456789"
+MODES = ("sync", "gevent")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=32, help="Users acting at once")
+    parser.add_argument("--delay", type=float, default=1, help="Seconds every orchestrator call takes")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--job-workers", type=int, default=4, help="Scheduler threads of every worker")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated worker classes to run")
+    return parser.parse_args()
+
+
+def start_orchestrator(delay):
+    """
+    Start the orchestrator stub on a free port.
+
+    :param delay: Seconds every call takes.
+    :return: The running server.
+    """
+    class SlowOrchestrator(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            if self.path.startswith("/vm/setup"):
+                body = {"dns": f"vm-bench-{uuid.uuid4().hex[:8]}.biocloudlabs.es", "ip": "10.0.0.1"}
+            else:
+                body = {"code": 200}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowOrchestrator)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed(database_uri, users):
+    """
+    Create the schema and the users, each with a running VM.
+
+    :return: List of (access token, VM id) tuples, one per user.
+    """
+    from flask import Flask
+    from flask_jwt_extended import JWTManager, create_access_token
+    from sqlalchemy import insert, select
+    from database import db
+    import models
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    app.config["JWT_SECRET_KEY"] = JWT_SECRET_KEY
+    db.init_app(app)
+    JWTManager(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        db.session.execute(insert(models.RoleModel), [{"id": 1, "name": "registered"}])
+        db.session.execute(insert(models.LocationModel), [{"id": 1, "name": "eastus", "display_name": "(US) East US"}])
+        db.session.execute(insert(models.UserModel), [{
+            "id": user_id,
+            "email": f"user{user_id}@bench.biocloudlabs.es",
+            "password": "x",
+            "name": "Bench",
+            "surname": f"User {user_id}",
+            "credits": 10 ** 9,
+            "location_id": 1,
+            "role_id": 1,
+        } for user_id in range(1, users + 1)])
+        db.session.execute(insert(models.VirtualMachineModel), [{
+            "name": f"vm-{user_id}.biocloudlabs.es",
+            "type": "Standard_B2s",
+            "user_id": user_id,
+        } for user_id in range(1, users + 1)])
+        db.session.commit()
+
+        vms = dict(db.session.execute(select(models.VirtualMachineModel.user_id, models.VirtualMachineModel.id)).all())
+        accounts = [(create_access_token(identity=str(user_id), expires_delta=timedelta(hours=1)), vms[user_id])
+                    for user_id in range(1, users + 1)]
+        db.session.remove()
+
+    return accounts
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(mode, args, database_uri, orchestrator_url, workdir):
+    """
+    Serve the app with gunicorn and wait until it answers.
+
+    :return: Tuple with the process and the base URL.
+    """
+    import requests
+
+    port = free_port()
+    metrics_dir = os.path.join(workdir, f"metrics-{mode}")
+    env = {
+        **os.environ,
+        "GUNICORN_WORKER_CLASS": mode,
+        "TEST_SQLALCHEMY_DATABASE_URI": database_uri,
+        "JWT_SECRET_KEY": JWT_SECRET_KEY,
+        "API_TITLE": "BioCloudLabs API",
+        "API_VERSION": "v1",
+        "OPENAPI_VERSION": "3.0.2",
+        "ORCHESTRATOR_URL": orchestrator_url,
+        "JOB_WORKERS": str(args.job_workers),
+        "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+        "PYTHONWARNINGS": "ignore",
+    }
+    log = open(os.path.join(workdir, f"gunicorn-{mode}.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-b", f"127.0.0.1:{port}"],
+        cwd=API_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited, see {log.name}")
+        try:
+            requests.get(base_url + "/api/azuredata/locations", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not start, see {log.name}")
+
+
+class Probe(threading.Thread):
+    """
+    Requests the credits of a user in a loop and records the latencies.
+    """
+
+    def __init__(self, base_url, token):
+        super().__init__(daemon=True)
+        self.url = base_url + "/api/user/credits"
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        import requests
+
+        session = requests.Session()
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            session.get(self.url, headers=self.headers, timeout=120)
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.05)
+
+
+def setup_vm(base_url, account):
+    """
+    Ask for a VM and poll the job until it is done.
+
+    :return: True if the VM was created.
+    """
+    import requests
+
+    token, _ = account
+    session = requests.Session()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    res = session.get(base_url + "/api/azurevm/setup", headers=headers, timeout=120)
+    if res.status_code != 202:
+        return False
+
+    job_url = urljoin(base_url, res.headers["Location"])
+    while True:
+        status = session.get(job_url, headers=headers, timeout=120).json()["status"]
+        if status in ("succeeded", "failed"):
+            return status == "succeeded"
+        time.sleep(0.1)
+
+
+def poweroff_vm(base_url, account):
+    """
+    Power off the VM of a user.
+
+    :return: True if the VM was powered off.
+    """
+    import requests
+
+    token, vm_id = account
+    res = requests.delete(base_url + "/api/azurevm/poweroff", json={"id": vm_id},
+                          headers={"Authorization": f"Bearer {token}"}, timeout=120)
+    return res.status_code == 200
+
+
+def run_scenario(operation, base_url, accounts):
+    """
+    Run the operation for every account at once while the probe runs.
+
+    :return: Dict with the wall time, the throughput, the failures and the probe latencies in ms.
+    """
+    probe = Probe(base_url, accounts[0][0])
+    probe.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(accounts)) as pool:
+        results = list(pool.map(lambda account: operation(base_url, account), accounts))
+    elapsed = time.perf_counter() - start
+
+    probe.stopped.set()
+    probe.join()
+    latencies = sorted(probe.latencies)
+
+    return {
+        "seconds": round(elapsed, 2),
+        "ops": round(len(accounts) / elapsed, 2),
+        "failed": results.count(False),
+        "probe_p50": round(percentile(latencies, 50), 1),
+        "probe_p95": round(percentile(latencies, 95), 1),
+        "probe_max": round(latencies[-1], 1),
+    }
+
+
+def main():
+    args = parse_args()
+    warnings.simplefilter("ignore")
+
+    workdir = tempfile.mkdtemp(prefix="gevent-bench-")
+    database_uri = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    orchestrator = start_orchestrator(args.delay)
+    orchestrator_url = f"http://127.0.0.1:{orchestrator.server_port}"
+
+    print(f"{args.users} users, {args.workers} workers, {args.job_workers} job threads per worker, "
+          f"orchestrator calls of {args.delay}s")
+    print(f"\n{'mode':<8} {'scenario':<10} {'seconds':>8} {'ops/s':>8} {'failed':>7} "
+          f"{'probe p50':>10} {'probe p95':>10} {'probe max':>10}")
+
+    try:
+        for mode in args.modes.split(","):
+            accounts = seed(database_uri, args.users)
+            process, base_url = start_gunicorn(mode, args, database_uri, orchestrator_url, workdir)
+            try:
+                for name, operation in (("setup", setup_vm), ("poweroff", poweroff_vm)):
+                    result = run_scenario(operation, base_url, accounts)
+                    print(f"{mode:<8} {name:<10} {result['seconds']:>8.2f} {result['ops']:>8.2f} {result['failed']:>7} "
+                          f"{result['probe_p50']:>10.1f} {result['probe_p95']:>10.1f} {result['probe_max']:>10.1f}")
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        orchestrator.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Microbenchmark of the password hashing configurations.
+
+Reports how many hashes per second one core computes for every configuration,
+which bounds the logins per second a worker can serve. With --processes the
+benchmark runs on several cores at once to show how it scales.
+
+Usage, from the api folder:
+
+    python benchmarks/hash_bench.py
+    python benchmarks/hash_bench.py --seconds 5 --processes 4
+"""
+from concurrent.futures import ProcessPoolExecutor
+from passlib.exc import MissingBackendError
+import argparse
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import make_context, pwd_context, PASSWORD_SCHEMES
+
+PASSWORD = "Password123!"
+
+CONFIGURATIONS = {
+    "pbkdf2_sha256 29000 rounds (passlib default)": lambda: make_context(["pbkdf2_sha256"], pbkdf2_rounds=29000),
+    "pbkdf2_sha256 100000 rounds": lambda: make_context(["pbkdf2_sha256"], pbkdf2_rounds=100000),
+    "pbkdf2_sha256 600000 rounds": lambda: make_context(["pbkdf2_sha256"], pbkdf2_rounds=600000),
+    "argon2 t=2 m=19MiB p=1": lambda: make_context(["argon2"], argon2_time_cost=2, argon2_memory_cost=19456, argon2_parallelism=1),
+    "argon2 t=3 m=64MiB p=4 (passlib default)": lambda: make_context(["argon2"]),
+    f"current policy ({','.join(PASSWORD_SCHEMES)})": lambda: pwd_context,
+}
+
+
+def run(name, seconds):
+    """
+    Verify the same hash for ``seconds`` seconds, as a login does.
+
+    :param name: Configuration to run.
+    :param seconds: Duration of the run.
+    :return: Number of verifications done.
+    """
+    context = CONFIGURATIONS[name]()
+    password_hash = context.hash(PASSWORD)
+
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        context.verify(PASSWORD, password_hash)
+        count += 1
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2, help="Duration of every run")
+    parser.add_argument("--processes", type=int, default=1, help="Cores used at once")
+    args = parser.parse_args()
+
+    print(f"{'configuration':<48} {'hashes/s/core':>14} {'ms/hash':>9} {'hashes/s total':>15}")
+
+    for name in CONFIGURATIONS:
+        try:
+            with ProcessPoolExecutor(args.processes) as pool:
+                counts = list(pool.map(run, [name] * args.processes, [args.seconds] * args.processes))
+        except MissingBackendError:
+            print(f"{name:<48} {'backend not installed':>40}")
+            continue
+
+        total = sum(counts) / args.seconds
+        per_core = total / args.processes
+        print(f"{name:<48} {per_core:>14.1f} {1000 / per_core:>9.2f} {total:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Microbenchmark of the request metrics.
+
+Reports what the request hooks of metrics.py add to every request, on their
+own and next to a whole request of a bare Flask app. Run it once as is and
+once with PROMETHEUS_MULTIPROC_DIR set to see the cost of the multiprocess
+mode used under gunicorn.
+
+Usage, from the api folder:
+
+    python benchmarks/metrics_bench.py
+    PROMETHEUS_MULTIPROC_DIR=$(mktemp -d) python benchmarks/metrics_bench.py
+"""
+import argparse
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response
+from metrics import init_metrics, start_request, record_request, track_outbound
+
+
+def run(iterations, body):
+    """
+    :param iterations: Times the body runs.
+    :param body: Function to time.
+    :return: Seconds per run.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000, help="Requests simulated")
+    args = parser.parse_args()
+
+    def make_app(instrumented):
+        app = Flask(__name__)
+
+        @app.route("/api/azurevm/history")
+        def history():
+            return ""
+
+        if instrumented:
+            init_metrics(app)
+        return app
+
+    app = make_app(False)
+    response = Response()
+
+    def request_hooks():
+        start_request()
+        record_request(response)
+
+    def outbound():
+        with track_outbound("stripe", "bench"):
+            pass
+
+    mode = "multiprocess" if os.getenv("PROMETHEUS_MULTIPROC_DIR") else "single process"
+    print(f"mode: {mode}")
+
+    with app.test_request_context("/api/azurevm/history"):
+        run(1000, request_hooks)
+        print(f"{'request hooks':<20} {run(args.iterations, request_hooks) * 1e6:>8.2f} us/request")
+    print(f"{'outbound call':<20} {run(args.iterations, outbound) * 1e6:>8.2f} us/call")
+
+    requests = max(1, args.iterations // 10)
+    for instrumented in (False, True):
+        client = make_app(instrumented).test_client()
+        run(100, lambda: client.get("/api/azurevm/history"))
+        seconds = run(requests, lambda: client.get("/api/azurevm/history"))
+        name = "request, metrics" if instrumented else "request, bare"
+        print(f"{name:<20} {seconds * 1e6:>8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark of the startup of the API workers.
+
+Measures, in a fresh interpreter, how long importing app.py and running
+create_app() take and which SDKs they load. Then it serves the app with
+gunicorn with and without --preload and reports for every run the time until
+every worker answers and the memory of every worker once it served a few
+requests:
+
+- RSS: resident memory, it counts the pages shared with the master.
+- PSS: shared pages divided among the processes sharing them.
+- USS: pages private to the worker, what one more worker costs.
+
+Reads the memory from /proc, so it only runs on Linux.
+
+Usage, from the api folder:
+
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --workers 4 --worker-class gevent
+"""
+import subprocess
+import argparse
+import warnings
+import tempfile
+import socket
+import shutil
+import json
+import time
+import sys
+import os
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENVIRONMENT = {
+    "JWT_SECRET_KEY": "startup-bench-secret-key-0123456789",
+    "API_TITLE": "BioCloudLabs API",
+    "API_VERSION": "v1",
+    "OPENAPI_VERSION": "3.0.2",
+    "PYTHONWARNINGS": "ignore",
+}
+
+# Run in a fresh interpreter, the time of create_app includes every import
+CREATE_APP = """
+import time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+built = time.perf_counter()
+import json, sys
+print(json.dumps({
+    "import": imported - start,
+    "create_app": built - imported,
+    "sdks": [name for name in ("stripe", "resend", "requests", "gevent") if name in sys.modules],
+}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--worker-class", default="sync", help="gunicorn worker class")
+    parser.add_argument("--requests", type=int, default=50, help="Requests sent before measuring the memory")
+    return parser.parse_args()
+
+
+def memory(pid):
+    """
+    :param pid: Process to measure.
+    :return: Dict with the RSS, PSS and USS of the process in MiB.
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "uss": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_create_app(env):
+    result = subprocess.run([sys.executable, "-c", CREATE_APP], cwd=API_DIR, env=env, capture_output=True,
+                            text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_gunicorn(args, env, workdir, preload):
+    """
+    Start gunicorn, wait until every worker is ready and measure the workers.
+
+    :return: Dict with the boot time in seconds and the mean memory of a worker and of the master.
+    """
+    import requests
+
+    port = free_port()
+    env = {**env, "GUNICORN_PRELOAD": "1" if preload else "0", "GUNICORN_WORKER_CLASS": args.worker_class}
+    log_path = os.path.join(workdir, f"gunicorn-{'preload' if preload else 'no-preload'}.log")
+
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-b", f"127.0.0.1:{port}"],
+            cwd=API_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+    try:
+        # post_worker_init of gunicorn.conf.py logs a line once the worker loaded the app
+        deadline = time.monotonic() + 60
+        while True:
+            with open(log_path) as log:
+                if log.read().count("Worker ready") >= args.workers:
+                    break
+            if time.monotonic() > deadline or process.poll() is not None:
+                raise RuntimeError(f"gunicorn did not start, see {log_path}")
+            time.sleep(0.01)
+        booted = time.perf_counter() - start
+
+        url = f"http://127.0.0.1:{port}/api/azuredata/locations"
+
+        with requests.Session() as session:
+            for _ in range(args.requests):
+                session.get(url, timeout=5)
+
+        workers = [memory(pid) for pid in children(process.pid)]
+        return {
+            "boot": booted,
+            "worker": {key: sum(worker[key] for worker in workers) / len(workers) for key in ("rss", "pss", "uss")},
+            "master": memory(process.pid),
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    args = parse_args()
+    warnings.simplefilter("ignore")
+
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    env = {
+        **os.environ,
+        **ENVIRONMENT,
+        "TEST_SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "metrics"),
+    }
+
+    os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+
+    try:
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "db", "upgrade"], cwd=API_DIR, env=env,
+                       capture_output=True, check=True)
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "seed"], cwd=API_DIR, env=env,
+                       capture_output=True, check=True)
+
+        app = measure_create_app(env)
+        print(f"import app {app['import']:.3f}s, create_app() {app['create_app'] * 1000:.1f}ms, "
+              f"SDKs loaded: {', '.join(app['sdks']) or 'none'}")
+
+        print(f"\n{args.workers} {args.worker_class} workers")
+        print(f"{'preload':<8} {'boot s':>7} {'worker RSS':>11} {'worker PSS':>11} {'worker USS':>11} {'master RSS':>11}")
+        for preload in (False, True):
+            result = measure_gunicorn(args, env, workdir, preload)
+            worker = result["worker"]
+            print(f"{'yes' if preload else 'no':<8} {result['boot']:>7.2f} {worker['rss']:>9.1f}Mi {worker['pss']:>9.1f}Mi "
+                  f"{worker['uss']:>9.1f}Mi {result['master']['rss']:>9.1f}Mi")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,146 @@
 This file contains the blocklist of the JWT tokens. It will be imported by
 app and the logout resource so that tokens can be added to the blocklist when the
 user logs out.
+
+The storage is chosen with the BLOCKLIST_BACKEND environment variable:
+
+- ``memory``: a per-worker dict, only valid when running a single worker.
+- ``redis``: a Redis compatible server at BLOCKLIST_REDIS_URL shared by every worker.
+- ``sql``: the ``token_blocklist`` table of the application database.
+
+Every backend forgets a token once its ``exp`` has passed, since an expired
+token is rejected anyway.
 """
+from datetime import datetime, timezone
+from cache_utils import TTLCache
+import threading
+import time
+import os
+
+NEGATIVE_CACHE_TTL = float(os.getenv("BLOCKLIST_NEGATIVE_CACHE_TTL", 2))
+NEGATIVE_CACHE_SIZE = int(os.getenv("BLOCKLIST_NEGATIVE_CACHE_SIZE", 4096))
+
+
+class MemoryBlocklistBackend:
+    """
+    Revoked tokens kept in a dict of jti -> exp inside the current process.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def add(self, jti, expires_at):
+        now = time.time()
+        with self._lock:
+            self._tokens = {token: exp for token, exp in self._tokens.items() if exp > now}
+            self._tokens[jti] = expires_at
+
+    def contains(self, jti):
+        with self._lock:
+            expires_at = self._tokens.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+
+class RedisBlocklistBackend:
+    """
+    Revoked tokens stored as Redis keys that expire at the token ``exp``.
+    """
+
+    def __init__(self, client, prefix="blocklist:"):
+        self.client = client
+        self.prefix = prefix
+
+    def add(self, jti, expires_at):
+        if expires_at <= time.time():
+            return
+        self.client.set(self.prefix + jti, 1, exat=int(expires_at) + 1)
+
+    def contains(self, jti):
+        return bool(self.client.exists(self.prefix + jti))
+
+
+class SQLBlocklistBackend:
+    """
+    Revoked tokens stored in the token_blocklist table, expired rows are
+    purged every time a new token is revoked.
+    """
+
+    def add(self, jti, expires_at):
+        from database import db
+        import models
+
+        now = datetime.now(timezone.utc)
+        models.TokenBlocklistModel.query.filter(models.TokenBlocklistModel.expires_at <= now).delete()
+        db.session.add(models.TokenBlocklistModel(
+            jti=jti,
+            expires_at=datetime.fromtimestamp(expires_at, timezone.utc)
+        ))
+        db.session.commit()
+
+    def contains(self, jti):
+        from database import db
+        import models
+
+        return db.session.query(
+            models.TokenBlocklistModel.query.filter(
+                models.TokenBlocklistModel.jti == jti,
+                models.TokenBlocklistModel.expires_at > datetime.now(timezone.utc)
+            ).exists()
+        ).scalar()
+
+
+class Blocklist:
+    """
+    Blocklist in front of a backend. Tokens recently found not revoked are
+    remembered for NEGATIVE_CACHE_TTL seconds so that the check done on every
+    authenticated request does not hit the backend each time.
+    """
+
+    def __init__(self, backend, negative_ttl=NEGATIVE_CACHE_TTL, negative_size=NEGATIVE_CACHE_SIZE):
+        self.backend = backend
+        self._not_revoked = TTLCache(negative_ttl, negative_size)
+
+    def add(self, jti, expires_at):
+        """
+        Revoke a token until it expires.
+
+        :param jti: Token unique identifier.
+        :param expires_at: Token ``exp`` claim as a unix timestamp.
+        """
+        self._not_revoked.invalidate(jti)
+        self.backend.add(jti, expires_at)
+
+    def __contains__(self, jti):
+        if self._not_revoked.get(jti):
+            return False
+
+        revoked = self.backend.contains(jti)
+        if not revoked:
+            self._not_revoked.set(jti, True)
+        return revoked
+
+
+def create_blocklist(backend_name=None):
+    """
+    Build the blocklist for the backend configured in the environment.
+
+    :param backend_name: Backend name, defaults to BLOCKLIST_BACKEND.
+    :return: A Blocklist instance.
+    """
+    backend_name = backend_name or os.getenv("BLOCKLIST_BACKEND", "memory")
+
+    match backend_name:
+        case "memory":
+            return Blocklist(MemoryBlocklistBackend())
+        case "redis":
+            import redis
+            client = redis.Redis.from_url(os.getenv("BLOCKLIST_REDIS_URL", "redis://localhost:6379/0"))
+            return Blocklist(RedisBlocklistBackend(client))
+        case "sql":
+            return Blocklist(SQLBlocklistBackend())
+
+    raise ValueError(f"Unknown blocklist backend: {backend_name}")
+
 
-BLOCKLIST = set()
\ No newline at end of file
+BLOCKLIST = create_blocklist()
@@ -0,0 +1,90 @@
+import time
+import models
+from blocklist import (
+    Blocklist,
+    MemoryBlocklistBackend,
+    RedisBlocklistBackend,
+    SQLBlocklistBackend
+)
+
+
+class FakeRedis:
+    """Local stand-in for the two Redis commands used by the blocklist."""
+
+    def __init__(self):
+        self.keys = {}
+        self.exists_calls = 0
+
+    def set(self, name, value, exat=None):
+        self.keys[name] = (value, exat)
+
+    def exists(self, name):
+        self.exists_calls += 1
+        entry = self.keys.get(name)
+        if entry is None:
+            return 0
+        if entry[1] is not None and entry[1] <= time.time():
+            del self.keys[name]
+            return 0
+        return 1
+
+# Test memory backend revokes a token until its expiration
+def test_memory_backend_expiry():
+    backend = MemoryBlocklistBackend()
+    backend.add("revoked", time.time() + 60)
+    backend.add("expired", time.time() - 1)
+    assert backend.contains("revoked")
+    assert not backend.contains("expired")
+    assert not backend.contains("unknown")
+
+# Test memory backend evicts expired tokens when a new token is revoked
+def test_memory_backend_evicts_expired():
+    backend = MemoryBlocklistBackend()
+    backend.add("old", time.time() - 1)
+    backend.add("new", time.time() + 60)
+    assert list(backend._tokens) == ["new"]
+
+# Test redis backend stores the token with its expiration
+def test_redis_backend_shared_between_workers():
+    client = FakeRedis()
+    worker_1 = Blocklist(RedisBlocklistBackend(client))
+    worker_2 = Blocklist(RedisBlocklistBackend(client), negative_ttl=0)
+
+    worker_1.add("jti-1", time.time() + 60)
+    assert "jti-1" in worker_2
+    assert client.keys["blocklist:jti-1"][1] > time.time()
+
+# Test redis backend does not store tokens that already expired
+def test_redis_backend_skips_expired():
+    client = FakeRedis()
+    RedisBlocklistBackend(client).add("jti-1", time.time() - 1)
+    assert client.keys == {}
+
+# Test sql backend revokes a token until its expiration
+def test_sql_backend(app):
+    with app.app_context():
+        backend = SQLBlocklistBackend()
+        backend.add("revoked", time.time() + 60)
+        backend.add("expired", time.time() - 1)
+        assert backend.contains("revoked")
+        assert not backend.contains("expired")
+
+        backend.add("other", time.time() + 60)
+        assert models.TokenBlocklistModel.query.count() == 2
+
+# Test negative cache avoids hitting the backend for tokens not revoked
+def test_negative_cache_hit():
+    client = FakeRedis()
+    blocklist = Blocklist(RedisBlocklistBackend(client), negative_ttl=60)
+
+    assert "jti-1" not in blocklist
+    assert "jti-1" not in blocklist
+    assert client.exists_calls == 1
+
+# Test revoking a token drops it from the negative cache of the same worker
+def test_negative_cache_invalidated_on_add():
+    blocklist = Blocklist(MemoryBlocklistBackend(), negative_ttl=60)
+
+    assert "jti-1" not in blocklist
+    blocklist.add("jti-1", time.time() + 60)
+    assert "jti-1" in blocklist
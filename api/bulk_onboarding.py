@@ -0,0 +1,187 @@
+"""
+This file contains the bulk registration of users, used to onboard a whole
+lab class at once from the admin endpoint or the ``flask register-users``
+command. A batch costs a fixed number of statements whatever its size:
+
+- One query with ``IN`` for the emails already registered and one for the
+  locations that exist.
+- The passwords of the valid rows are hashed on a pool of processes, see
+  hash_passwords.
+- One multi-row INSERT ... ON CONFLICT DO NOTHING and one commit. A user
+  registered by another request in the meantime is reported as existing
+  instead of failing the batch.
+
+Every row gets its own result, a bad row never stops the others.
+"""
+from database import db, insert_or_ignore
+from marshmallow import ValidationError
+from passwords import hash_passwords
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from bleach import clean
+import schemas
+import models
+import threading
+import click
+import json
+import csv
+import io
+import os
+
+# Rows accepted in one batch
+MAX_BULK_USERS = int(os.getenv("MAX_BULK_USERS", 1000))
+
+FIELDS = ("email", "password", "name", "surname", "location_id")
+
+CREATED = "created"
+EXISTS = "exists"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+# One batch at a time per worker, its hashes already use every core
+_batch_lock = threading.Lock()
+
+
+class BulkRegistrationBusy(Exception):
+    """
+    Raised when another batch is being registered by this worker.
+    """
+
+
+def parse_users(data, content_type):
+    """
+    Read the users of a batch from CSV with a header line or from JSON, as a
+    list of users or an object with a ``users`` list.
+
+    :param data: Body of the batch.
+    :param content_type: Content type of the body, CSV if it contains "csv".
+    :return: List with a dict per user.
+    :raises ValueError: If the body can not be read.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+
+    if "csv" in (content_type or ""):
+        reader = csv.DictReader(io.StringIO(data))
+        missing = set(FIELDS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Missing CSV columns: {', '.join(sorted(missing))}.")
+        return [{field: row[field] for field in FIELDS} for row in reader]
+
+    try:
+        users = json.loads(data)
+    except json.JSONDecodeError:
+        raise ValueError("The body is not valid JSON.")
+    if isinstance(users, dict):
+        users = users.get("users")
+    if not isinstance(users, list) or not all(isinstance(user, dict) for user in users):
+        raise ValueError("Expected a list of users.")
+    return users
+
+
+def register_users(users, processes=None):
+    """
+    Register a batch of users.
+
+    :param users: List with a dict per user, with the fields of the register endpoint.
+    :param processes: Processes hashing the passwords, defaults to HASH_PROCESSES.
+    :return: List with the result of every row, in the order of the batch.
+    :raises BulkRegistrationBusy: If this worker is registering another batch.
+    """
+    if not _batch_lock.acquire(blocking=False):
+        raise BulkRegistrationBusy()
+    try:
+        return _register_users(users, processes)
+    finally:
+        _batch_lock.release()
+
+
+def _register_users(users, processes):
+    schema = schemas.UserSchema(only=FIELDS)
+    results = [{"row": row, "email": user.get("email"), "status": None} for row, user in enumerate(users)]
+
+    valid = {}
+    for result, user in zip(results, users):
+        try:
+            data = schema.load(user)
+        except ValidationError as error:
+            result.update(status=INVALID, errors=error.messages)
+            continue
+
+        data = {**data, **{field: clean(data[field]) for field in ("email", "password", "name", "surname")}}
+        result["email"] = data["email"]
+        if data["email"] in valid:
+            result.update(status=DUPLICATE, message="Email repeated in the batch.")
+            continue
+        valid[data["email"]] = (result, data)
+
+    if valid:
+        emails = list(valid)
+        registered = set(db.session.scalars(select(models.UserModel.email).where(models.UserModel.email.in_(emails))))
+        locations = {data["location_id"] for _, data in valid.values()}
+        known_locations = set(db.session.scalars(select(models.LocationModel.id).where(models.LocationModel.id.in_(locations))))
+
+        for email in emails:
+            result, data = valid[email]
+            if email in registered:
+                result.update(status=EXISTS, message="User with that email already exists.")
+                del valid[email]
+            elif data["location_id"] not in known_locations:
+                result.update(status=INVALID, errors={"location_id": ["Unknown location."]})
+                del valid[email]
+
+    if valid:
+        rows = [data for _, data in valid.values()]
+        for row, password_hash in zip(rows, hash_passwords([row["password"] for row in rows], processes)):
+            row["password"] = password_hash
+
+        statement = insert_or_ignore(models.UserModel, ["email"]).values(rows).returning(models.UserModel.email)
+        created = set(db.session.scalars(statement))
+        db.session.commit()
+
+        for email, (result, _) in valid.items():
+            if email in created:
+                result["status"] = CREATED
+            else:
+                result.update(status=EXISTS, message="User with that email already exists.")
+
+    return results
+
+
+def summarize(results):
+    """
+    :param results: Results of register_users.
+    :return: Dict with the number of rows by status.
+    """
+    summary = {status: 0 for status in (CREATED, EXISTS, DUPLICATE, INVALID)}
+    for result in results:
+        summary[result["status"]] += 1
+    return summary
+
+
+@click.command("register-users")
+@click.argument("file", type=click.File("rb"))
+@click.option("--processes", type=int, help="Processes hashing the passwords.")
+@with_appcontext
+def register_users_command(file, processes):
+    """Register the users of a CSV or JSON file, in batches of MAX_BULK_USERS."""
+    content_type = "text/csv" if file.name.lower().endswith(".csv") else "application/json"
+    try:
+        users = parse_users(file.read(), content_type)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+    # Files larger than a batch are registered a batch at a time
+    results = []
+    for start in range(0, len(users), MAX_BULK_USERS):
+        for result in register_users(users[start:start + MAX_BULK_USERS], processes):
+            result["row"] += start
+            results.append(result)
+
+    for result in results:
+        if result["status"] != CREATED:
+            details = result.get("message") or json.dumps(result.get("errors"))
+            click.echo(f"Row {result['row']} ({result['email']}): {result['status']}, {details}")
+
+    summary = summarize(results)
+    click.echo(", ".join(f"{count} {status}" for status, count in summary.items()))
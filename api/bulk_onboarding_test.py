@@ -0,0 +1,140 @@
+import json
+import pytest
+from flask_jwt_extended import create_access_token
+from database import db
+import models
+import bulk_onboarding
+from bulk_onboarding import parse_users, register_users, register_users_command, summarize
+from passwords import pwd_context
+
+PASSWORD = "Passw0rd!"
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.add(models.UserModel(id=1, email="admin@example.com", password="x", name="Admin", surname="User",
+                                        location_id=1, role_id=3))
+        db.session.add(models.UserModel(id=2, email="student@example.com", password="x", name="Student",
+                                        surname="User", location_id=1))
+        db.session.commit()
+
+def token(app, user_id):
+    with app.app_context():
+        return create_access_token(identity=str(user_id))
+
+def user(email, **fields):
+    return {"email": email, "password": PASSWORD, "name": "Lab", "surname": "Student", "location_id": 1, **fields}
+
+# Test a batch creates the valid users and reports every other row
+def test_register_users_results(app):
+    batch = [
+        user("new1@example.com"),
+        user("student@example.com"),
+        user("new1@example.com"),
+        user("new2@example.com", password="weak"),
+        user("new3@example.com", location_id=99),
+        user("new4@example.com"),
+    ]
+    with app.app_context():
+        results = register_users(batch, processes=1)
+
+        assert [(result["row"], result["status"]) for result in results] == [
+            (0, "created"), (1, "exists"), (2, "duplicate"), (3, "invalid"), (4, "invalid"), (5, "created")
+        ]
+        assert "password" in results[3]["errors"]
+        assert results[4]["errors"] == {"location_id": ["Unknown location."]}
+        assert summarize(results) == {"created": 2, "exists": 1, "duplicate": 1, "invalid": 2}
+
+        created = models.UserModel.query.filter_by(email="new1@example.com").one()
+        assert created.role_id == 1
+        assert created.credits == 0
+        assert pwd_context.verify(PASSWORD, created.password)
+        assert models.UserModel.query.count() == 4
+
+# Test a batch runs one query per table and one insert whatever its size
+def test_register_users_statements(app):
+    from sqlalchemy import event
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0])
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            register_users([user(f"class{i}@example.com") for i in range(20)], processes=1)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        assert statements == ["SELECT", "SELECT", "INSERT"]
+        assert models.UserModel.query.count() == 22
+
+# Test the passwords hashed by the process pool verify
+def test_register_users_process_pool(app):
+    with app.app_context():
+        results = register_users([user(f"pool{i}@example.com") for i in range(4)], processes=2)
+        assert {result["status"] for result in results} == {"created"}
+        for stored in models.UserModel.query.filter(models.UserModel.email.like("pool%")):
+            assert pwd_context.verify(PASSWORD, stored.password)
+
+# Test CSV and JSON bodies are read into the same rows
+def test_parse_users():
+    csv_body = b"email,password,name,surname,location_id\r\na@example.com,Passw0rd!,Lab,Student,1\r\n"
+    assert parse_users(csv_body, "text/csv; charset=utf-8") == [user("a@example.com", location_id="1")]
+    assert parse_users(json.dumps({"users": [user("a@example.com")]}), "application/json") == [user("a@example.com")]
+
+    with pytest.raises(ValueError):
+        parse_users(b"email,password\r\na@example.com,x\r\n", "text/csv")
+    with pytest.raises(ValueError):
+        parse_users(b"{\"users\": 1}", "application/json")
+
+# Test the endpoint registers a CSV batch for an admin
+def test_bulk_register_endpoint(app, client):
+    body = "email,password,name,surname,location_id\nnew1@example.com,Passw0rd!,Lab,Student,1\nstudent@example.com,Passw0rd!,Lab,Student,1\n"
+    res = client.post("/api/user/bulk-register", data=body, content_type="text/csv",
+                      headers={"Authorization": f"Bearer {token(app, 1)}"})
+
+    assert res.status_code == 200
+    assert res.json["summary"] == {"created": 1, "exists": 1, "duplicate": 0, "invalid": 0}
+    assert [result["status"] for result in res.json["results"]] == ["created", "exists"]
+
+# Test only admins can register a batch
+def test_bulk_register_requires_admin(app, client):
+    res = client.post("/api/user/bulk-register", json=[user("new1@example.com")],
+                      headers={"Authorization": f"Bearer {token(app, 2)}"})
+    assert res.status_code == 403
+
+# Test the endpoint rejects unreadable and oversized batches
+def test_bulk_register_rejects_bodies(app, client, monkeypatch):
+    headers = {"Authorization": f"Bearer {token(app, 1)}"}
+
+    res = client.post("/api/user/bulk-register", data="not json", content_type="application/json", headers=headers)
+    assert res.status_code == 400
+
+    monkeypatch.setattr("controllers.user.MAX_BULK_USERS", 1)
+    res = client.post("/api/user/bulk-register", json=[user("new1@example.com"), user("new2@example.com")], headers=headers)
+    assert res.status_code == 413
+
+# Test a second batch of the same worker is turned away while the first one runs
+def test_bulk_register_busy(app, client):
+    bulk_onboarding._batch_lock.acquire()
+    try:
+        res = client.post("/api/user/bulk-register", json=[user("new1@example.com")],
+                          headers={"Authorization": f"Bearer {token(app, 1)}"})
+    finally:
+        bulk_onboarding._batch_lock.release()
+
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "5"
+
+# Test the command registers a file in batches and numbers the rows of the whole file
+def test_register_users_command(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_onboarding, "MAX_BULK_USERS", 2)
+    path = tmp_path / "class.json"
+    path.write_text(json.dumps([user("new1@example.com"), user("new2@example.com"), user("new1@example.com")]))
+
+    result = app.test_cli_runner().invoke(register_users_command, [str(path), "--processes", "1"])
+
+    assert result.exit_code == 0
+    assert "Row 2 (new1@example.com): exists" in result.output
+    assert "2 created, 1 exists, 0 duplicate, 0 invalid" in result.output
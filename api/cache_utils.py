@@ -0,0 +1,78 @@
+"""
+This file contains small in-process caching helpers. Every gunicorn worker
+keeps its own copy, so anything cached here must be safe to serve slightly
+stale until its TTL runs out.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Thread safe cache bounded in size whose entries expire after ``ttl`` seconds.
+    The least recently used entry is evicted when ``maxsize`` is reached.
+    """
+
+    def __init__(self, ttl, maxsize=16):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, key):
+        """
+        Return the entry stored for a key even if it has expired.
+
+        :param key: Cache key.
+        :return: A ``(value, is_fresh)`` tuple or None if the key is not cached.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            value, expires_at = entry
+            return value, time.monotonic() < expires_at
+
+    def get(self, key, default=None):
+        """
+        Return the value stored for a key if it has not expired yet.
+
+        :param key: Cache key.
+        :param default: Value returned when the key is missing or expired.
+        :return: The cached value or the default.
+        """
+        entry = self.peek(key)
+        if entry is None or not entry[1]:
+            return default
+        return entry[0]
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+
+        :param key: Cache key.
+        :param value: Value to cache.
+        """
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Drop one entry, or every entry when no key is given.
+
+        :param key: Cache key to drop.
+        """
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
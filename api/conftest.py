@@ -0,0 +1,61 @@
+import pytest
+from app import create_app
+from database import db
+from user_identity import users_cache
+from permissions import role_ids_cache
+import models
+
+# Settings of the app every test builds, on top of the ones read from the environment
+TEST_CONFIG = {
+    "API_TITLE": "test",
+    "API_VERSION": "v1",
+    "OPENAPI_VERSION": "3.0.2",
+    "SQLALCHEMY_DATABASE_URI": "sqlite://",
+    "JWT_SECRET_KEY": "test-secret-key-0123456789-0123456789",
+    "RATE_LIMIT_ENABLED": False,
+    "SCHEDULER_ENABLED": False,
+}
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """Every test builds its own database, so the ids cached by the previous one are forgotten."""
+    users_cache.invalidate()
+    role_ids_cache.invalidate()
+    yield
+    users_cache.invalidate()
+    role_ids_cache.invalidate()
+
+
+@pytest.fixture
+def app_config():
+    """Settings a test module needs on top of TEST_CONFIG."""
+    return {}
+
+
+@pytest.fixture
+def app(app_config):
+    """
+    The API app built by create_app on its own database, with the tables and
+    the reference rows: the roles in their seed order and the eastus location.
+    """
+    app = create_app({**TEST_CONFIG, **app_config})
+
+    with app.app_context():
+        db.create_all()
+        for role_id, name in enumerate(("registered", "staff", "admin"), start=1):
+            db.session.add(models.RoleModel(id=role_id, name=name))
+        db.session.add(models.LocationModel(id=1, name="eastus", display_name="(US) East US"))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
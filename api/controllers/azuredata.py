@@ -1,14 +1,98 @@
+from flask import Response, request
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from cache_utils import TTLCache
+import threading
+import hashlib
+import json
 import models
+import os
 
 blp = Blueprint("azuredata", __name__, description="Azure data endpoint", url_prefix="/api/azuredata")
-    
+
+# Every worker keeps its own copy, the TTL bounds how long the other workers
+# serve the old list after the locations change.
+LOCATIONS_CACHE_TTL = int(os.getenv("LOCATIONS_CACHE_TTL", 300))
+
+locations_cache = TTLCache(LOCATIONS_CACHE_TTL, maxsize=1)
+
+# Bumped by every invalidation, a list read before it is not cached after it
+_invalidations = 0
+_invalidations_lock = threading.Lock()
+
+
+def load_locations():
+    """
+    Serialize the locations once so every request can reuse the same body.
+
+    :return: Tuple with the JSON body and its strong ETag.
+    """
+    locations = models.LocationModel.query.order_by(models.LocationModel.id).all()
+    body = json.dumps({"locations": [location.to_dict() for location in locations]}, separators=(",", ":"))
+    return body, hashlib.sha256(body.encode()).hexdigest()[:32]
+
+
+def invalidate_locations():
+    """
+    Drop the cached list of this worker.
+    """
+    global _invalidations
+    with _invalidations_lock:
+        _invalidations += 1
+        locations_cache.invalidate()
+
+
+def mark_locations_changed(session):
+    """
+    Drop the cached list once the transaction of the session commits. Changes
+    made with the ORM are tracked already, INSERT and UPDATE statements must
+    call this.
+
+    :param session: Session making the change.
+    """
+    session.info["locations_changed"] = True
+
+
+@event.listens_for(models.LocationModel, "after_insert")
+@event.listens_for(models.LocationModel, "after_update")
+@event.listens_for(models.LocationModel, "after_delete")
+def track_location_change(mapper, connection, target):
+    mark_locations_changed(object_session(target))
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_locations(session):
+    if session.info.pop("locations_changed", False):
+        invalidate_locations()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_locations(session):
+    session.info.pop("locations_changed", None)
+
+
 @blp.route("/locations")
 class Locations(MethodView):
     def get(self):
-        try:
-            locations = models.LocationModel.query.all()
-            return {"locations": [location.to_dict() for location in locations]}
-        except Exception as e:
-            abort(500, message=str(e))
\ No newline at end of file
+        cached = locations_cache.get("locations")
+
+        if cached is None:
+            invalidations = _invalidations
+            try:
+                cached = load_locations()
+            except Exception as e:
+                abort(500, message=str(e))
+            with _invalidations_lock:
+                # A change committed while the list was read may not be in it
+                if invalidations == _invalidations:
+                    locations_cache.set("locations", cached)
+
+        body, etag = cached
+
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = f"public, max-age={LOCATIONS_CACHE_TTL}"
+
+        return response.make_conditional(request)
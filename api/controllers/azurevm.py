@@ -1,95 +1,51 @@
 from flask_jwt_extended import (
     jwt_required, 
-    get_jwt_identity
+    get_jwt_identity,
+    current_user
 )
-from mail_utils import EmailSender
-from datetime import datetime, timezone, timedelta
+from mail_utils import email_sender
+from datetime import datetime, timezone
 from sqlalchemy.exc import IntegrityError
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
+from flask import current_app, url_for, make_response, request
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from vm_provisioning import enqueue_setup
+from orchestrator import orchestrator, OrchestratorError, OrchestratorUnavailable
+from vm_costs import calc_vm_credits_costs, calc_vm_credits_costs_batch
+from sqlalchemy import select, tuple_
+from credit_sweeper import last_sweep, claim_poweroff, complete_poweroff, release_poweroff
+from credit_ledger import charge_vm_usage
+from permissions import admin_required
 import models
-import requests
 from database import db
 import schemas
+import json
 import os
 
-email_sender = EmailSender(os.getenv("EMAIL_API_KEY"))
-
 blp = Blueprint("azurevm", __name__, description="Azure virtual machines endpoint", url_prefix="/api/azurevm")
     
-def calc_vm_credits_costs(vm):
-    """
-    Function that calcs VM cost by the used time.
-
-    :param vm: VM instance
-    :return: the total of credits spent by the vm
-    """
-    # 1€ equals to 100 / 3.99 = 25.06 credits.
-
-    VM_EUROS_MINUTE = 0.001625
-    IP_EUROS_MINUTE = 0.00015625
-    DISK_EUROS_MINUTE = 0.00012592592 
-
-    VM_CREDITS_MINUTE = VM_EUROS_MINUTE * 25.06
-    IP_CREDITS_MINUTE = IP_EUROS_MINUTE * 25.06
-    DISK_CREDITS_MINUTE = DISK_EUROS_MINUTE * 25.06
-
-    TOTAL_CREDITS_MINUTE = VM_CREDITS_MINUTE + IP_CREDITS_MINUTE + DISK_CREDITS_MINUTE
-
-    if vm.powered_off_at is None:
-        powered_off_time = datetime.now(timezone(timedelta(hours=0)))
-    else:
-        powered_off_time = vm.powered_off_at
-
-    created_at_time = vm.created_at
-
-    if created_at_time.tzinfo is None:
-        created_at_time = created_at_time.replace(tzinfo=timezone(timedelta(hours=0)))
-
-
-    vm_total_minutes = (powered_off_time - created_at_time).total_seconds() / 60.0
-    return round((vm_total_minutes * TOTAL_CREDITS_MINUTE) + 1)
-
 @blp.route("/setup")
 class SetupVirtualMachine(MethodView):
 
     @jwt_required()
     def get(self):
-        user_by_jwt = get_jwt_identity()
-
-        user = db.session.get(models.UserModel, user_by_jwt)
-
-        if user is None:
-            abort(404, message="User not found")
-
-        if user.credits <= 0:
+        if current_user.credits <= 0:
             abort(401, message="Not enough credits.")
 
-        res = requests.get("http://biocloudlabs.es:4000/vm/setup")
-        json_res = res.json()
+        job = enqueue_setup(current_app._get_current_object(), current_user.id)
 
-        if "code" in json_res:
-            if json_res["code"] == 500:
-                abort(500, message="Error trying to create a VM, please try again.")
+        return job.to_dict(), 202, {"Location": url_for("azurevm.VmJob", job_id=job.id)}
 
-        dns = json_res["dns"]
-        ip = json_res["ip"]
 
-        try:
-            vm = models.VirtualMachineModel(
-                type="Standard_B2s",
-                name=dns,
-                user_id=user.id
-            )
-
-            db.session.add(vm)
-            db.session.commit()
+@blp.route("/jobs/<job_id>")
+class VmJob(MethodView):
 
-        except IntegrityError:
-            db.session.rollback()
-            abort(400, message=f"An integrity error has ocurred.")
+    @jwt_required()
+    def get(self, job_id):
+        job = models.VmJobModel.query.filter_by(id=job_id, user_id=get_jwt_identity()).one_or_404(description="Job not found")
 
-        return {"ip": ip, "dns": dns}, 200
+        return job.to_dict(), 200
 
 
 @blp.route("/poweroff")
@@ -98,29 +54,28 @@ class PowerOffMachine(MethodView):
     @jwt_required()
     @blp.arguments(schemas.VmSchema)
     def delete(self, payload):
-        user_by_jwt = get_jwt_identity()
-
-        user = db.session.get(models.UserModel, user_by_jwt)
-
-        if user is None:
-            abort(404, message="User not found")
+        user = current_user
 
-        vm = models.VirtualMachineModel.query.filter_by(id=payload["id"]).one_or_404(description="VM not found")
+        vm = models.VirtualMachineModel.query.filter_by(id=payload["id"], user_id=user.id).one_or_404(description="VM not found")
 
         vm_name = vm.name.split('.')[0]
 
-        res = requests.get(f"http://biocloudlabs.es:4000/vm/poweroff/{vm_name}")
-        json_res = res.json()
+        now = datetime.now(timezone.utc)
 
-        if "code" in json_res:
-            if json_res["code"] == 500:
-                abort(500, message="Error trying to power off a VM, please try again.")
+        if not claim_poweroff([vm.id], now):
+            return {"message": "VM Already Powered off"}, 200
 
-        vm_total_credits = calc_vm_credits_costs(vm)
+        try:
+            orchestrator.poweroff(vm_name)
+        except OrchestratorError as e:
+            release_poweroff([vm.id], now)
+            if isinstance(e, OrchestratorUnavailable):
+                abort(503, message=str(e))
+            abort(500, message="Error trying to power off a VM, please try again.")
 
         try:
-            vm.powered_off_at = datetime.now()
-            user.credits -= vm_total_credits
+            if complete_poweroff([vm.id], now):
+                charge_vm_usage(vm.id, user.id, calc_vm_credits_costs_batch([vm.created_at], [now], now)[0])
 
             db.session.commit()
         except IntegrityError:
@@ -142,49 +97,115 @@ class CheckCredits(MethodView):
         if vm.powered_off_at is not None:
             return {"message": "VM Already Powered off"}, 200
 
-        vm_actual_cost = calc_vm_credits_costs(vm)
+        now = datetime.now(timezone.utc)
+
+        vm_actual_cost = calc_vm_credits_costs(vm, now)
 
         credits_left = user_credits - vm_actual_cost
 
         if credits_left <= 0:
-            requests.get(f"http://biocloudlabs.es:4000/vm/poweroff/{vm_name.split('.')[0]}")
+            if not claim_poweroff([vm.id], now):
+                return {"message": "VM Already Powered off"}, 200
 
-            vm.powered_off_at = datetime.now()
-            user.credits = 0
-            db.session.commit()
+            try:
+                orchestrator.poweroff(vm_name.split('.')[0])
+            except OrchestratorError:
+                release_poweroff([vm.id], now)
+                abort(503, message="Error trying to power off a VM, please try again.")
 
-            username = user.name + " " + user.surname
+            if complete_poweroff([vm.id], now):
+                charge_vm_usage(vm.id, user.id, vm_actual_cost)
 
-            email_sender.poweroff_machine(vm_name, user.email, username)
+                username = user.name + " " + user.surname
+
+                email_sender.poweroff_machine(vm.id, vm_name, user.email, username)
+            db.session.commit()
 
             return {"message": "VM Powered off"}, 200
 
         return {"message": "VM Checked"}, 200
     
 
+@blp.route("/sweeper")
+class CreditSweeperStatus(MethodView):
+
+    @admin_required
+    def get(self):
+        """
+        API Endpoint to get the result of the last credit sweep of the worker
+        that answers, every worker sweeps on its own. The sweeps of every
+        worker are added up in the credit_sweep metrics of /api/internal/metrics.
+
+        :return: HTTP response with the sweep duration and counters.
+        """
+        return {"last_sweep": last_sweep or None}, 200
+
+
+def encode_cursor(created_at, vm_id):
+    """
+    Function that builds the opaque cursor pointing after a VM of the history.
+
+    :param created_at: created_at of the last VM of the page
+    :param vm_id: id of the last VM of the page
+    :return: the cursor string
+    """
+    return urlsafe_b64encode(json.dumps([created_at.isoformat(), vm_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    Function that reads a cursor built by encode_cursor.
+
+    :param cursor: the cursor string
+    :return: tuple with the created_at and the id of the VM
+    """
+    try:
+        created_at, vm_id = json.loads(urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(vm_id)
+    except (ValueError, TypeError):
+        abort(400, message="Invalid cursor.")
+
+
 @blp.route("/history")
 class VirtualMachinesHistory(MethodView):
 
     @jwt_required()
-    def get(self):
-        user_by_jwt = get_jwt_identity()
+    @blp.arguments(schemas.VmHistoryQuerySchema, location="query")
+    def get(self, args):
+        user_by_jwt = current_user.id
+
+        VM = models.VirtualMachineModel
+
+        query = select(VM.id, VM.name, VM.created_at, VM.powered_off_at).where(VM.user_id == user_by_jwt)
+
+        if args.get("running") is not None:
+            query = query.where(VM.powered_off_at.is_(None) if args["running"] else VM.powered_off_at.is_not(None))
+
+        if "created_from" in args:
+            query = query.where(VM.created_at >= args["created_from"])
 
-        user = db.session.get(models.UserModel, user_by_jwt)
+        if "created_to" in args:
+            query = query.where(VM.created_at < args["created_to"])
 
-        if user is None:
-            abort(404, message="User not found")
+        if "cursor" in args:
+            query = query.where(tuple_(VM.created_at, VM.id) < tuple_(*decode_cursor(args["cursor"])))
 
-        vms = models.VirtualMachineModel.query.filter_by(user_id=user_by_jwt).all()
+        # One extra row tells if there is a next page
+        vms = db.session.execute(
+            query.order_by(VM.created_at.desc(), VM.id.desc()).limit(args["limit"] + 1)
+        ).all()
 
-        vm_list = []
+        next_cursor = None
+        if len(vms) > args["limit"]:
+            vms = vms[:args["limit"]]
+            next_cursor = encode_cursor(vms[-1].created_at, vms[-1].id)
 
-        if not vms:
-            abort(404, message="No VMs found.") 
+        costs = calc_vm_credits_costs_batch([i.created_at for i in vms], [i.powered_off_at for i in vms])
 
+        vm_list = [{"id": i.id, "name": i.name, "created_at": i.created_at, "powered_off_at": i.powered_off_at, "cost": cost}
+                   for i, cost in zip(vms, costs)]
 
-        for i in vms:
-            vm_total_credits = calc_vm_credits_costs(i)
-            vm_list.append({"id": i.id, "name": i.name, "created_at": i.created_at, "powered_off_at": i.powered_off_at, "cost": vm_total_credits})
+        response = make_response({"vm_list": vm_list, "next_cursor": next_cursor}, 200)
+        response.add_etag()
+        response.headers["Cache-Control"] = "private, no-cache"
 
-        return {"vm_list": vm_list}, 200
-    
\ No newline at end of file
+        return response.make_conditional(request)
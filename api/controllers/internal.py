@@ -0,0 +1,49 @@
+from flask import request, Response
+from flask.views import MethodView
+from flask_smorest import Blueprint, abort
+from database import db, pool_stats
+from metrics import render_metrics
+import hmac
+import os
+
+blp = Blueprint("internal", __name__, description="Internal telemetry endpoint", url_prefix="/api/internal")
+
+# Scrapers send it as a bearer token, without it only local requests are allowed
+METRICS_TOKEN = os.getenv("INTERNAL_METRICS_TOKEN")
+
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+
+@blp.before_request
+def check_internal_access():
+    if METRICS_TOKEN:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return
+    elif request.remote_addr in LOCAL_ADDRESSES:
+        return
+
+    abort(404)
+
+
+@blp.route("/pool")
+class PoolStats(MethodView):
+    def get(self):
+        """
+        API Endpoint to get the database pool telemetry of the worker that answers.
+
+        :return: HTTP response with the pool occupation and the checkout wait histogram.
+        """
+        return pool_stats(db.engine), 200
+
+
+@blp.route("/metrics")
+class Metrics(MethodView):
+    def get(self):
+        """
+        API Endpoint to scrape the metrics of every worker.
+
+        :return: HTTP response with the metrics in the Prometheus text format.
+        """
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
@@ -0,0 +1,34 @@
+from flask.views import MethodView
+from flask_smorest import Blueprint, abort
+from permissions import admin_required
+from profiling import store
+
+blp = Blueprint("profiles", __name__, description="Request profiles endpoint", url_prefix="/api/profiles")
+
+
+@blp.route("/")
+class Profiles(MethodView):
+    @admin_required
+    def get(self):
+        """
+        API Endpoint to list the request profiles kept in the ring buffer.
+
+        :return: HTTP response with the summary of every profile, newest first.
+        """
+        return {"profiles": store.list()}, 200
+
+
+@blp.route("/<string:profile_id>")
+class Profile(MethodView):
+    @admin_required
+    def get(self, profile_id):
+        """
+        API Endpoint to get a request profile.
+
+        :param profile_id: Id of the profile, from the X-Profile-Id header or the list.
+        :return: HTTP response with the profile, its SQL statements and its slowest functions.
+        """
+        profile = store.get(profile_id)
+        if profile is None:
+            abort(404, message="Profile not found.")
+        return profile, 200
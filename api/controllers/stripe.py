@@ -1,17 +1,21 @@
 from flask.views import MethodView
-import stripe
 from flask_smorest import Blueprint, abort
 import os
 import models
 import schemas
 from database import db
-from flask import request
+from flask import request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from stripe_catalog import catalog
+from sdk_clients import stripe_sdk
+from metrics import track_outbound
+from outbound import limiter, DependencyBusy
+from stripe_events import store_event, schedule_event
+from permissions import admin_required
 
 blp = Blueprint("stripe", __name__, description="Stripe endpoint", url_prefix="/api/stripe")
 
 DOMAIN = os.getenv("DOMAIN_URL")
-stripe.api_key = os.getenv("STRIPE_KEY")
 ENDPOINT_SECRET = os.getenv("ENDPOINT_SECRET")
 
 def getProducts():
@@ -19,16 +23,8 @@ def getProducts():
     Function that retrieve all the products on stripe
     :return data: Return a json with all the stripe products
     """
-    data = {"products": []}
     try:
-        products = stripe.Product.list(limit=10)
-        for product in products["data"]:
-            price = stripe.Price.retrieve(product["default_price"])
-            data["products"].append({"name": product["name"],
-                                     "price_id": product["default_price"], 
-                                     "price": "{:.2f}".format(price["unit_amount"]/100) + " €",
-                                     "credits": int(product["name"].replace(' Credits', ''))})
-        return data
+        return {"products": catalog.get()["products"]}
     except Exception as e:
         return {"error": str(e)}, 503
 
@@ -37,6 +33,17 @@ class GetProducts(MethodView):
     def get(self):
         return getProducts()
 
+@blp.route("/products/stats")
+class ProductsCacheStats(MethodView):
+    @admin_required
+    def get(self):
+        """
+        API Endpoint to get the products cache counters.
+
+        :return: HTTP response with the hits, misses and cached/uncached latency.
+        """
+        return catalog.stats(), 200
+
 @blp.route("/create-checkout-session")
 class PaymentIntent(MethodView):
     @jwt_required()
@@ -45,14 +52,15 @@ class PaymentIntent(MethodView):
 
         user_id = get_jwt_identity() # Get the user id from the jwt
 
-        credits = 0
+        try:
+            PRODUCTS = catalog.get()
+        except Exception as e:
+            abort(503, message=str(e))
 
-        PRODUCTS = getProducts()
+        credits = PRODUCTS["credits_by_price_id"].get(payload['price_id'])
 
-        for product in PRODUCTS["products"]:
-            price = "{:.2f} €".format(float(payload['price']))
-            if product["price"] == price:
-                credits += int(product["credits"])
+        if credits is None:
+            abort(400, message="Unknown price.")
 
         try:
             invoice = models.InvoiceModel(
@@ -68,20 +76,24 @@ class PaymentIntent(MethodView):
             
             invoice_id = invoice.id
 
-            checkout_session = stripe.checkout.Session.create(
-                metadata={"invoice_id": invoice_id, "user_id": user_id, "credits": credits},
-                line_items=[
-                    {
-                        'price': payload['price_id'],
-                        'quantity': 1,
-                    },
-                ],
-                mode='payment',
-                success_url=DOMAIN + '/success',
-                cancel_url=DOMAIN + '/cancelled',
-                automatic_tax={'enabled': True},
-            )
-
+            with track_outbound("stripe", "checkout_session_create"), limiter.slot("stripe"):
+                checkout_session = stripe_sdk().checkout.Session.create(
+                    metadata={"invoice_id": invoice_id, "user_id": user_id, "credits": credits},
+                    line_items=[
+                        {
+                            'price': payload['price_id'],
+                            'quantity': 1,
+                        },
+                    ],
+                    mode='payment',
+                    success_url=DOMAIN + '/success',
+                    cancel_url=DOMAIN + '/cancelled',
+                    automatic_tax={'enabled': True},
+                )
+
+        except DependencyBusy as e:
+            db.session.rollback()
+            abort(503, message=str(e), headers={"Retry-After": "5"})
         except Exception as e:
             db.session.rollback()
             abort(500, message=str(e))
@@ -91,35 +103,24 @@ class PaymentIntent(MethodView):
 @blp.route("/webhook")
 class StripeWebhook(MethodView):
     def post(self):
-        event = None
+        """
+        Verify and store a Stripe event, it is applied in the background.
+        Events already received are acknowledged without storing them again.
+        """
+        stripe = stripe_sdk()
         payload = request.data
-        sig_header = request.headers['STRIPE_SIGNATURE']
+        sig_header = request.headers.get('STRIPE_SIGNATURE')
 
         try:
             event = stripe.Webhook.construct_event(
                 payload, sig_header, ENDPOINT_SECRET
             )
-        except ValueError as e:
-            # Invalid payload
-            raise e
-        except stripe.error.SignatureVerificationError as e:
-            # Invalid signature
-            raise e
-
-        # Handle the event
-        metadata = event['data']['object']['metadata']
-        match event['type']:
-            case 'checkout.session.completed':
-                user = db.session.get(models.UserModel, metadata['user_id'])
-                user.credits += int(metadata["credits"])
-
-                invoice = db.session.get(models.InvoiceModel, metadata['invoice_id'])
-                invoice.status = "completed"
-                db.session.commit()
-            case 'checkout.session.expired':
-                invoice = db.session.get(models.InvoiceModel, metadata['invoice_id'])
-                invoice.status = "expired"
-                db.session.commit()
+        except ValueError:
+            abort(400, message="Invalid payload.")
+        except stripe.error.SignatureVerificationError:
+            abort(400, message="Invalid signature.")
+
+        if store_event(event['id'], event['type'], payload.decode("utf-8")):
+            schedule_event(current_app._get_current_object(), event['id'])
 
         return {"success": True}, 200
-    
\ No newline at end of file
@@ -2,23 +2,30 @@ from flask_jwt_extended import (
     create_access_token, 
     jwt_required, 
     get_jwt_identity, 
-    get_jwt
+    get_jwt,
+    current_user
 )
 from flask_smorest import Blueprint, abort
+from flask import request, Response, stream_with_context
 from sqlalchemy.exc import IntegrityError
-from passlib.hash import pbkdf2_sha256
+from passwords import hash_password, verify_password
+from rate_limit import RATE_LIMITER, HASH_ADMISSION
 from flask.views import MethodView
-from mail_utils import EmailSender
+from mail_utils import email_sender
 from blocklist import BLOCKLIST
+from user_events import bus, stream_events, issue_ticket, redeem_ticket, USER_EVENTS_MAX_AGE, USER_EVENTS_TICKET_TTL
+from user_identity import load_user
+from cooperative import cooperative
+from bulk_onboarding import parse_users, register_users, summarize, BulkRegistrationBusy, MAX_BULK_USERS
+from permissions import admin_required
 from datetime import timedelta
 from bleach import clean
 from database import db
 import schemas
 import models
+import time
 import os
 
-email_sender = EmailSender(os.getenv("EMAIL_API_KEY"))
-
 blp = Blueprint("users", __name__, description="Users endpoint", url_prefix="/api/user")
 
 @blp.route("/login")
@@ -32,9 +39,22 @@ class UserLogin(MethodView):
         :return: HTTP response with the login result. If login it's correct, return an access_token.
         """
 
+        RATE_LIMITER.enforce("login", ip=request.remote_addr, email=data["email"])
+
         user = models.UserModel.query.filter(models.UserModel.email == clean(data["email"])).first()
 
-        if user and pbkdf2_sha256.verify(clean(data["password"]), user.password):
+        if user:
+            with HASH_ADMISSION.slot():
+                verified, new_hash = verify_password(clean(data["password"]), user.password)
+        else:
+            verified, new_hash = False, None
+
+        if verified:
+            # The stored hash was made with an older scheme or cost
+            if new_hash:
+                user.password = new_hash
+                db.session.commit()
+
             access_token = create_access_token(identity=user.id, expires_delta=timedelta(hours=6))
             return {"access_token": access_token}, 200
 
@@ -61,8 +81,8 @@ class UserLogout(MethodView):
 
         :return: HTTP response with the logout result.
         """
-        jti = get_jwt()["jti"]
-        BLOCKLIST.add(jti)
+        jwt_payload = get_jwt()
+        BLOCKLIST.add(jwt_payload["jti"], jwt_payload["exp"])
         return {"message": "Successfully logged out"}, 200
 
 @blp.route("/register")
@@ -76,14 +96,18 @@ class UserRegister(MethodView):
         :param payload: User data from the json to register.
         :return: HTTP response with the registration result.
         """
-        
+        RATE_LIMITER.enforce("register", ip=request.remote_addr)
+
         if models.UserModel.query.filter(models.UserModel.email == payload["email"]).first():
             abort(409, message="User with that email already exists.")
 
+        with HASH_ADMISSION.slot():
+            password_hash = hash_password(clean(payload["password"]))
+
         try:
             user = models.UserModel(
                 email=clean(payload["email"]),
-                password=pbkdf2_sha256.hash(clean(payload["password"])),
+                password=password_hash,
                 name=clean(payload["name"]),
                 surname=clean(payload["surname"]),
                 location_id=payload["location_id"]
@@ -98,6 +122,32 @@ class UserRegister(MethodView):
 
         return {"message": "User created successfully."}, 201
 
+@blp.route("/bulk-register")
+class UserBulkRegister(MethodView):
+    @admin_required
+    def post(self):
+        """
+        API Endpoint to register a batch of users, such as a lab class. The
+        body is CSV with a header line (Content-Type: text/csv) or JSON with
+        a list of users, each one with the fields of /register.
+
+        :return: HTTP response with the number of rows by status and the result of every row.
+        """
+        try:
+            users = parse_users(request.get_data(), request.content_type)
+        except ValueError as error:
+            abort(400, message=str(error))
+
+        if len(users) > MAX_BULK_USERS:
+            abort(413, message=f"A batch can have up to {MAX_BULK_USERS} users.")
+
+        try:
+            results = register_users(users)
+        except BulkRegistrationBusy:
+            abort(429, message="Another batch is being registered, please try again.", headers={"Retry-After": "5"})
+
+        return {"summary": summarize(results), "results": results}, 200
+
 @blp.route("/profile")
 class UserProfile(MethodView):
     @jwt_required()
@@ -108,12 +158,7 @@ class UserProfile(MethodView):
         :return: HTTP response with the user profile.
         """
 
-        user_by_jwt = get_jwt_identity()
-
-        user = db.session.get(models.UserModel, user_by_jwt)
-
-        if user is None:
-            abort(404, message="User not found")
+        user = current_user
 
         return {"email": user.email, "name": user.name, "surname": user.surname, 
                     "location_id": user.location_id, "credits": user.credits}, 200
@@ -128,16 +173,14 @@ class UserProfile(MethodView):
         :param payload: User data from the json to register.
         :return: HTTP response with the registration result.
         """
-        user_by_jwt = get_jwt_identity()
-
-        user = db.session.get(models.UserModel, user_by_jwt)
+        user = db.session.get(models.UserModel, current_user.id)
 
         if user is None:
             abort(404, message="User not found")
 
         try:
-            user.name=clean(payload["name"]),
-            user.surname=clean(payload["surname"]),
+            user.name=clean(payload["name"])
+            user.surname=clean(payload["surname"])
             user.location_id=payload["location_id"]
 
             db.session.commit()
@@ -158,14 +201,61 @@ class UserCredits(MethodView):
         :return: HTTP response with the user credits.
         """
 
-        user_id = get_jwt_identity() # Get the user id from the jwt
+        return {"credits": current_user.credits}, 200
+    
+def check_streaming():
+    # A sync worker would be held by the stream for its whole life
+    if not cooperative():
+        abort(503, message="Live updates are not available, poll instead.")
 
-        user = db.session.get(models.UserModel, user_id)
+@blp.route("/events/ticket")
+class UserEventsTicket(MethodView):
+    @jwt_required()
+    def post(self):
+        """
+        API Endpoint to get a ticket that opens the events stream once.
+
+        :return: HTTP response with the ticket and the seconds it is valid.
+        """
+        check_streaming()
+
+        return {"ticket": issue_ticket(current_user.id, get_jwt()["exp"]), "expires_in": USER_EVENTS_TICKET_TTL}, 200
+
+@blp.route("/events")
+class UserEvents(MethodView):
+    def get(self):
+        """
+        API Endpoint to stream the credits, VM and cost events of an user.
+        EventSource can not send headers, the stream is opened with a ticket
+        from /events/ticket passed as ?ticket=.
+
+        :return: Server-Sent Events stream, closed when the access token of the ticket expires.
+        """
+        check_streaming()
 
+        ticket = redeem_ticket(request.args.get("ticket", ""))
+        if ticket is None:
+            abort(401, message="Invalid or expired stream ticket.")
+
+        user = load_user(ticket["sub"])
         if user is None:
             abort(404, message="User not found")
-        
-        return {"credits": user.credits}, 200
+
+        subscription = bus.subscribe(user.id)
+
+        if subscription is None:
+            abort(503, message="Too many event streams, try again later.", headers={"Retry-After": "5"})
+
+        max_age = min(USER_EVENTS_MAX_AGE, max(0, ticket["exp"] - time.time()))
+
+        # The stream reads through its own short sessions
+        db.session.close()
+
+        return Response(
+            stream_with_context(stream_events(subscription, user.credits, max_age)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
     
 @blp.route("/change-password")
 class UserPassword(MethodView):
@@ -179,21 +269,26 @@ class UserPassword(MethodView):
         :param payload: User data from the json to register.
         :return: HTTP response with the registration result.
         """
-        user_by_jwt = get_jwt_identity()
+        RATE_LIMITER.enforce("change-password", ip=request.remote_addr, user=current_user.id)
 
-        user = db.session.get(models.UserModel, user_by_jwt)
+        # The password hash is not part of current_user
+        user = db.session.get(models.UserModel, current_user.id)
 
         if user is None:
             abort(404, message="User not found")
 
-        if not pbkdf2_sha256.verify(clean(payload["old_password"]), user.password):
-            abort(401, message="Invalid credentials.")
+        with HASH_ADMISSION.slot():
+            if not verify_password(clean(payload["old_password"]), user.password)[0]:
+                abort(401, message="Invalid credentials.")
+
+            # The old password is verified, so comparing the inputs saves a second hash
+            if clean(payload["new_password"]) == clean(payload["old_password"]):
+                abort(409, message="New password is the same as the old one.")
 
-        if pbkdf2_sha256.verify(clean(payload["new_password"]), user.password):
-            abort(409, message="New password is the same as the old one.")
+            password_hash = hash_password(clean(payload["new_password"]))
 
         try:
-            user.password=pbkdf2_sha256.hash(clean(payload["new_password"]))
+            user.password=password_hash
 
             db.session.commit()
 
@@ -215,13 +310,17 @@ class UserRecoverPasswordEmail(MethodView):
         :return: HTTP response with the result.
         """
 
+        RATE_LIMITER.enforce("recover-password-email", ip=request.remote_addr, email=payload["email"])
+
         user = models.UserModel.query.filter_by(email=payload["email"]).one_or_404("User not found")
         
         email_token = create_access_token(identity=user.id, expires_delta=timedelta(minutes=15)) 
 
         try:
             email_sender.recover_password(f"{os.getenv('DOMAIN_URL')}/recoverpassword?token={email_token}", user.email, f"{user.name} {user.surname}")
+            db.session.commit()
         except Exception as e:
+            db.session.rollback()
             return {"message": f"An error has ocurred while sending the email. {str(e)}"}, 500
 
         return {"message": f"Email has sent to the email {user.email}", "email": user.email}, 201
@@ -246,11 +345,14 @@ class UserRecoverPassword(MethodView):
         if user is None:
             abort(404, message="User not found")
 
-        if pbkdf2_sha256.verify(clean(payload["password"]), user.password):
-            abort(409, message="New password is the same as the old one.")
+        with HASH_ADMISSION.slot():
+            if verify_password(clean(payload["password"]), user.password)[0]:
+                abort(409, message="New password is the same as the old one.")
+
+            password_hash = hash_password(clean(payload["password"]))
 
         try:
-            user.password=pbkdf2_sha256.hash(clean(payload["password"]))
+            user.password=password_hash
 
             db.session.commit()
 
@@ -0,0 +1,46 @@
+"""
+This file contains the support of the cooperative worker mode. With
+GUNICORN_WORKER_CLASS=gevent a worker serves its requests as greenlets of a
+single thread, and the blocking calls of the standard library (sockets,
+sleep, locks, threads) are patched to switch to another greenlet while they
+wait. The orchestrator, Stripe and Resend clients all go through requests,
+so a slow outbound call only holds its own greenlet.
+
+Two kinds of work do not go through patched code:
+
+- psycopg2 waits on its socket in C. gunicorn.conf.py installs the wait
+  callback of psycogreen in every gevent worker so a query yields too.
+- CPU bound work never yields. run_blocking moves it to the thread pool of
+  the gevent hub so it does not stall the other greenlets of the worker.
+
+A lock created before gevent patches the standard library would block the
+whole worker. gunicorn.conf.py patches the master when
+GUNICORN_WORKER_CLASS=gevent, before it preloads the app.
+"""
+
+
+def cooperative():
+    """
+    :return: True if the standard library has been patched by gevent.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+def run_blocking(func, *args):
+    """
+    Run a call that holds the CPU without yielding. In the cooperative mode
+    it runs on a thread of the gevent hub, otherwise it runs in place.
+
+    :param func: Function to call.
+    :param args: Positional arguments of the call.
+    :return: The result of the call.
+    """
+    if not cooperative():
+        return func(*args)
+
+    import gevent
+    return gevent.get_hub().threadpool.apply(func, args)
@@ -0,0 +1,106 @@
+import subprocess
+import json
+import sys
+import os
+import pytest
+from cooperative import cooperative, run_blocking
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Calls of every client against a local server that answers after DELAY
+# seconds, run from CALLS greenlets at once in a process patched by gevent.
+GREEN_CLIENTS = """
+from gevent import monkey
+monkey.patch_all()
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import gevent
+import threading
+import json
+import time
+import sys
+
+DELAY, CALLS = 0.5, 5
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def answer(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        time.sleep(DELAY)
+        if self.path.startswith("/v1/products"):
+            body = {"object": "list", "data": [], "has_more": False, "url": "/v1/products"}
+        elif self.path.startswith("/emails/batch"):
+            body = {"data": []}
+        else:
+            body = {"dns": "vm.example.com", "ip": "10.0.0.1"}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = answer
+
+    def log_message(self, *args):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = f"http://127.0.0.1:{server.server_port}"
+
+import requests
+import stripe
+import resend
+from orchestrator import OrchestratorClient
+from cooperative import cooperative, run_blocking
+
+stripe.api_key = "sk_test_x"
+stripe.api_base = url
+resend.api_key = "re_x"
+resend.api_url = url
+orchestrator = OrchestratorClient(base_url=url)
+
+clients = {
+    "requests": lambda: requests.get(url + "/ping", timeout=10),
+    "stripe": lambda: stripe.Product.list(limit=1),
+    "resend": lambda: resend.Batch.send([{"from": "a@example.com", "to": "b@example.com", "subject": "s", "html": "h"}]),
+    "orchestrator": lambda: orchestrator.setup(),
+}
+
+elapsed = {"cooperative": cooperative()}
+for name, call in clients.items():
+    start = time.perf_counter()
+    gevent.joinall([gevent.spawn(call) for _ in range(CALLS)], raise_error=True)
+    elapsed[name] = time.perf_counter() - start
+
+# A greenlet keeps running while another one holds the CPU in run_blocking
+ticks = []
+ticker = gevent.spawn(lambda: [ticks.append(gevent.sleep(0.01)) for _ in range(1000)])
+gevent.sleep(0)
+run_blocking(lambda: sum(i * i for i in range(3_000_000)))
+ticker.kill()
+elapsed["ticks"] = len(ticks)
+
+print(json.dumps(elapsed))
+"""
+
+# Test a call runs in place when gevent has not patched the process
+def test_run_blocking_in_place():
+    assert not cooperative()
+    assert run_blocking(lambda a, b: a + b, 1, 2) == 3
+
+# Test the requests, Stripe, Resend and orchestrator clients yield while waiting on the network
+def test_clients_yield_under_gevent():
+    pytest.importorskip("gevent")
+
+    result = subprocess.run([sys.executable, "-c", GREEN_CLIENTS], cwd=API_DIR, capture_output=True,
+                            text=True, timeout=60, check=True)
+    elapsed = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert elapsed.pop("cooperative")
+    assert elapsed.pop("ticks") > 1
+
+    # Five calls of DELAY seconds run concurrently, not one after another
+    for name, seconds in elapsed.items():
+        assert seconds < 5 * 0.5 * 0.6, f"{name} took {seconds:.2f}s"
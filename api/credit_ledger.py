@@ -0,0 +1,66 @@
+"""
+This file contains the credit ledger. Every change of a user balance is a
+single ``UPDATE users SET credits = credits + :delta RETURNING credits``, so
+concurrent changes from any worker add up instead of overwriting each other,
+and it is recorded in the append-only credit_transactions table together
+with the balance it left.
+
+The changes join the transaction of the caller, who commits them. Callers
+must not hold that transaction open across a remote call, since the UPDATE
+locks the user row until the commit.
+"""
+from sqlalchemy import update
+from database import db
+from user_identity import mark_user_changed
+from user_events import publish_after_commit
+import models
+
+PURCHASE = "purchase"
+VM_USAGE = "vm_usage"
+OPENING_BALANCE = "opening_balance"
+
+
+def apply_credits(user_id, delta, reason, reference=None):
+    """
+    Add ``delta`` credits to a user, negative for a debit.
+
+    :param user_id: User whose balance changes.
+    :param delta: Credits to add.
+    :param reason: Kind of transaction.
+    :param reference: Id of what caused it, such as the invoice or the VM.
+    :return: The balance after the change, None if the user does not exist.
+    """
+    balance = db.session.execute(
+        update(models.UserModel)
+        .where(models.UserModel.id == user_id)
+        .values(credits=models.UserModel.credits + delta)
+        .returning(models.UserModel.credits)
+    ).scalar_one_or_none()
+
+    if balance is None:
+        return None
+
+    mark_user_changed(db.session, user_id)
+    publish_after_commit(db.session, user_id, "credits", {"credits": balance})
+    db.session.add(models.CreditTransactionModel(
+        user_id=user_id,
+        delta=delta,
+        balance_after=balance,
+        reason=reason,
+        reference=None if reference is None else str(reference)
+    ))
+
+    return balance
+
+
+def charge_vm_usage(vm_id, user_id, cost):
+    """
+    Debit the cost of a VM from its owner once it has been powered off.
+
+    :param vm_id: VM that was used.
+    :param user_id: Owner of the VM.
+    :param cost: Credits spent by the VM.
+    :return: The balance after the debit.
+    """
+    publish_after_commit(db.session, user_id, "vm", {"id": vm_id, "state": "powered_off", "cost": cost}, key=vm_id)
+    return apply_credits(user_id, -cost, VM_USAGE, vm_id)
@@ -0,0 +1,130 @@
+import os
+import random
+import pytest
+import threading
+from database import db
+import models
+from credit_ledger import apply_credits, charge_vm_usage, PURCHASE, VM_USAGE
+
+THREADS = 8
+OPERATIONS = 25
+
+@pytest.fixture
+def app_config(tmp_path):
+    # A file database, so every thread has its own connection like the workers do
+    uri = os.getenv("CREDIT_LEDGER_TEST_DATABASE_URI", f"sqlite:///{tmp_path}/ledger.db")
+    return {
+        "SQLALCHEMY_DATABASE_URI": uri,
+        "SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30}} if uri.startswith("sqlite") else {},
+    }
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.add(models.UserModel(id=1, email="user1@example.com", password="x", name="Test", surname="User",
+                                        location_id=1, credits=100))
+        db.session.commit()
+
+def ledger(app):
+    with app.app_context():
+        return models.CreditTransactionModel.query.order_by(models.CreditTransactionModel.id).all()
+
+def balance(app):
+    with app.app_context():
+        return db.session.get(models.UserModel, 1).credits
+
+# Test a change updates the balance and appends it to the ledger
+def test_apply_credits(app):
+    with app.app_context():
+        assert apply_credits(1, 50, PURCHASE, "invoice-1") == 150
+        assert charge_vm_usage(7, 1, 30) == 120
+        db.session.commit()
+
+    assert balance(app) == 120
+    assert [(t.delta, t.balance_after, t.reason, t.reference) for t in ledger(app)] == [
+        (50, 150, PURCHASE, "invoice-1"),
+        (-30, 120, VM_USAGE, "7"),
+    ]
+
+# Test a change for a missing user does nothing
+def test_apply_credits_missing_user(app):
+    with app.app_context():
+        assert apply_credits(99, 50, PURCHASE) is None
+        db.session.commit()
+    assert ledger(app) == []
+
+# Test a rolled back change leaves no trace
+def test_apply_credits_rollback(app):
+    with app.app_context():
+        apply_credits(1, -30, VM_USAGE, 1)
+        db.session.rollback()
+    assert balance(app) == 100
+    assert ledger(app) == []
+
+# Test concurrent debits and credits from many threads are never lost
+def test_concurrent_changes(app):
+    deltas = [[random.choice([-7, -3, 5, 11]) for _ in range(OPERATIONS)] for _ in range(THREADS)]
+    barrier = threading.Barrier(THREADS)
+    errors = []
+
+    def worker(worker_deltas):
+        try:
+            barrier.wait()
+            for delta in worker_deltas:
+                with app.app_context():
+                    apply_credits(1, delta, PURCHASE if delta > 0 else VM_USAGE)
+                    db.session.commit()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(worker_deltas,)) for worker_deltas in deltas]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+    expected = 100 + sum(sum(worker_deltas) for worker_deltas in deltas)
+    assert balance(app) == expected
+
+    transactions = ledger(app)
+    assert len(transactions) == THREADS * OPERATIONS
+    assert 100 + sum(t.delta for t in transactions) == expected
+    # The user row is locked from the UPDATE to the commit, so in id order
+    # every change starts from the balance left by the one before it
+    previous = 100
+    for t in transactions:
+        assert t.balance_after - t.delta == previous
+        previous = t.balance_after
+
+# Test a VM powered off by several callers at once is claimed, and charged, once
+def test_concurrent_poweroff_claim(app):
+    from datetime import datetime, timezone
+    from credit_sweeper import claim_poweroff
+
+    with app.app_context():
+        vm = models.VirtualMachineModel(name="vm1", user_id=1)
+        db.session.add(vm)
+        db.session.commit()
+        vm_id = vm.id
+
+    barrier = threading.Barrier(THREADS)
+    claims = []
+
+    def worker():
+        barrier.wait()
+        with app.app_context():
+            if claim_poweroff([vm_id], datetime.now(timezone.utc)):
+                charge_vm_usage(vm_id, 1, 30)
+                db.session.commit()
+                claims.append(vm_id)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert claims == [vm_id]
+    assert balance(app) == 70
@@ -0,0 +1,269 @@
+"""
+This file contains the credit sweeper. Every CREDIT_SWEEP_SECONDS it loads all
+running VMs with their owners in a single query, adds up what each user is
+spending and powers off every VM of the users who ran out of credits.
+
+It also holds the poweroff claim shared with the endpoints: a VM is marked
+powering off with a conditional UPDATE before the orchestrator is called, so
+only one caller powers it off. The VM is recorded off in the same transaction
+that charges its usage, and a claim left by a worker that went away during
+the orchestrator call is retried by resume_stale_poweroffs.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from collections import defaultdict
+from orchestrator import orchestrator, OrchestratorError
+from scheduler import periodic_job
+from vm_costs import calc_vm_credits_costs_batch
+from credit_ledger import charge_vm_usage
+from mail_utils import email_sender
+from metrics import CREDIT_SWEEP_DURATION, CREDIT_SWEEP_VMS
+from sqlalchemy import select, update
+from database import db
+import models
+import time
+import os
+
+SWEEP_SECONDS = int(os.getenv("CREDIT_SWEEP_SECONDS", 60))
+POWEROFF_CONCURRENCY = int(os.getenv("CREDIT_SWEEP_POWEROFF_CONCURRENCY", 8))
+POWEROFF_RESUME_SECONDS = int(os.getenv("POWEROFF_RESUME_SECONDS", 300))
+# Past every timeout and retry of the orchestrator poweroff
+POWEROFF_STALE_AFTER = timedelta(seconds=int(os.getenv("POWEROFF_STALE_AFTER", 900)))
+
+last_sweep = {}
+
+
+def find_overdrawn_vms(now):
+    """
+    Running VMs whose owner has no credits left once every running VM of the
+    owner is paid for.
+
+    :param now: Time used to price the running VMs.
+    :return: Tuple with the overdrawn rows (VM and owner columns) and the number of running VMs.
+    """
+    rows = db.session.execute(
+        select(
+            models.VirtualMachineModel.id,
+            models.VirtualMachineModel.name,
+            models.VirtualMachineModel.created_at,
+            models.VirtualMachineModel.powered_off_at,
+            models.VirtualMachineModel.user_id,
+            models.UserModel.credits,
+            models.UserModel.email,
+            models.UserModel.name.label("user_name"),
+            models.UserModel.surname
+        )
+        .join(models.UserModel, models.UserModel.id == models.VirtualMachineModel.user_id)
+        .where(models.VirtualMachineModel.powered_off_at.is_(None))
+    ).all()
+
+    costs = calc_vm_credits_costs_batch([row.created_at for row in rows], [row.powered_off_at for row in rows], now)
+
+    spent_by_user = defaultdict(int)
+    for row, cost in zip(rows, costs):
+        spent_by_user[row.user_id] += cost
+
+    return [row for row in rows if row.credits - spent_by_user[row.user_id] <= 0], len(rows)
+
+
+def claim_poweroff(vm_ids, now):
+    """
+    Mark running VMs as powering off, skipping the ones another caller
+    already claimed. The claim is committed straight away so no row stays
+    locked during the orchestrator call, and the VM keeps running until
+    complete_poweroff records it off.
+
+    :param vm_ids: VMs to claim.
+    :param now: Claim time stored on the VMs.
+    :return: Set with the ids of the VMs claimed by this caller.
+    """
+    if not vm_ids:
+        return set()
+
+    claimed_ids = set(db.session.execute(
+        update(models.VirtualMachineModel)
+        .where(
+            models.VirtualMachineModel.id.in_(list(vm_ids)),
+            models.VirtualMachineModel.powered_off_at.is_(None),
+            models.VirtualMachineModel.poweroff_claimed_at.is_(None)
+        )
+        .values(poweroff_claimed_at=now)
+        .returning(models.VirtualMachineModel.id)
+    ).scalars().all())
+    db.session.commit()
+
+    return claimed_ids
+
+
+def complete_poweroff(vm_ids, now):
+    """
+    Mark claimed VMs as powered off once the orchestrator powered them off.
+    Not committed, the caller commits it with the usage charge so a VM is
+    never recorded off without being charged.
+
+    :param vm_ids: VMs powered off.
+    :param now: Poweroff time stored on the VMs.
+    :return: Set with the ids of the VMs recorded off by this caller.
+    """
+    if not vm_ids:
+        return set()
+
+    return set(db.session.execute(
+        update(models.VirtualMachineModel)
+        .where(
+            models.VirtualMachineModel.id.in_(list(vm_ids)),
+            models.VirtualMachineModel.powered_off_at.is_(None)
+        )
+        .values(powered_off_at=now, poweroff_claimed_at=None)
+        .returning(models.VirtualMachineModel.id)
+    ).scalars().all())
+
+
+def release_poweroff(vm_ids, claimed_at):
+    """
+    Mark claimed VMs as running again after their poweroff failed. Only the
+    claims made at ``claimed_at`` are released, not a newer claim of the
+    stale poweroff job.
+
+    :param vm_ids: VMs to release.
+    :param claimed_at: Claim time passed to claim_poweroff.
+    """
+    db.session.execute(
+        update(models.VirtualMachineModel)
+        .where(
+            models.VirtualMachineModel.id.in_(list(vm_ids)),
+            models.VirtualMachineModel.powered_off_at.is_(None),
+            models.VirtualMachineModel.poweroff_claimed_at == claimed_at
+        )
+        .values(poweroff_claimed_at=None)
+    )
+    db.session.commit()
+
+
+def poweroff(vm_name):
+    try:
+        orchestrator.poweroff(vm_name.split('.')[0])
+        return True
+    except OrchestratorError:
+        return False
+
+
+def poweroff_claimed(rows, now):
+    """
+    Power off claimed VMs on the orchestrator, release the ones whose poweroff
+    failed and charge the usage of the rest. The charges are left for the
+    caller to commit.
+
+    :param rows: Claimed VMs, with their id, name, created_at and user_id.
+    :param now: Claim time of the VMs, used as their poweroff time.
+    :return: Tuple with the rows powered off and the rows whose poweroff failed.
+    """
+    with ThreadPoolExecutor(POWEROFF_CONCURRENCY) as pool:
+        results = list(pool.map(poweroff, [row.name for row in rows]))
+
+    powered_off = [row for row, ok in zip(rows, results) if ok]
+    failed = [row for row, ok in zip(rows, results) if not ok]
+
+    if failed:
+        release_poweroff([row.id for row in failed], now)
+
+    completed_ids = complete_poweroff([row.id for row in powered_off], now)
+    powered_off = [row for row in powered_off if row.id in completed_ids]
+
+    costs = calc_vm_credits_costs_batch([row.created_at for row in powered_off], [now] * len(powered_off), now)
+    for row, cost in zip(powered_off, costs):
+        charge_vm_usage(row.id, row.user_id, cost)
+
+    return powered_off, failed
+
+
+@periodic_job(SWEEP_SECONDS)
+def sweep_credits(app):
+    """
+    Power off the VMs of every user out of credits.
+
+    VMs are claimed with a conditional UPDATE before calling the orchestrator,
+    so when several workers sweep at once each VM is handled by only one of
+    them. A VM whose poweroff fails is released for the next sweep, and every
+    VM powered off is charged its usage through the credit ledger. The sweep
+    is exported in the credit_sweep metrics and kept in last_sweep, the
+    result of the last sweep of this worker.
+
+    :param app: Flask app the sweep runs against.
+    :return: Dict with the sweep duration and counters.
+    """
+    start = time.perf_counter()
+
+    with app.app_context():
+        now = datetime.now(timezone.utc)
+        overdrawn, checked = find_overdrawn_vms(now)
+
+        claimed_ids = claim_poweroff([row.id for row in overdrawn], now)
+
+        claimed = [row for row in overdrawn if row.id in claimed_ids]
+
+        powered_off, failed = poweroff_claimed(claimed, now)
+
+        for row in powered_off:
+            email_sender.poweroff_machine(row.id, row.name, row.email, f"{row.user_name} {row.surname}")
+
+        db.session.commit()
+
+        last_sweep.update({
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            "running_vms": checked,
+            "overdrawn_vms": len(overdrawn),
+            "powered_off": len(powered_off),
+            "poweroff_failed": len(failed),
+        })
+        app.logger.info("Credit sweep: %s", last_sweep)
+
+        CREDIT_SWEEP_DURATION.observe(last_sweep["duration_ms"] / 1000)
+        for outcome in ("running_vms", "overdrawn_vms", "powered_off", "poweroff_failed"):
+            CREDIT_SWEEP_VMS.labels(outcome).inc(last_sweep[outcome])
+
+        return dict(last_sweep)
+
+
+@periodic_job(POWEROFF_RESUME_SECONDS)
+def resume_stale_poweroffs(app):
+    """
+    Retry the poweroffs left claimed by a worker that went away during the
+    orchestrator call. The stale claims are taken over with a conditional
+    UPDATE, so only one worker retries each VM. The orchestrator poweroff is
+    safe to retry, so a VM the worker already powered off is only charged; a
+    VM whose retry fails is released for the sweeper or its owner.
+
+    :param app: Flask app the poweroffs run against.
+    :return: Dict with the counters of the retried poweroffs.
+    """
+    with app.app_context():
+        now = datetime.now(timezone.utc)
+
+        claimed = db.session.execute(
+            update(models.VirtualMachineModel)
+            .where(
+                models.VirtualMachineModel.powered_off_at.is_(None),
+                models.VirtualMachineModel.poweroff_claimed_at < now - POWEROFF_STALE_AFTER
+            )
+            .values(poweroff_claimed_at=now)
+            .returning(
+                models.VirtualMachineModel.id,
+                models.VirtualMachineModel.name,
+                models.VirtualMachineModel.created_at,
+                models.VirtualMachineModel.user_id
+            )
+        ).all()
+        db.session.commit()
+
+        if not claimed:
+            return {"powered_off": 0, "poweroff_failed": 0}
+
+        powered_off, failed = poweroff_claimed(claimed, now)
+        db.session.commit()
+
+        result = {"powered_off": len(powered_off), "poweroff_failed": len(failed)}
+        app.logger.warning("Resumed %d stale poweroffs: %s", len(claimed), result)
+
+        return result
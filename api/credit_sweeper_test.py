@@ -0,0 +1,157 @@
+import pytest
+from datetime import datetime, timezone, timedelta
+from database import db
+import models
+import credit_sweeper
+from orchestrator import OrchestratorUnavailable
+
+@pytest.fixture
+def poweroffs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(credit_sweeper.orchestrator, "poweroff", lambda name: calls.append(name))
+    return calls
+
+def outbox(app):
+    """Recipients of the emails queued in the outbox."""
+    with app.app_context():
+        return [email.to_address for email in models.EmailOutboxModel.query.all()]
+
+def add_user(app, user_id, credits, vms_minutes):
+    """Add a user with one running VM per entry of ``vms_minutes`` (minutes it has been running)."""
+    with app.app_context():
+        db.session.add(models.UserModel(id=user_id, email=f"user{user_id}@example.com", password="x",
+                                        name="Test", surname=str(user_id), location_id=1, credits=credits))
+        for i, minutes in enumerate(vms_minutes):
+            db.session.add(models.VirtualMachineModel(
+                name=f"vm{user_id}-{i}.westeurope.cloudapp.azure.com",
+                user_id=user_id,
+                created_at=datetime.now(timezone.utc) - timedelta(minutes=minutes)
+            ))
+        db.session.commit()
+
+# Test users with credits left keep their VMs running
+def test_sweep_keeps_funded_vms(app, poweroffs):
+    add_user(app, 1, 100, [10])
+    result = credit_sweeper.sweep_credits(app)
+    assert result["running_vms"] == 1
+    assert result["powered_off"] == 0
+    assert poweroffs == []
+
+# Test every running VM of an overdrawn user is powered off in one sweep
+def test_sweep_powers_off_overdrawn(app, poweroffs):
+    add_user(app, 1, 100, [10])
+    # Two VMs running for 600 minutes cost 30 credits each, over the 20 credits left
+    add_user(app, 2, 20, [600, 600])
+
+    result = credit_sweeper.sweep_credits(app)
+    assert result["powered_off"] == 2
+    assert sorted(poweroffs) == ["vm2-0", "vm2-1"]
+    assert outbox(app) == ["user2@example.com", "user2@example.com"]
+
+    with app.app_context():
+        # Each VM is debited its exact cost, 20 - 30 - 30
+        assert db.session.get(models.UserModel, 2).credits == -40
+        assert sorted(t.delta for t in models.CreditTransactionModel.query.filter_by(user_id=2)) == [-30, -30]
+        assert db.session.get(models.UserModel, 1).credits == 100
+        assert models.VirtualMachineModel.query.filter(models.VirtualMachineModel.powered_off_at.is_(None)).count() == 1
+
+# Test every sweep is exported in the metrics
+def test_sweep_metrics(app, poweroffs):
+    from prometheus_client import REGISTRY
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    sweeps = sample("credit_sweep_duration_seconds_count")
+    powered_off = sample("credit_sweep_vms_total", outcome="powered_off")
+    add_user(app, 1, 0, [10])
+
+    credit_sweeper.sweep_credits(app)
+
+    assert sample("credit_sweep_duration_seconds_count") == sweeps + 1
+    assert sample("credit_sweep_vms_total", outcome="powered_off") == powered_off + 1
+
+# Test a VM already claimed is not powered off twice
+def test_sweep_twice(app, poweroffs):
+    add_user(app, 1, 0, [10])
+    credit_sweeper.sweep_credits(app)
+    result = credit_sweeper.sweep_credits(app)
+    assert result["running_vms"] == 0
+    assert poweroffs == ["vm1-0"]
+
+# Test a VM whose poweroff failed is released for the next sweep
+def test_sweep_poweroff_failed(app, monkeypatch):
+    def failing_poweroff(name):
+        raise OrchestratorUnavailable("Connection refused")
+
+    monkeypatch.setattr(credit_sweeper.orchestrator, "poweroff", failing_poweroff)
+    add_user(app, 1, 0, [10])
+
+    result = credit_sweeper.sweep_credits(app)
+    assert result["poweroff_failed"] == 1
+    assert outbox(app) == []
+
+    with app.app_context():
+        vm = models.VirtualMachineModel.query.one()
+        assert vm.powered_off_at is None
+        assert vm.poweroff_claimed_at is None
+
+def claim(app, minutes_ago):
+    """Claim the poweroff of every VM as a worker did ``minutes_ago`` minutes ago."""
+    with app.app_context():
+        vm_ids = [vm.id for vm in models.VirtualMachineModel.query.all()]
+        credit_sweeper.claim_poweroff(vm_ids, datetime.now(timezone.utc) - timedelta(minutes=minutes_ago))
+
+# Test a VM being powered off is still running, and not claimed again by the sweep
+def test_sweep_skips_powering_off(app, poweroffs):
+    add_user(app, 1, 0, [10])
+    claim(app, 1)
+
+    result = credit_sweeper.sweep_credits(app)
+    assert result["overdrawn_vms"] == 1
+    assert result["powered_off"] == 0
+    assert poweroffs == []
+
+    with app.app_context():
+        assert models.VirtualMachineModel.query.one().powered_off_at is None
+
+# Test a poweroff left claimed by a worker that went away is retried and charged once
+def test_resume_stale_poweroffs(app, poweroffs):
+    # Running for 600 minutes costs 30 credits
+    add_user(app, 1, 100, [600])
+    claim(app, 20)
+
+    assert credit_sweeper.resume_stale_poweroffs(app) == {"powered_off": 1, "poweroff_failed": 0}
+    assert credit_sweeper.resume_stale_poweroffs(app) == {"powered_off": 0, "poweroff_failed": 0}
+    assert poweroffs == ["vm1-0"]
+
+    with app.app_context():
+        vm = models.VirtualMachineModel.query.one()
+        assert vm.powered_off_at is not None
+        assert vm.poweroff_claimed_at is None
+        assert db.session.get(models.UserModel, 1).credits == 70
+
+# Test a recent claim is left to the worker that made it
+def test_resume_skips_recent_claims(app, poweroffs):
+    add_user(app, 1, 100, [10])
+    claim(app, 1)
+
+    assert credit_sweeper.resume_stale_poweroffs(app) == {"powered_off": 0, "poweroff_failed": 0}
+    assert poweroffs == []
+
+# Test a stale poweroff whose retry fails is released for the sweeper
+def test_resume_stale_poweroff_failed(app, monkeypatch):
+    def failing_poweroff(name):
+        raise OrchestratorUnavailable("Connection refused")
+
+    monkeypatch.setattr(credit_sweeper.orchestrator, "poweroff", failing_poweroff)
+    add_user(app, 1, 100, [10])
+    claim(app, 20)
+
+    assert credit_sweeper.resume_stale_poweroffs(app) == {"powered_off": 0, "poweroff_failed": 1}
+
+    with app.app_context():
+        vm = models.VirtualMachineModel.query.one()
+        assert vm.powered_off_at is None
+        assert vm.poweroff_claimed_at is None
+        assert db.session.get(models.UserModel, 1).credits == 100
@@ -1,3 +1,135 @@
+"""
+This file contains the database handle of the API and the configuration of
+its connection pool. Every gunicorn worker opens its own pool, so the
+database sees up to workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+"""
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy import event
+from metrics import Histogram, DB_POOL_CHECKOUT_WAIT, DB_POOL_TIMEOUTS, DB_POOL_IN_USE
+import threading
+import time
+import os
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+
+# Seconds requests waited for a connection of the pool
+POOL_CHECKOUT_WAIT = Histogram()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long every checkout waited for a connection
+    and how many checkouts gave up after ``pool_timeout``.
+    """
+
+    timeouts = 0
+    _timeouts_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with InstrumentedQueuePool._timeouts_lock:
+                InstrumentedQueuePool.timeouts += 1
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            POOL_CHECKOUT_WAIT.observe(waited)
+            DB_POOL_CHECKOUT_WAIT.observe(waited)
+
+
+@event.listens_for(InstrumentedQueuePool, "checkout")
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_IN_USE.inc()
+
+
+@event.listens_for(InstrumentedQueuePool, "checkin")
+def count_checkin(dbapi_connection, connection_record):
+    DB_POOL_IN_USE.dec()
+
+
+def engine_options(database_uri):
+    """
+    Build the SQLAlchemy engine options from the environment:
+
+    - DB_POOL_SIZE: connections kept open by every worker.
+    - DB_MAX_OVERFLOW: extra connections opened during a burst.
+    - DB_POOL_TIMEOUT: seconds to wait for a connection before failing.
+    - DB_POOL_RECYCLE: seconds after which a connection is replaced, so it is
+      closed before the server or a proxy drops it.
+    - DB_POOL_PRE_PING: test every connection on checkout, so connections
+      broken by a database restart are replaced instead of failing a request.
+
+    SQLite keeps the pool Flask-SQLAlchemy picks for it.
+
+    :param database_uri: URI of the database.
+    :return: Dict for SQLALCHEMY_ENGINE_OPTIONS.
+    """
+    if not database_uri or database_uri.startswith("sqlite"):
+        return {}
+
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 5)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+    }
+
+
+def pool_stats(engine):
+    """
+    :param engine: Engine whose pool is described.
+    :return: Dict with the pool occupation and the checkout wait histogram.
+    """
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "timeouts": InstrumentedQueuePool.timeouts,
+        })
+
+    stats["checkout_wait_seconds"] = POOL_CHECKOUT_WAIT.snapshot()
+    return stats
+
+
+def insert_or_ignore(model, index_elements):
+    """
+    INSERT statement that skips the rows conflicting on a unique column,
+    on PostgreSQL and on the SQLite database of the tests.
+
+    :param model: Model to insert into.
+    :param index_elements: Columns of the unique constraint.
+    :return: The statement, to be completed with ``.values()``.
+    """
+    dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model).on_conflict_do_nothing(index_elements=index_elements)
+
+
+def upsert(model, index_elements, update_columns):
+    """
+    INSERT statement that updates the rows conflicting on a unique column,
+    on PostgreSQL and on the SQLite database of the tests.
+
+    :param model: Model to insert into.
+    :param index_elements: Columns of the unique constraint.
+    :param update_columns: Columns overwritten with the inserted values on a conflict.
+    :return: The statement, to be executed with a list of rows.
+    """
+    dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(model)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: statement.excluded[column] for column in update_columns}
+    )
@@ -0,0 +1,283 @@
+"""
+This file contains the email outbox. Sending an email only inserts a row in
+the email_outbox table, in the same transaction as the change that caused it,
+and a periodic job of the scheduler delivers the pending rows in batches
+through Resend, retrying failed batches with exponential backoff.
+
+Every email has a dedup key, so the same email queued twice is stored once,
+and a batch is sent with an idempotency key built from its dedup keys, so a
+batch retried after a lost response is not delivered twice. The key is
+stored on the rows of the batch when they are claimed, and a batch that
+failed, or was left sending by a worker that died, is claimed again as the
+same group of emails with one retry time, never mixed with other emails.
+
+Resend rejects a whole batch when one of its emails is invalid. A rejected
+batch was not delivered at all, so its emails are then sent one by one and
+only the invalid one is charged the attempt. Sent emails are deleted after
+OUTBOX_RETENTION.
+"""
+from datetime import datetime, timezone, timedelta
+from scheduler import periodic_job
+from metrics import track_outbound
+from outbound import limiter
+from sqlalchemy import select, update, delete, or_
+from database import db, insert_or_ignore
+from sdk_clients import resend_sdk
+import models
+import hashlib
+import random
+import os
+
+OUTBOX_POLL_SECONDS = int(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", 5))
+# Resend accepts up to 100 emails per batch
+OUTBOX_BATCH_SIZE = min(int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 50)), 100)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETRY_BACKOFF = float(os.getenv("EMAIL_OUTBOX_RETRY_BACKOFF", 30))
+OUTBOX_MAX_BACKOFF = float(os.getenv("EMAIL_OUTBOX_MAX_BACKOFF", 3600))
+# A batch claimed longer ago than this belongs to a worker that died while sending
+OUTBOX_SENDING_TIMEOUT = timedelta(seconds=int(os.getenv("EMAIL_OUTBOX_SENDING_TIMEOUT", 300)))
+OUTBOX_RETENTION = timedelta(days=int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", 30)))
+OUTBOX_PURGE_SECONDS = int(os.getenv("EMAIL_OUTBOX_PURGE_SECONDS", 3600))
+
+SENDER = "noreply@biocloudlabs.es"
+
+
+class RejectedBatch(Exception):
+    """
+    Raised when Resend refused the content of a batch, so none of its emails
+    was delivered.
+    """
+
+
+class ResendTransport:
+    """Delivers a batch of emails with the Resend batch API."""
+
+    # Status codes of a request refused for its content, any other error may have been delivered
+    REJECTED_CODES = ("400", "422")
+
+    def send_batch(self, messages, idempotency_key):
+        """
+        :param messages: List of Resend send params.
+        :param idempotency_key: Key that makes Resend ignore a repeated batch.
+        :raises RejectedBatch: If Resend refused the content of the batch.
+        """
+        resend = resend_sdk()
+        with track_outbound("resend", "batch_send"), limiter.slot("resend"):
+            try:
+                resend.Batch.send(messages, {"idempotency_key": idempotency_key})
+            except resend.exceptions.ResendError as e:
+                if str(e.code) in self.REJECTED_CODES:
+                    raise RejectedBatch(str(e)) from e
+                raise
+
+
+transport = ResendTransport()
+
+
+def enqueue_email(dedup_key, to_address, subject, html):
+    """
+    Add an email to the outbox of the current session. The caller commits it
+    together with the rest of its changes. An email whose dedup key is already
+    in the outbox is ignored.
+
+    :param dedup_key: Key unique to this email.
+    :param to_address: Recipient.
+    :param subject: Subject of the email.
+    :param html: Rendered body.
+    """
+    db.session.execute(
+        insert_or_ignore(models.EmailOutboxModel, ["dedup_key"])
+        .values(
+            dedup_key=dedup_key,
+            to_address=to_address,
+            subject=subject,
+            html=html,
+            status="pending",
+            attempts=0,
+            next_attempt_at=datetime.now(timezone.utc)
+        )
+    )
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff with full jitter.
+
+    :param attempts: Failed attempts so far.
+    :return: Delay before the next attempt.
+    """
+    return timedelta(seconds=random.uniform(0, min(OUTBOX_MAX_BACKOFF, OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1))))
+
+
+def batch_key(batch):
+    """
+    :param batch: Emails of a batch, ordered by id.
+    :return: Idempotency key of the batch, built from its dedup keys.
+    """
+    return hashlib.sha256("\n".join(row.dedup_key for row in batch).encode()).hexdigest()
+
+
+def claim_batch(now):
+    """
+    Atomically mark the next emails that are due as being sent, so when
+    several workers drain at once each email is claimed by only one of them.
+    A batch already tried is claimed again whole, so it keeps its idempotency
+    key; otherwise up to OUTBOX_BATCH_SIZE new emails are claimed and their
+    key is stored on them.
+
+    :param now: Current time.
+    :return: The claimed emails.
+    """
+    Outbox = models.EmailOutboxModel
+
+    claimable = or_(
+        (Outbox.status == "pending") & (Outbox.next_attempt_at <= now),
+        (Outbox.status == "sending") & (Outbox.claimed_at < now - OUTBOX_SENDING_TIMEOUT)
+    )
+
+    retried_key = db.session.execute(
+        select(Outbox.batch_key).where(claimable, Outbox.batch_key.is_not(None)).order_by(Outbox.id).limit(1)
+    ).scalar()
+
+    if retried_key is not None:
+        claimed_rows = Outbox.batch_key == retried_key
+    else:
+        candidates = select(Outbox.id).where(claimable, Outbox.batch_key.is_(None)).order_by(Outbox.id).limit(OUTBOX_BATCH_SIZE)
+        claimed_rows = Outbox.id.in_(candidates.scalar_subquery())
+
+    claimed = sorted(db.session.execute(
+        update(Outbox)
+        .where(claimed_rows, claimable)
+        .values(status="sending", claimed_at=now)
+        .returning(Outbox.id, Outbox.dedup_key, Outbox.to_address, Outbox.subject, Outbox.html, Outbox.attempts)
+    ).all(), key=lambda row: row.id)
+
+    if claimed and retried_key is None:
+        db.session.execute(
+            update(Outbox).where(Outbox.id.in_([row.id for row in claimed])).values(batch_key=batch_key(claimed))
+        )
+    db.session.commit()
+
+    return claimed
+
+
+def deliver_batch(batch, transport):
+    """
+    Send a claimed batch and record the outcome on every row. A batch
+    rejected for its content is sent again one email at a time, so only the
+    invalid emails fail.
+
+    :param batch: Claimed emails.
+    :param transport: Object with a ``send_batch(messages, idempotency_key)`` method.
+    :return: Number of emails delivered.
+    """
+    Outbox = models.EmailOutboxModel
+
+    messages = [{
+        "from": SENDER,
+        "sender": SENDER,
+        "to": row.to_address,
+        "subject": row.subject,
+        "html": row.html
+    } for row in batch]
+
+    try:
+        transport.send_batch(messages, batch_key(batch))
+    except RejectedBatch as e:
+        if len(batch) == 1:
+            record_failure(batch, e)
+            return 0
+        # Nothing was delivered, each email becomes a batch of its own
+        for row in batch:
+            db.session.execute(update(Outbox).where(Outbox.id == row.id).values(batch_key=batch_key([row])))
+        db.session.commit()
+        return sum(deliver_batch([row], transport) for row in batch)
+    except Exception as e:
+        record_failure(batch, e)
+        return 0
+
+    db.session.execute(
+        update(Outbox)
+        .where(Outbox.id.in_([row.id for row in batch]))
+        .values(status="sent", sent_at=datetime.now(timezone.utc), attempts=Outbox.attempts + 1, last_error=None)
+    )
+    db.session.commit()
+    return len(batch)
+
+
+def record_failure(batch, error):
+    """
+    Charge an attempt to every email of a failed batch and schedule its retry,
+    or mark it failed once it runs out of attempts. The emails of the batch
+    share one retry time, so they are claimed again together.
+
+    :param batch: Claimed emails.
+    :param error: Error raised by the transport.
+    """
+    Outbox = models.EmailOutboxModel
+    next_attempt_at = datetime.now(timezone.utc) + retry_delay(max(row.attempts for row in batch) + 1)
+
+    for row in batch:
+        attempts = row.attempts + 1
+        db.session.execute(
+            update(Outbox)
+            .where(Outbox.id == row.id)
+            .values(
+                status="failed" if attempts >= OUTBOX_MAX_ATTEMPTS else "pending",
+                attempts=attempts,
+                last_error=str(error)[:500],
+                next_attempt_at=next_attempt_at,
+                claimed_at=None
+            )
+        )
+    db.session.commit()
+
+
+@periodic_job(OUTBOX_POLL_SECONDS)
+def drain_outbox(app, transport=transport):
+    """
+    Deliver every email that is due, one batch at a time.
+
+    :param app: Flask app the job runs against.
+    :param transport: Transport used to deliver the batches.
+    :return: Dict with the number of sent and failed emails.
+    """
+    result = {"sent": 0, "failed": 0}
+
+    with app.app_context():
+        while True:
+            batch = claim_batch(datetime.now(timezone.utc))
+            if not batch:
+                break
+
+            sent = deliver_batch(batch, transport)
+            result["sent"] += sent
+            result["failed"] += len(batch) - sent
+
+            if not sent:
+                app.logger.warning("Email outbox: batch of %s emails failed", len(batch))
+                # Resend is failing, try again on the next run
+                break
+
+    return result
+
+
+@periodic_job(OUTBOX_PURGE_SECONDS)
+def purge_sent_emails(app):
+    """
+    Delete the emails sent longer ago than OUTBOX_RETENTION. Failed emails
+    are kept for inspection.
+
+    :param app: Flask app the job runs against.
+    :return: Number of emails deleted.
+    """
+    Outbox = models.EmailOutboxModel
+
+    with app.app_context():
+        result = db.session.execute(
+            delete(Outbox)
+            .where(Outbox.status == "sent", Outbox.sent_at < datetime.now(timezone.utc) - OUTBOX_RETENTION)
+        )
+        db.session.commit()
+
+    return result.rowcount
@@ -0,0 +1,202 @@
+from datetime import datetime, timezone, timedelta
+from database import db
+import models
+import email_outbox
+from email_outbox import enqueue_email, drain_outbox, purge_sent_emails, RejectedBatch
+from mail_utils import EmailSender
+
+
+class FakeTransport:
+    """Stand-in for Resend that records the batches and can be told to fail."""
+
+    def __init__(self, failures=0, rejected=(), lost=0):
+        self.failures = failures
+        self.rejected = set(rejected)
+        self.lost = lost
+        self.batches = []
+
+    def send_batch(self, messages, idempotency_key):
+        if self.lost > 0:
+            # Delivered, but the response never arrives
+            self.lost -= 1
+            self.batches.append((messages, idempotency_key))
+            raise ConnectionError("Connection reset")
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("Resend unavailable")
+        if any(message["to"] in self.rejected for message in messages):
+            raise RejectedBatch("Invalid `to` field")
+        self.batches.append((messages, idempotency_key))
+
+
+def queue(app, count, prefix="email"):
+    with app.app_context():
+        for i in range(count):
+            enqueue_email(f"{prefix}-{i}", f"user{i}@example.com", "Subject", f"<p>{i}</p>")
+        db.session.commit()
+
+def statuses(app):
+    with app.app_context():
+        return [email.status for email in models.EmailOutboxModel.query.order_by(models.EmailOutboxModel.id)]
+
+# Test the templates are rendered into the outbox without sending anything
+def test_email_sender_enqueues(app):
+    with app.app_context():
+        email_sender = EmailSender()
+        email_sender.poweroff_machine(1, "vm1.westeurope.cloudapp.azure.com", "user@example.com", "Test User")
+        email_sender.recover_password("https://biocloudlabs.es/recoverpassword?token=x", "user@example.com", "Test User")
+        db.session.commit()
+
+        emails = models.EmailOutboxModel.query.order_by(models.EmailOutboxModel.id).all()
+        assert [email.subject for email in emails] == ["Machine powered off", "Password recovery"]
+        assert "vm1.westeurope.cloudapp.azure.com" in emails[0].html
+        assert "https://biocloudlabs.es/recoverpassword?token=x" in emails[1].html
+        assert all(email.status == "pending" for email in emails)
+
+# Test a VM name reused by a later VM still gets its poweroff email
+def test_poweroff_email_per_vm(app):
+    with app.app_context():
+        email_sender = EmailSender()
+        email_sender.poweroff_machine(1, "vm1.westeurope.cloudapp.azure.com", "user@example.com", "Test User")
+        email_sender.poweroff_machine(1, "vm1.westeurope.cloudapp.azure.com", "user@example.com", "Test User")
+        email_sender.poweroff_machine(2, "vm1.westeurope.cloudapp.azure.com", "user@example.com", "Test User")
+        db.session.commit()
+
+    assert statuses(app) == ["pending"] * 2
+
+# Test the same dedup key is stored once
+def test_dedup_key(app):
+    queue(app, 3)
+    queue(app, 3)
+    assert statuses(app) == ["pending"] * 3
+
+# Test the pending emails are delivered in batches
+def test_drain_batches(app, monkeypatch):
+    monkeypatch.setattr(email_outbox, "OUTBOX_BATCH_SIZE", 2)
+    transport = FakeTransport()
+    queue(app, 5)
+
+    assert drain_outbox(app, transport) == {"sent": 5, "failed": 0}
+    assert [len(messages) for messages, _ in transport.batches] == [2, 2, 1]
+    assert transport.batches[0][0][0]["to"] == "user0@example.com"
+    assert statuses(app) == ["sent"] * 5
+
+    # Nothing left to send
+    assert drain_outbox(app, transport) == {"sent": 0, "failed": 0}
+
+# Test a failed batch is retried with backoff
+def test_drain_retry(app):
+    transport = FakeTransport(failures=1)
+    queue(app, 2)
+
+    assert drain_outbox(app, transport) == {"sent": 0, "failed": 2}
+    assert statuses(app) == ["pending"] * 2
+
+    with app.app_context():
+        emails = models.EmailOutboxModel.query.all()
+        assert all(email.attempts == 1 and email.last_error == "Resend unavailable" for email in emails)
+        # Not due yet
+        for email in emails:
+            email.next_attempt_at = datetime.now(timezone.utc) + timedelta(minutes=5)
+        db.session.commit()
+
+    assert drain_outbox(app, transport) == {"sent": 0, "failed": 0}
+
+    with app.app_context():
+        for email in models.EmailOutboxModel.query.all():
+            email.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.session.commit()
+
+    assert drain_outbox(app, transport) == {"sent": 2, "failed": 0}
+    assert statuses(app) == ["sent"] * 2
+
+# Test a batch retried is sent with the same idempotency key
+def test_idempotency_key(app):
+    transport = FakeTransport()
+    queue(app, 2)
+    drain_outbox(app, transport)
+
+    with app.app_context():
+        models.EmailOutboxModel.query.update({"status": "pending"})
+        db.session.commit()
+    drain_outbox(app, transport)
+
+    assert transport.batches[0][1] == transport.batches[1][1]
+
+# Test a batch whose response was lost is sent again as the same batch, apart from newer emails
+def test_lost_response_same_batch(app, monkeypatch):
+    monkeypatch.setattr(email_outbox, "OUTBOX_BATCH_SIZE", 3)
+    transport = FakeTransport(lost=1)
+    queue(app, 2)
+
+    assert drain_outbox(app, transport) == {"sent": 0, "failed": 2}
+
+    queue(app, 2, prefix="newer")
+    with app.app_context():
+        for email in models.EmailOutboxModel.query.all():
+            email.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.session.commit()
+
+    assert drain_outbox(app, transport) == {"sent": 4, "failed": 0}
+
+    (lost_messages, lost_key), (retried_messages, retried_key), (newer_messages, newer_key) = transport.batches
+    assert retried_key == lost_key
+    assert retried_messages == lost_messages
+    assert [message["html"] for message in newer_messages] == ["<p>0</p>", "<p>1</p>"]
+    assert newer_key != lost_key
+
+# Test an email is given up after the maximum number of attempts
+def test_drain_gives_up(app, monkeypatch):
+    monkeypatch.setattr(email_outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(email_outbox, "retry_delay", lambda attempts: timedelta(0))
+    transport = FakeTransport(failures=5)
+    queue(app, 1)
+
+    drain_outbox(app, transport)
+    drain_outbox(app, transport)
+    assert statuses(app) == ["failed"]
+    assert drain_outbox(app, transport) == {"sent": 0, "failed": 0}
+
+# Test a batch left sending by a dead worker is claimed again
+def test_stale_sending(app):
+    transport = FakeTransport()
+    queue(app, 1)
+
+    with app.app_context():
+        email = models.EmailOutboxModel.query.one()
+        email.status = "sending"
+        email.claimed_at = datetime.now(timezone.utc) - timedelta(hours=1)
+        db.session.commit()
+
+    assert drain_outbox(app, transport) == {"sent": 1, "failed": 0}
+
+# Test a batch rejected for one bad recipient is sent one by one and only that email fails
+def test_rejected_batch_split(app):
+    queue(app, 3)
+    transport = FakeTransport(rejected={"user1@example.com"})
+
+    assert drain_outbox(app, transport) == {"sent": 2, "failed": 1}
+    assert statuses(app) == ["sent", "pending", "sent"]
+    assert [[message["to"] for message in messages] for messages, _ in transport.batches] == [
+        ["user0@example.com"], ["user2@example.com"]
+    ]
+
+    with app.app_context():
+        bad = models.EmailOutboxModel.query.filter_by(to_address="user1@example.com").one()
+        assert bad.attempts == 1
+        assert "Invalid" in bad.last_error
+
+# Test sent emails are purged once they are older than the retention
+def test_purge_sent_emails(app):
+    queue(app, 3)
+    drain_outbox(app, FakeTransport())
+
+    with app.app_context():
+        old = models.EmailOutboxModel.query.filter_by(dedup_key="email-0").one()
+        old.sent_at = datetime.now(timezone.utc) - email_outbox.OUTBOX_RETENTION - timedelta(days=1)
+        failed = models.EmailOutboxModel.query.filter_by(dedup_key="email-1").one()
+        failed.status, failed.sent_at = "failed", old.sent_at
+        db.session.commit()
+
+    assert purge_sent_emails(app) == 1
+    assert statuses(app) == ["failed", "sent"]
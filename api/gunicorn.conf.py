@@ -0,0 +1,84 @@
+"""
+Gunicorn settings, loaded from the working directory when the server starts.
+"""
+import shutil
+import os
+
+# Every worker writes its metrics here, it must be set before the app imports prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+wsgi_app = "app:create_app()"
+
+# "sync" serves one request at a time per worker, "gevent" serves up to
+# worker_connections requests at once per worker as greenlets (see cooperative.py)
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# The master builds the app once and the workers share its memory copy-on-write
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+if worker_class == "gevent":
+    # Patched before the master preloads the app, so every lock the app
+    # creates is a gevent one in the workers
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def cooperative_workers(server):
+    return "gevent" in server.cfg.worker_class_str
+
+
+def on_starting(server):
+    """
+    Start with an empty metrics folder, the files of a previous run would be
+    added to the new counters.
+    """
+    from cooperative import cooperative
+    if cooperative_workers(server) and server.cfg.preload_app and not cooperative():
+        raise RuntimeError("gevent workers can only preload the app with GUNICORN_WORKER_CLASS=gevent, "
+                           "its locks would block the whole worker.")
+
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_fork(server, worker):
+    """
+    With --preload the app, and its engine, is created in the master before
+    the fork. Drop the inherited pool so the worker never shares a socket
+    with its parent or a sibling, without closing the parent's connections.
+
+    A gevent worker makes psycopg2 wait for the database through gevent, so
+    a query yields to the other greenlets instead of blocking the worker.
+    """
+    if cooperative_workers(server):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+    app = server.app.callable
+    if app is None:
+        return
+
+    from database import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """
+    Start the scheduler of the worker once its app is loaded, so its periodic
+    jobs run even before it serves a request.
+    """
+    from scheduler import init_scheduler
+    init_scheduler(worker.wsgi)
+    worker.log.info("Worker ready (pid: %s)", worker.pid)
+
+
+def child_exit(server, worker):
+    """
+    Drop the live gauges of a dead worker, its counters are kept.
+    """
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy import event
+from database import db
+import models
+from controllers import azuredata
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.add(models.LocationModel(name="westeurope", display_name="(Europe) West Europe"))
+        db.session.commit()
+    azuredata.locations_cache.invalidate()
+
+@pytest.fixture
+def queries(app):
+    """Count the statements run against the database."""
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+# Test the list is served with a strong ETag and Cache-Control
+def test_locations_etag(client):
+    response = client.get('/api/azuredata/locations')
+    assert response.status_code == 200
+    assert [location["name"] for location in response.json["locations"]] == ["eastus", "westeurope"]
+    assert response.headers["ETag"].startswith('"')
+    assert "public" in response.headers["Cache-Control"]
+
+# Test the list is loaded from the database only once
+def test_locations_cached(client, queries):
+    first = client.get('/api/azuredata/locations')
+    second = client.get('/api/azuredata/locations')
+    assert second.data == first.data
+    assert len(queries) == 1
+
+# Test If-None-Match is answered with 304 without touching the database
+def test_locations_not_modified(client, queries):
+    etag = client.get('/api/azuredata/locations').headers["ETag"]
+    queries.clear()
+
+    response = client.get('/api/azuredata/locations', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert queries == []
+
+# Test the cache is invalidated when the locations change
+def test_locations_invalidated(app, client):
+    etag = client.get('/api/azuredata/locations').headers["ETag"]
+
+    with app.app_context():
+        db.session.add(models.LocationModel(name="northeurope", display_name="(Europe) North Europe"))
+        db.session.commit()
+
+    response = client.get('/api/azuredata/locations', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json["locations"]) == 3
+
+# Test a flushed change keeps the cache until it commits and a rolled back one never drops it
+def test_locations_invalidated_on_commit(app, client, queries):
+    client.get('/api/azuredata/locations')
+
+    with app.app_context():
+        db.session.add(models.LocationModel(name="northeurope", display_name="(Europe) North Europe"))
+        db.session.flush()
+        assert azuredata.locations_cache.get("locations") is not None
+        db.session.rollback()
+    assert azuredata.locations_cache.get("locations") is not None
+
+    with app.app_context():
+        db.session.add(models.LocationModel(name="northeurope", display_name="(Europe) North Europe"))
+        db.session.flush()
+        assert azuredata.locations_cache.get("locations") is not None
+        db.session.commit()
+    assert azuredata.locations_cache.get("locations") is None
+
+# Test a list read before a commit is not cached after it
+def test_locations_read_during_change(client, monkeypatch):
+    load_locations = azuredata.load_locations
+
+    def racing_load():
+        cached = load_locations()
+        azuredata.invalidate_locations()
+        return cached
+
+    monkeypatch.setattr(azuredata, "load_locations", racing_load)
+    assert client.get('/api/azuredata/locations').status_code == 200
+    assert azuredata.locations_cache.get("locations") is None
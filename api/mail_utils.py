@@ -1,38 +1,43 @@
-import resend
-from dataclasses import dataclass
+import hashlib
+import os
+from email_outbox import enqueue_email
 
-@dataclass
-class EmailSender():
-	api_key: str
+TEMPLATES_DIR = os.path.dirname(os.path.abspath(__file__))
 
-	def __post_init__(self):
-		resend.api_key = self.api_key
+def load_template(file_name):
+	"""
+	Read a template once, the returned function renders it.
 
-	def recover_password(self, link, user, name):
-		with open("recover_password_template.html", "r") as file:
-			template_html = file.read()
-
-			replaced_html = template_html.format(link=link, user=user, name=name)
-
-			r = resend.Emails.send({
-				"from": "noreply@biocloudlabs.es",
-				"sender": "noreply@biocloudlabs.es",
-				"to": user,
-				"subject": "Password recovery",
-				"html": replaced_html
-			})
-			
-	def poweroff_machine(self, machine_name, user, name):
-		with open("poweroff_machine.html", "r") as file:
-			template_html = file.read()
-
-			replaced_html = template_html.format(machine_name=machine_name, user=user, name=name)
-
-			r = resend.Emails.send({
-				"from": "noreply@biocloudlabs.es",
-				"sender": "noreply@biocloudlabs.es",
-				"to": user,
-				"subject": "Machine powered off",
-				"html": replaced_html
-			})
+	:param file_name: Template file next to this module.
+	:return: Function that formats the template with keyword arguments.
+	"""
+	with open(os.path.join(TEMPLATES_DIR, file_name), "r") as file:
+		return file.read().format
+
+RECOVER_PASSWORD_TEMPLATE = load_template("recover_password_template.html")
+POWEROFF_MACHINE_TEMPLATE = load_template("poweroff_machine.html")
 
+class EmailSender():
+	"""
+	Queues the emails of the API in the outbox. The caller must commit the
+	session for the email to be sent, the outbox delivers it through Resend.
+	"""
+
+	def recover_password(self, link, user, name):
+		enqueue_email(
+			f"recover-password:{hashlib.sha256(link.encode()).hexdigest()}",
+			user,
+			"Password recovery",
+			RECOVER_PASSWORD_TEMPLATE(link=link, user=user, name=name)
+		)
+
+	def poweroff_machine(self, vm_id, machine_name, user, name):
+		# Keyed on the VM row, a name reused by a later VM still gets its email
+		enqueue_email(
+			f"poweroff-machine:{vm_id}",
+			user,
+			"Machine powered off",
+			POWEROFF_MACHINE_TEMPLATE(machine_name=machine_name, user=user, name=name)
+		)
+
+email_sender = EmailSender()
@@ -0,0 +1,225 @@
+"""
+This file contains the telemetry of the API: request latency, status counts
+and in-flight requests per endpoint, the latency of the outbound calls
+(Stripe, Resend, the orchestrator) and of the database queries, and the
+duration and outcome of the credit sweeps.
+
+The metrics are exported in the Prometheus text format. Under gunicorn every
+worker writes its values to PROMETHEUS_MULTIPROC_DIR, which gunicorn.conf.py
+sets up, and a scrape answered by any worker adds up every worker. Without
+that variable the values of the current process are exported.
+"""
+from contextlib import contextmanager
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import prometheus_client as prometheus
+from prometheus_client import multiprocess
+import threading
+import time
+import os
+
+# Upper bounds in seconds, a wait longer than the last one is only counted in +Inf
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = prometheus.Histogram(
+    "http_request_duration_seconds", "Latency of the requests by endpoint.",
+    ["endpoint", "method"], buckets=DEFAULT_BUCKETS
+)
+REQUESTS = prometheus.Counter(
+    "http_requests", "Requests answered by endpoint and status.",
+    ["endpoint", "method", "status"]
+)
+REQUESTS_IN_FLIGHT = prometheus.Gauge(
+    "http_requests_in_flight", "Requests being served by endpoint.",
+    ["endpoint"], multiprocess_mode="livesum"
+)
+OUTBOUND_LATENCY = prometheus.Histogram(
+    "outbound_request_duration_seconds", "Latency of the calls to external services.",
+    ["dependency", "operation"], buckets=DEFAULT_BUCKETS
+)
+OUTBOUND_ERRORS = prometheus.Counter(
+    "outbound_request_errors", "Calls to external services that raised.",
+    ["dependency", "operation"]
+)
+DB_QUERY_LATENCY = prometheus.Histogram(
+    "db_query_duration_seconds", "Latency of the database queries by statement.",
+    ["statement"], buckets=DEFAULT_BUCKETS
+)
+DB_POOL_CHECKOUT_WAIT = prometheus.Histogram(
+    "db_pool_checkout_wait_seconds", "Time waited for a connection of the pool.",
+    buckets=DEFAULT_BUCKETS
+)
+DB_POOL_TIMEOUTS = prometheus.Counter(
+    "db_pool_checkout_timeouts", "Checkouts that gave up waiting for a connection."
+)
+DB_POOL_IN_USE = prometheus.Gauge(
+    "db_pool_connections_in_use", "Connections checked out of the pool.",
+    multiprocess_mode="livesum"
+)
+
+CREDIT_SWEEP_DURATION = prometheus.Histogram(
+    "credit_sweep_duration_seconds", "Duration of the credit sweeps.",
+    buckets=DEFAULT_BUCKETS
+)
+CREDIT_SWEEP_VMS = prometheus.Counter(
+    "credit_sweep_vms", "VMs handled by the credit sweeps by outcome.",
+    ["outcome"]
+)
+
+STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+# Labelled children, looking them up in the metric takes a lock on every request
+_children = {}
+
+
+def child(metric, *labels):
+    """
+    :param metric: Labelled metric.
+    :param labels: Label values.
+    :return: The child of the metric for these labels.
+    """
+    key = (metric, labels)
+    value = _children.get(key)
+    if value is None:
+        value = _children[key] = metric.labels(*labels)
+    return value
+
+
+@contextmanager
+def track_outbound(dependency, operation):
+    """
+    Time a call to an external service, counting it as an error if it raises.
+
+    :param dependency: Service called, such as ``stripe``.
+    :param operation: Operation of the service.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        child(OUTBOUND_ERRORS, dependency, operation).inc()
+        raise
+    finally:
+        child(OUTBOUND_LATENCY, dependency, operation).observe(time.perf_counter() - start)
+
+
+def request_children(endpoint, method):
+    key = (endpoint, method)
+    value = _children.get(key)
+    if value is None:
+        value = _children[key] = (REQUEST_LATENCY.labels(endpoint, method), REQUESTS_IN_FLIGHT.labels(endpoint))
+    return value
+
+
+def start_request():
+    # Every access through the request proxy costs a context lookup, do it once
+    current = request._get_current_object()
+    endpoint, method = current.endpoint or "unmatched", current.method
+    latency, in_flight = request_children(endpoint, method)
+    in_flight.inc()
+    current.environ["metrics.request"] = (endpoint, method, latency, in_flight, time.perf_counter())
+
+
+def finish_request(environ, status):
+    endpoint, method, latency, in_flight, start = environ.pop("metrics.request")
+    latency.observe(time.perf_counter() - start)
+    in_flight.dec()
+    child(REQUESTS, endpoint, method, status).inc()
+
+
+def record_request(response):
+    finish_request(request.environ, str(response.status_code))
+    return response
+
+
+def record_failed_request(exception):
+    # Only left over when the response was never finalized
+    environ = request.environ
+    if "metrics.request" in environ:
+        finish_request(environ, "500")
+
+
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info["metrics_query_start"] = time.perf_counter()
+
+
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("metrics_query_start", None)
+    if start is None:
+        return
+
+    verb = statement.lstrip()[:6].upper()
+    child(DB_QUERY_LATENCY, verb if verb in STATEMENTS else "OTHER").observe(time.perf_counter() - start)
+
+
+def init_metrics(app):
+    """
+    Record the requests of the app and the queries of every engine.
+
+    :param app: Flask app to instrument.
+    """
+    app.before_request(start_request)
+    app.after_request(record_request)
+    app.teardown_request(record_failed_request)
+
+    if not event.contains(Engine, "before_cursor_execute", start_query):
+        event.listen(Engine, "before_cursor_execute", start_query)
+        event.listen(Engine, "after_cursor_execute", record_query)
+
+
+def render_metrics():
+    """
+    :return: Tuple with the metrics in the Prometheus text format and its content type.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = prometheus.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus.REGISTRY
+
+    return prometheus.generate_latest(registry), prometheus.CONTENT_TYPE_LATEST
+
+
+class Histogram:
+    """
+    Thread safe histogram of durations in fixed buckets, kept in the process
+    for the per-worker JSON telemetry.
+
+    :param buckets: Sorted upper bounds of the buckets in seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """
+        :param seconds: Duration to record.
+        """
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+
+    def snapshot(self):
+        """
+        :return: Dict with the cumulative count of every bucket, the total count and the sum.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+
+        return {"buckets": buckets, "count": cumulative, "sum": round(total, 6)}
@@ -0,0 +1,107 @@
+import subprocess
+import sys
+import os
+import pytest
+from flask import Flask
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+from sqlalchemy import create_engine, text
+from metrics import init_metrics, track_outbound, render_metrics
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+app: Flask = Flask(__name__)
+
+init_metrics(app)
+
+@app.route("/ok")
+def ok():
+    in_flight = REGISTRY.get_sample_value("http_requests_in_flight", {"endpoint": "ok"})
+    return {"in_flight": in_flight}
+
+@app.route("/fail")
+def fail():
+    raise RuntimeError("boom")
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+# Test every request is counted by endpoint and status and timed
+def test_request_metrics(client):
+    requests = sample("http_requests_total", endpoint="ok", method="GET", status="200")
+    timed = sample("http_request_duration_seconds_count", endpoint="ok", method="GET")
+
+    response = client.get("/ok")
+    assert response.json["in_flight"] == 1
+
+    assert sample("http_requests_total", endpoint="ok", method="GET", status="200") == requests + 1
+    assert sample("http_request_duration_seconds_count", endpoint="ok", method="GET") == timed + 1
+    assert sample("http_requests_in_flight", endpoint="ok") == 0
+
+# Test failed and unrouted requests are counted with their status
+def test_failed_request_metrics(client):
+    failed = sample("http_requests_total", endpoint="fail", method="GET", status="500")
+    unmatched = sample("http_requests_total", endpoint="unmatched", method="GET", status="404")
+
+    assert client.get("/fail").status_code == 500
+    assert client.get("/missing").status_code == 404
+
+    assert sample("http_requests_total", endpoint="fail", method="GET", status="500") == failed + 1
+    assert sample("http_requests_total", endpoint="unmatched", method="GET", status="404") == unmatched + 1
+    assert sample("http_requests_in_flight", endpoint="fail") == 0
+
+# Test outbound calls are timed and their errors counted
+def test_track_outbound():
+    calls = sample("outbound_request_duration_seconds_count", dependency="stripe", operation="test")
+    errors = sample("outbound_request_errors_total", dependency="stripe", operation="test")
+
+    with track_outbound("stripe", "test"):
+        pass
+    with pytest.raises(ConnectionError):
+        with track_outbound("stripe", "test"):
+            raise ConnectionError()
+
+    assert sample("outbound_request_duration_seconds_count", dependency="stripe", operation="test") == calls + 2
+    assert sample("outbound_request_errors_total", dependency="stripe", operation="test") == errors + 1
+
+# Test the database queries are timed by statement
+def test_query_metrics():
+    selects = sample("db_query_duration_seconds_count", statement="SELECT")
+    engine = create_engine("sqlite://")
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.execute(text("  select 2"))
+
+    assert sample("db_query_duration_seconds_count", statement="SELECT") == selects + 2
+
+# Test the exposition contains the request metrics
+def test_render_metrics(client):
+    client.get("/ok")
+    body, content_type = render_metrics()
+    assert content_type.startswith("text/plain")
+    assert b'http_requests_total{endpoint="ok",method="GET",status="200"}' in body
+
+# Test the metrics of several worker processes are added up
+def test_multiprocess_aggregation(tmp_path):
+    worker = (
+        "from metrics import child, REQUESTS, REQUEST_LATENCY\n"
+        "for _ in range(3):\n"
+        "    child(REQUESTS, 'users.Login', 'POST', '200').inc()\n"
+        "    child(REQUEST_LATENCY, 'users.Login', 'POST').observe(0.02)\n"
+    )
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], cwd=API_DIR, env=env, check=True)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+
+    labels = {"endpoint": "users.Login", "method": "POST"}
+    assert registry.get_sample_value("http_requests_total", {**labels, "status": "200"}) == 6
+    assert registry.get_sample_value("http_request_duration_seconds_count", labels) == 6
+    assert registry.get_sample_value("http_request_duration_seconds_bucket", {**labels, "le": "0.025"}) == 6
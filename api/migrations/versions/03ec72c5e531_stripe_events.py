@@ -0,0 +1,40 @@
+"""stripe events
+
+Stripe webhook events stored before they are acknowledged, keyed by the
+Stripe event id so a redelivered event is only applied once.
+
+Revision ID: 03ec72c5e531
+Revises: a53c8d6d2562
+Create Date: 2026-10-18 21:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '03ec72c5e531'
+down_revision = 'a53c8d6d2562'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stripe_events',
+    sa.Column('id', sa.String(length=255), nullable=False),
+    sa.Column('type', sa.String(length=100), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stripe_events_status', 'stripe_events', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stripe_events_status', table_name='stripe_events')
+    op.drop_table('stripe_events')
@@ -0,0 +1,42 @@
+"""hot lookup indexes
+
+Indexes the columns the endpoints and the credit sweeper filter on, and
+allows the 'expired' invoice status set by the checkout.session.expired
+webhook.
+
+Revision ID: 3d9f0c41a7e2
+Revises: 8b644c72d57d
+Create Date: 2026-10-18 19:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9f0c41a7e2'
+down_revision = '8b644c72d57d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_virtualmachines_name', 'virtualmachines', ['name'], unique=False)
+    op.create_index('ix_virtualmachines_running', 'virtualmachines', ['user_id'], unique=False,
+                    postgresql_where=sa.text('powered_off_at IS NULL'),
+                    sqlite_where=sa.text('powered_off_at IS NULL'))
+    op.create_index('ix_invoices_user_id', 'invoices', ['user_id'], unique=False)
+
+    with op.batch_alter_table('invoices') as batch_op:
+        batch_op.drop_constraint('status_check', type_='check')
+        batch_op.create_check_constraint('status_check', "status IN ('pending', 'completed', 'failed', 'expired')")
+
+
+def downgrade():
+    with op.batch_alter_table('invoices') as batch_op:
+        batch_op.drop_constraint('status_check', type_='check')
+        batch_op.create_check_constraint('status_check', "status IN ('pending', 'completed', 'failed')")
+
+    op.drop_index('ix_invoices_user_id', table_name='invoices')
+    op.drop_index('ix_virtualmachines_running', table_name='virtualmachines')
+    op.drop_index('ix_virtualmachines_name', table_name='virtualmachines')
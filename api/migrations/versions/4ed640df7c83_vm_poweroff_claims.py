@@ -0,0 +1,32 @@
+"""vm poweroff claims
+
+Time a VM was claimed for poweroff. The VM is only recorded powered off,
+and charged, once the orchestrator powered it off; a claim left by a
+worker that went away is retried by the stale poweroff job.
+
+Revision ID: 4ed640df7c83
+Revises: 03ec72c5e531
+Create Date: 2026-10-18 21:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4ed640df7c83'
+down_revision = '03ec72c5e531'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('virtualmachines', sa.Column('poweroff_claimed_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_virtualmachines_powering_off', 'virtualmachines', ['poweroff_claimed_at'], unique=False,
+                    postgresql_where=sa.text('poweroff_claimed_at IS NOT NULL'),
+                    sqlite_where=sa.text('poweroff_claimed_at IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_virtualmachines_powering_off', table_name='virtualmachines')
+    op.drop_column('virtualmachines', 'poweroff_claimed_at')
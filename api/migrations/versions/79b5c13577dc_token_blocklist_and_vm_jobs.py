@@ -0,0 +1,49 @@
+"""token blocklist and vm jobs
+
+Revision ID: 79b5c13577dc
+Revises: ef572bde2161
+Create Date: 2026-10-18 18:11:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '79b5c13577dc'
+down_revision = 'ef572bde2161'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('token_blocklist',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('jti', sa.String(length=36), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('jti')
+    )
+    op.create_index('ix_token_blocklist_expires_at', 'token_blocklist', ['expires_at'], unique=False)
+    op.create_table('vm_jobs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('ip', sa.String(length=45), nullable=True),
+    sa.Column('dns', sa.String(length=100), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_vm_jobs_status', 'vm_jobs', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_vm_jobs_status', table_name='vm_jobs')
+    op.drop_table('vm_jobs')
+    op.drop_index('ix_token_blocklist_expires_at', table_name='token_blocklist')
+    op.drop_table('token_blocklist')
@@ -0,0 +1,27 @@
+"""vm history keyset index
+
+Backs the keyset pagination of /api/azurevm/history, ordered by
+(created_at, id) within a user.
+
+Revision ID: 8b644c72d57d
+Revises: 79b5c13577dc
+Create Date: 2026-10-18 18:12:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b644c72d57d'
+down_revision = '79b5c13577dc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_virtualmachines_user_created_id', 'virtualmachines', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_virtualmachines_user_created_id', table_name='virtualmachines')
@@ -0,0 +1,44 @@
+"""credit transactions
+
+Append-only ledger of the credit changes. Every user with credits gets an
+opening_balance row so the ledger of a user adds up to its balance.
+
+Revision ID: a53c8d6d2562
+Revises: 0e7e3f660355
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a53c8d6d2562'
+down_revision = '0e7e3f660355'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('credit_transactions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('delta', sa.Integer(), nullable=False),
+    sa.Column('balance_after', sa.Integer(), nullable=False),
+    sa.Column('reason', sa.String(length=30), nullable=False),
+    sa.Column('reference', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_credit_transactions_user_id', 'credit_transactions', ['user_id', 'id'], unique=False)
+
+    op.execute(
+        "INSERT INTO credit_transactions (user_id, delta, balance_after, reason) "
+        "SELECT id, credits, credits, 'opening_balance' FROM users WHERE credits <> 0"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_credit_transactions_user_id', table_name='credit_transactions')
+    op.drop_table('credit_transactions')
@@ -0,0 +1,29 @@
+"""email outbox batch key
+
+Idempotency key of the batch an email was last sent in, so a batch that
+failed is claimed again as the same group of emails and with the same key.
+
+Revision ID: df1614d6b169
+Revises: 4ed640df7c83
+Create Date: 2026-10-18 22:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'df1614d6b169'
+down_revision = '4ed640df7c83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('email_outbox', sa.Column('batch_key', sa.String(length=64), nullable=True))
+    op.create_index('ix_email_outbox_batch_key', 'email_outbox', ['batch_key'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_email_outbox_batch_key', table_name='email_outbox')
+    op.drop_column('email_outbox', 'batch_key')
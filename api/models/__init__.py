@@ -2,4 +2,9 @@ from models.user_model import UserModel
 from models.locations_model import LocationModel
 from models.roles_model import RoleModel
 from models.invoices_model import InvoiceModel
-from models.virtualmachines_model import VirtualMachineModel
\ No newline at end of file
+from models.virtualmachines_model import VirtualMachineModel
+from models.token_blocklist_model import TokenBlocklistModel
+from models.vm_jobs_model import VmJobModel
+from models.email_outbox_model import EmailOutboxModel
+from models.credit_transactions_model import CreditTransactionModel
+from models.stripe_events_model import StripeEventModel
\ No newline at end of file
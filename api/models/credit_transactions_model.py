@@ -0,0 +1,18 @@
+from sqlalchemy.sql import func
+from database import db
+from sqlalchemy.orm import relationship
+
+class CreditTransactionModel(db.Model):
+    __tablename__ = "credit_transactions"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    balance_after = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(30), nullable=False)
+    reference = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    user = relationship("UserModel")
+
+
+db.Index('ix_credit_transactions_user_id', CreditTransactionModel.user_id, CreditTransactionModel.id)
@@ -0,0 +1,22 @@
+from sqlalchemy.sql import func
+from database import db
+
+class EmailOutboxModel(db.Model):
+    __tablename__ = "email_outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    dedup_key = db.Column(db.String(200), unique=True, nullable=False)
+    to_address = db.Column(db.String, nullable=False)
+    subject = db.Column(db.String, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default="pending", nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.String)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+    next_attempt_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+    claimed_at = db.Column(db.DateTime(timezone=True))
+    batch_key = db.Column(db.String(64))
+    sent_at = db.Column(db.DateTime(timezone=True))
+
+
+db.Index('ix_email_outbox_status_next_attempt', EmailOutboxModel.status, EmailOutboxModel.next_attempt_at)
+db.Index('ix_email_outbox_batch_key', EmailOutboxModel.batch_key)
@@ -4,6 +4,9 @@ from sqlalchemy.orm import relationship
 
 class InvoiceModel(db.Model):
     __tablename__ = "invoices"
+    __table_args__ = (
+        db.CheckConstraint("status IN ('pending', 'completed', 'failed', 'expired')", name='status_check'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     price = db.Column(db.Float)
     status = db.Column(db.String(20))
@@ -15,4 +18,4 @@ class InvoiceModel(db.Model):
 
 
 db.Index('ix_invoice_status', InvoiceModel.status)
-db.CheckConstraint(InvoiceModel.status.in_(['pending', 'completed', 'failed']), name='status_check')
+db.Index('ix_invoices_user_id', InvoiceModel.user_id)
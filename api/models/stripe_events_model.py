@@ -0,0 +1,17 @@
+from sqlalchemy.sql import func
+from database import db
+
+class StripeEventModel(db.Model):
+    __tablename__ = "stripe_events"
+    id = db.Column(db.String(255), primary_key=True)
+    type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default="pending", nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.String)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+    claimed_at = db.Column(db.DateTime(timezone=True))
+    processed_at = db.Column(db.DateTime(timezone=True))
+
+
+db.Index('ix_stripe_events_status', StripeEventModel.status)
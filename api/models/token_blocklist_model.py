@@ -0,0 +1,9 @@
+from sqlalchemy.sql import func
+from database import db
+
+class TokenBlocklistModel(db.Model):
+    __tablename__ = "token_blocklist"
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
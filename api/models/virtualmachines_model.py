@@ -9,6 +9,22 @@ class VirtualMachineModel(db.Model):
     name = db.Column(db.String(100))
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
     powered_off_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    poweroff_claimed_at = db.Column(db.DateTime(timezone=True), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
-    user = relationship("UserModel", back_populates="virtualmachines")
\ No newline at end of file
+    user = relationship("UserModel", back_populates="virtualmachines")
+
+db.Index('ix_virtualmachines_user_created_id', VirtualMachineModel.user_id, VirtualMachineModel.created_at, VirtualMachineModel.id)
+db.Index('ix_virtualmachines_name', VirtualMachineModel.name)
+db.Index(
+    'ix_virtualmachines_running',
+    VirtualMachineModel.user_id,
+    postgresql_where=VirtualMachineModel.powered_off_at.is_(None),
+    sqlite_where=VirtualMachineModel.powered_off_at.is_(None)
+)
+db.Index(
+    'ix_virtualmachines_powering_off',
+    VirtualMachineModel.poweroff_claimed_at,
+    postgresql_where=VirtualMachineModel.poweroff_claimed_at.is_not(None),
+    sqlite_where=VirtualMachineModel.poweroff_claimed_at.is_not(None)
+)
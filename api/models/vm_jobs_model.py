@@ -0,0 +1,29 @@
+from sqlalchemy.sql import func
+from database import db
+from sqlalchemy.orm import relationship
+
+class VmJobModel(db.Model):
+    __tablename__ = "vm_jobs"
+    id = db.Column(db.String(36), primary_key=True)
+    status = db.Column(db.String(20), default="queued", nullable=False)
+    ip = db.Column(db.String(45))
+    dns = db.Column(db.String(100))
+    error = db.Column(db.String)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    user = relationship("UserModel")
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'ip': self.ip,
+            'dns': self.dns,
+            'error': self.error,
+        }
+
+
+db.Index('ix_vm_jobs_status', VmJobModel.status)
@@ -0,0 +1,211 @@
+"""
+This file contains the HTTP client of the VM orchestrator (the blast-control
+API listening on port 4000). Every call goes through one keep-alive session
+with connect/read timeouts, idempotent calls are retried with jitter and a
+circuit breaker makes callers fail fast while the orchestrator is down.
+The calls running at once are capped by the outbound limiter.
+
+requests and the session are loaded on the first call, so every worker
+builds its own connection pool after the fork.
+"""
+from metrics import track_outbound
+from outbound import limiter, DependencyBusy
+import threading
+import random
+import time
+import os
+
+ORCHESTRATOR_URL = os.getenv("ORCHESTRATOR_URL", "http://biocloudlabs.es:4000")
+CONNECT_TIMEOUT = float(os.getenv("ORCHESTRATOR_CONNECT_TIMEOUT", 3))
+SETUP_TIMEOUT = float(os.getenv("ORCHESTRATOR_SETUP_TIMEOUT", 900))
+POWEROFF_TIMEOUT = float(os.getenv("ORCHESTRATOR_POWEROFF_TIMEOUT", 120))
+# Seconds a poweroff may wait for answers across all its attempts, it runs inside
+# a request and must end before the gunicorn worker timeout (120s)
+POWEROFF_BUDGET = float(os.getenv("ORCHESTRATOR_POWEROFF_BUDGET", 90))
+MAX_RETRIES = int(os.getenv("ORCHESTRATOR_MAX_RETRIES", 2))
+RETRY_BACKOFF = float(os.getenv("ORCHESTRATOR_RETRY_BACKOFF", 0.5))
+POOL_SIZE = int(os.getenv("ORCHESTRATOR_POOL_SIZE", 10))
+BREAKER_THRESHOLD = int(os.getenv("ORCHESTRATOR_BREAKER_THRESHOLD", 5))
+BREAKER_RESET = float(os.getenv("ORCHESTRATOR_BREAKER_RESET", 30))
+
+
+class OrchestratorError(Exception):
+    """The orchestrator answered but could not complete the operation."""
+
+
+class OrchestratorUnavailable(OrchestratorError):
+    """The orchestrator could not be reached or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures. While open every call is
+    rejected, after ``reset_timeout`` seconds a single trial call is let
+    through and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """
+        :return: True if a call may be attempted now.
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class OrchestratorClient:
+    """
+    Client of the orchestrator endpoints used by the API.
+    """
+
+    def __init__(self, base_url=ORCHESTRATOR_URL, max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF,
+                 pool_size=POOL_SIZE, breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """
+        Keep-alive session of the client, built on first use.
+        """
+        if self._session is None:
+            from requests.adapters import HTTPAdapter
+            import requests
+
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def setup(self):
+        """
+        Create a new VM. Not retried, a lost answer may still mean a VM was created.
+
+        :return: Orchestrator response with the ``dns`` and ``ip`` of the VM.
+        """
+        # Runs in the background, it waits for a slot as long as a setup may take
+        with track_outbound("orchestrator", "setup"):
+            return self._get("/vm/setup", (CONNECT_TIMEOUT, SETUP_TIMEOUT), idempotent=False, wait=SETUP_TIMEOUT)
+
+    def poweroff(self, vm_name):
+        """
+        Power off a VM. Safe to retry, the attempts share POWEROFF_BUDGET.
+
+        :param vm_name: VM name without the domain.
+        :return: Orchestrator response.
+        """
+        with track_outbound("orchestrator", "poweroff"):
+            return self._get(f"/vm/poweroff/{vm_name}", (CONNECT_TIMEOUT, POWEROFF_TIMEOUT), idempotent=True,
+                             budget=POWEROFF_BUDGET)
+
+    def _get(self, path, timeout, idempotent, wait=None, budget=None):
+        try:
+            with limiter.slot("orchestrator", wait):
+                return self._call(path, timeout, idempotent, budget)
+        except DependencyBusy as e:
+            raise OrchestratorUnavailable(str(e)) from e
+
+    def _call(self, path, timeout, idempotent, budget=None):
+        from requests import RequestException
+
+        if not self.breaker.allow():
+            raise OrchestratorUnavailable("The VM orchestrator is unavailable, please try again later.")
+
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        deadline = None if budget is None else time.monotonic() + budget
+        # Any outcome must reach the breaker, or a half-open trial would hold it forever
+        recorded = False
+
+        try:
+            for attempt in range(attempts):
+                if attempt:
+                    # Full jitter so retries from every worker do not line up
+                    time.sleep(random.uniform(0, self.retry_backoff * 2 ** (attempt - 1)))
+
+                attempt_timeout = timeout
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    # The read timeout is cut to what is left of the budget
+                    attempt_timeout = (timeout[0], min(timeout[1], remaining))
+
+                try:
+                    res = self.session.get(self.base_url + path, timeout=attempt_timeout)
+                except RequestException as e:
+                    error = e
+                    continue
+
+                if res.status_code >= 500:
+                    error = OrchestratorError(f"Orchestrator answered {res.status_code}")
+                    continue
+
+                self.breaker.record_success()
+                recorded = True
+
+                try:
+                    json_res = res.json()
+                except ValueError:
+                    raise OrchestratorError("Invalid response from the VM orchestrator.")
+
+                if json_res.get("code") == 500:
+                    raise OrchestratorError(json_res.get("message", "The VM orchestrator returned an error."))
+
+                return json_res
+
+            self.breaker.record_failure()
+            recorded = True
+            raise OrchestratorUnavailable(str(error)) from error
+        finally:
+            if not recorded:
+                self.breaker.record_failure()
+
+
+orchestrator = OrchestratorClient()
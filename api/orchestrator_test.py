@@ -0,0 +1,176 @@
+import pytest
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from orchestrator import (
+    CircuitBreaker,
+    OrchestratorClient,
+    OrchestratorError,
+    OrchestratorUnavailable
+)
+
+
+class StubOrchestrator(BaseHTTPRequestHandler):
+    """Local stand-in of the orchestrator API, driven by the server attributes."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        server.connections.add(self.client_address)
+
+        if server.failures_left > 0:
+            server.failures_left -= 1
+            self.reply(503, {"message": "Service unavailable"})
+            return
+
+        time.sleep(server.delay)
+
+        if self.path == "/vm/setup":
+            self.reply(200, server.setup_response)
+        else:
+            self.reply(200, {"message": "VM powered off"})
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOrchestrator)
+    server.requests = []
+    server.connections = set()
+    server.failures_left = 0
+    server.delay = 0
+    server.setup_response = {"dns": "vm1.westeurope.cloudapp.azure.com", "ip": "10.0.0.1"}
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(stub):
+    return OrchestratorClient(f"http://127.0.0.1:{stub.server_port}", retry_backoff=0.01,
+                              breaker=CircuitBreaker(threshold=2, reset_timeout=0.2))
+
+# Test setup returns the orchestrator answer
+def test_setup_correct(client, stub):
+    assert client.setup() == stub.setup_response
+
+# Test consecutive calls reuse the same keep-alive connection
+def test_connection_reused(client, stub):
+    for _ in range(5):
+        client.poweroff("vm1")
+    assert len(stub.requests) == 5
+    assert len(stub.connections) == 1
+
+# Test poweroff is retried after a server error
+def test_poweroff_retried(client, stub):
+    stub.failures_left = 2
+    assert client.poweroff("vm1") == {"message": "VM powered off"}
+    assert stub.requests == ["/vm/poweroff/vm1"] * 3
+
+# Test the poweroff attempts stop once their budget is spent
+def test_poweroff_budget(client, stub, monkeypatch):
+    monkeypatch.setattr("orchestrator.POWEROFF_BUDGET", 0.3)
+    stub.delay = 0.5
+
+    start = time.monotonic()
+    with pytest.raises(OrchestratorUnavailable):
+        client.poweroff("vm1")
+
+    assert time.monotonic() - start < 0.5
+    assert stub.requests == ["/vm/poweroff/vm1"]
+
+# Test setup is never retried since it is not idempotent
+def test_setup_not_retried(client, stub):
+    stub.failures_left = 1
+    with pytest.raises(OrchestratorUnavailable):
+        client.setup()
+    assert stub.requests == ["/vm/setup"]
+
+# Test an error answered by the orchestrator is raised
+def test_setup_error_code(client, stub):
+    stub.setup_response = {"code": 500, "message": "Azure quota exceeded"}
+    with pytest.raises(OrchestratorError, match="Azure quota exceeded"):
+        client.setup()
+
+# Test read timeout is bounded
+def test_read_timeout(stub, monkeypatch):
+    import orchestrator
+    monkeypatch.setattr(orchestrator, "SETUP_TIMEOUT", 0.1)
+    stub.delay = 0.5
+    client = OrchestratorClient(f"http://127.0.0.1:{stub.server_port}")
+
+    start = time.monotonic()
+    with pytest.raises(OrchestratorUnavailable):
+        client.setup()
+    assert time.monotonic() - start < 0.4
+
+# Test circuit breaker fails fast once open and recovers after the reset timeout
+def test_circuit_breaker(client, stub):
+    stub.failures_left = 100
+    for _ in range(2):
+        with pytest.raises(OrchestratorUnavailable):
+            client.setup()
+    assert client.breaker.state == "open"
+
+    requests_before = len(stub.requests)
+    with pytest.raises(OrchestratorUnavailable):
+        client.setup()
+    assert len(stub.requests) == requests_before
+
+    stub.failures_left = 0
+    time.sleep(0.25)
+    assert client.breaker.state == "half-open"
+    assert client.setup() == stub.setup_response
+    assert client.breaker.state == "closed"
+
+# Test an unexpected error during the half-open trial does not leave the breaker stuck
+def test_circuit_breaker_trial_error(client, stub, monkeypatch):
+    stub.failures_left = 100
+    for _ in range(2):
+        with pytest.raises(OrchestratorUnavailable):
+            client.setup()
+
+    time.sleep(0.25)
+    session = client.session
+    monkeypatch.setattr(session, "get", lambda *args, **kwargs: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        client.setup()
+    assert client.breaker.state == "open"
+
+    monkeypatch.undo()
+    stub.failures_left = 0
+    time.sleep(0.25)
+    assert client.setup() == stub.setup_response
+    assert client.breaker.state == "closed"
+
+# Test a dead orchestrator is reported as unavailable
+def test_connection_refused():
+    client = OrchestratorClient("http://127.0.0.1:9", max_retries=0)
+    with pytest.raises(OrchestratorUnavailable):
+        client.poweroff("vm1")
+
+# Test a call over the outbound limit is reported as unavailable without reaching the orchestrator
+def test_outbound_limit(client, stub, monkeypatch):
+    import orchestrator
+    from outbound import OutboundLimiter
+    monkeypatch.setattr(orchestrator, "limiter", OutboundLimiter({"orchestrator": 1}, wait=0))
+
+    with orchestrator.limiter.slot("orchestrator"):
+        with pytest.raises(OrchestratorUnavailable):
+            client.poweroff("vm1")
+
+    assert stub.requests == []
+    assert client.breaker.state == "closed"
+    client.poweroff("vm1")
@@ -0,0 +1,78 @@
+"""
+This file contains the concurrency limits of the calls to external services.
+Every dependency has its own slots in every worker, so a slow service only
+ever holds its share of the worker (threads, or greenlets and database
+connections in the gevent mode) and the calls to the other services and
+the requests that call none keep being served.
+
+A call waits up to OUTBOUND_WAIT seconds for a slot and then fails with
+DependencyBusy, which the callers answer as the service being unavailable.
+"""
+from contextlib import contextmanager
+import threading
+import os
+
+# Every default can be overridden with an environment variable such as
+# OUTBOUND_LIMIT_STRIPE=8. An empty value removes the limit.
+DEFAULT_LIMITS = {
+    # As many as the keep-alive connections of the orchestrator client
+    "orchestrator": "10",
+    "stripe": "8",
+    "resend": "4",
+}
+
+OUTBOUND_WAIT = float(os.getenv("OUTBOUND_WAIT", 5))
+
+
+class DependencyBusy(Exception):
+    """Every slot of the dependency stayed taken while the call waited."""
+
+
+def load_limits():
+    """
+    :return: Dict of dependency -> calls allowed at once.
+    """
+    limits = {}
+    for dependency, default in DEFAULT_LIMITS.items():
+        value = os.getenv(f"OUTBOUND_LIMIT_{dependency.upper()}", default)
+        if value:
+            limits[dependency] = int(value)
+    return limits
+
+
+class OutboundLimiter:
+    """
+    Cap of the calls to every dependency running at once in this worker.
+
+    :param limits: Dict of dependency -> calls allowed at once.
+    :param wait: Seconds a call waits for a slot.
+    """
+
+    def __init__(self, limits, wait=OUTBOUND_WAIT):
+        self.limits = dict(limits)
+        self.wait = wait
+        self._slots = {dependency: threading.BoundedSemaphore(limit) for dependency, limit in self.limits.items()}
+
+    @contextmanager
+    def slot(self, dependency, wait=None):
+        """
+        Run the block holding a slot of the dependency, a dependency without
+        a limit runs straight away.
+
+        :param dependency: Service called, such as ``stripe``.
+        :param wait: Seconds to wait for a slot, the limiter default if None.
+        """
+        slots = self._slots.get(dependency)
+        if slots is None:
+            yield
+            return
+
+        if not slots.acquire(timeout=self.wait if wait is None else wait):
+            raise DependencyBusy(f"Too many calls to {dependency} in progress, please try again later.")
+        try:
+            yield
+        finally:
+            slots.release()
+
+
+limiter = OutboundLimiter(load_limits())
@@ -0,0 +1,73 @@
+import threading
+import pytest
+from outbound import OutboundLimiter, DependencyBusy, load_limits
+
+# Test a dependency runs at most its limit of calls at once
+def test_limit():
+    limiter = OutboundLimiter({"stripe": 2}, wait=0)
+
+    with limiter.slot("stripe"), limiter.slot("stripe"):
+        with pytest.raises(DependencyBusy):
+            with limiter.slot("stripe"):
+                pass
+
+    with limiter.slot("stripe"):
+        pass
+
+# Test a full dependency does not take the slots of another one
+def test_dependencies_are_isolated():
+    limiter = OutboundLimiter({"orchestrator": 1, "stripe": 1}, wait=0)
+
+    with limiter.slot("orchestrator"):
+        with limiter.slot("stripe"):
+            pass
+
+# Test a dependency without limit is never rejected
+def test_unlimited_dependency():
+    limiter = OutboundLimiter({}, wait=0)
+
+    with limiter.slot("resend"), limiter.slot("resend"):
+        pass
+
+# Test a call waits for a slot released before its wait runs out
+def test_wait_for_slot():
+    limiter = OutboundLimiter({"stripe": 1}, wait=5)
+    taken = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with limiter.slot("stripe"):
+            taken.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    taken.wait()
+
+    threading.Timer(0.1, release.set).start()
+    with limiter.slot("stripe"):
+        pass
+
+    thread.join()
+
+# Test a slot is released when the call raises
+def test_release_on_error():
+    limiter = OutboundLimiter({"stripe": 1}, wait=0)
+
+    with pytest.raises(RuntimeError):
+        with limiter.slot("stripe"):
+            raise RuntimeError("boom")
+
+    with limiter.slot("stripe"):
+        pass
+
+# Test the limits are read from the environment and an empty value removes one
+def test_load_limits(monkeypatch):
+    monkeypatch.setenv("OUTBOUND_LIMIT_STRIPE", "3")
+    monkeypatch.setenv("OUTBOUND_LIMIT_RESEND", "")
+
+    limits = load_limits()
+
+    assert limits["stripe"] == 3
+    assert "resend" not in limits
+    assert limits["orchestrator"] == 10
@@ -0,0 +1,113 @@
+"""
+This file contains the password hashing policy of the API. The schemes and
+their cost are read from the environment, the first scheme hashes new
+passwords and the rest are only kept to verify existing hashes. A hash made
+with an older scheme or cost is replaced the next time its user logs in.
+
+argon2 needs the argon2-cffi package to be installed.
+
+Bulk registrations hash their passwords on a pool of HASH_PROCESSES
+processes, one per core by default. The processes are spawned, not forked,
+so they do not inherit the sockets, threads or gevent hub of the worker.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from cooperative import run_blocking
+import multiprocessing
+import os
+
+PASSWORD_SCHEMES = [scheme.strip() for scheme in os.getenv("PASSWORD_SCHEMES", "pbkdf2_sha256").split(",") if scheme.strip()]
+HASH_PROCESSES = int(os.getenv("HASH_PROCESSES", os.cpu_count() or 1))
+
+
+def make_context(schemes, pbkdf2_rounds=None, argon2_time_cost=None, argon2_memory_cost=None, argon2_parallelism=None):
+    """
+    Build a CryptContext that hashes with the first scheme and still verifies
+    pbkdf2_sha256, the scheme every existing hash was made with.
+
+    :param schemes: Scheme names, the first one is used for new hashes.
+    :param pbkdf2_rounds: Rounds of pbkdf2_sha256, the passlib default if None.
+    :param argon2_time_cost: Iterations of argon2.
+    :param argon2_memory_cost: Memory of argon2 in KiB.
+    :param argon2_parallelism: Threads of argon2.
+    :return: The CryptContext.
+    """
+    schemes = list(schemes)
+    if "pbkdf2_sha256" not in schemes:
+        schemes.append("pbkdf2_sha256")
+
+    settings = {
+        "pbkdf2_sha256__rounds": pbkdf2_rounds,
+        "argon2__time_cost": argon2_time_cost,
+        "argon2__memory_cost": argon2_memory_cost,
+        "argon2__parallelism": argon2_parallelism,
+    }
+
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        **{key: value for key, value in settings.items() if value is not None}
+    )
+
+
+def env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+pwd_context = make_context(
+    PASSWORD_SCHEMES,
+    pbkdf2_rounds=env_int("PBKDF2_ROUNDS"),
+    argon2_time_cost=env_int("ARGON2_TIME_COST"),
+    argon2_memory_cost=env_int("ARGON2_MEMORY_COST"),
+    argon2_parallelism=env_int("ARGON2_PARALLELISM")
+)
+
+
+def hash_password(password):
+    """
+    :param password: Plain password.
+    :return: Hash of the password with the current policy.
+    """
+    return run_blocking(pwd_context.hash, password)
+
+
+def verify_password(password, password_hash):
+    """
+    Check a password and tell if its hash must be upgraded.
+
+    :param password: Plain password.
+    :param password_hash: Stored hash.
+    :return: Tuple with the result and the new hash to store, None if the stored one is current.
+    """
+    return run_blocking(pwd_context.verify_and_update, password, password_hash)
+
+
+def hash_passwords(passwords, processes=None):
+    """
+    Hash many passwords at once, spread over a pool of processes. The pool
+    only lives for the call, a worker does not keep idle processes around.
+
+    :param passwords: Plain passwords.
+    :param processes: Processes of the pool, defaults to HASH_PROCESSES. With 1 they are hashed in place.
+    :return: List with the hash of every password, in the same order.
+    """
+    passwords = list(passwords)
+    processes = min(processes or HASH_PROCESSES, len(passwords))
+    if processes <= 1:
+        return [hash_password(password) for password in passwords]
+
+    return run_blocking(_hash_in_pool, passwords, processes)
+
+
+def _hash_in_pool(passwords, processes):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        # A few chunks per process keep them busy until the end without a round trip per password
+        chunksize = max(1, len(passwords) // (processes * 4))
+        return list(pool.map(_hash, passwords, chunksize=chunksize))
+
+
+def _hash(password):
+    # Runs in the processes of the pool, each one builds its own pwd_context on import
+    return pwd_context.hash(password)
@@ -0,0 +1,55 @@
+import pytest
+from passlib.hash import pbkdf2_sha256
+from database import db
+import models
+import passwords
+from passwords import make_context, hash_password, verify_password
+
+OLD_HASH = pbkdf2_sha256.using(rounds=1000).hash("Password123!")
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.add(models.UserModel(email="test@example.com", password=OLD_HASH, name="Test", surname="User", location_id=1))
+        db.session.commit()
+
+@pytest.fixture
+def policy(monkeypatch):
+    """Hash new passwords with 2000 pbkdf2 rounds."""
+    monkeypatch.setattr(passwords, "pwd_context", make_context(["pbkdf2_sha256"], pbkdf2_rounds=2000))
+
+# Test a hash with the current policy needs no update
+def test_verify_current_hash(policy):
+    assert verify_password("Password123!", hash_password("Password123!")) == (True, None)
+    assert verify_password("Wrong123!", hash_password("Password123!")) == (False, None)
+
+# Test a hash with fewer rounds is upgraded
+def test_verify_outdated_hash(policy):
+    verified, new_hash = verify_password("Password123!", OLD_HASH)
+    assert verified
+    assert pbkdf2_sha256.from_string(new_hash).rounds == 2000
+
+# Test hashes of the old scheme still verify when a new scheme is the default
+def test_verify_deprecated_scheme():
+    context = make_context(["sha256_crypt"])
+    assert context.identify(context.hash("Password123!")) == "sha256_crypt"
+    assert context.verify("Password123!", OLD_HASH)
+    assert context.needs_update(OLD_HASH)
+
+# Test the login stores the upgraded hash
+def test_login_rehash(app, client, policy):
+    response = client.post('/api/user/login', json={"email": "test@example.com", "password": "Password123!"})
+    assert response.status_code == 200
+
+    with app.app_context():
+        stored = models.UserModel.query.one().password
+    assert stored != OLD_HASH
+    assert pbkdf2_sha256.from_string(stored).rounds == 2000
+
+# Test a failed login keeps the stored hash
+def test_login_wrong_password(app, client, policy):
+    response = client.post('/api/user/login', json={"email": "test@example.com", "password": "Wrong1234!"})
+    assert response.status_code == 401
+
+    with app.app_context():
+        assert models.UserModel.query.one().password == OLD_HASH
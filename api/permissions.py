@@ -0,0 +1,58 @@
+"""
+This file contains the role checks of the API. Roles are stored in the roles
+table, the admin role is the one named "admin". The checks use the user the
+request already resolved with ``current_user`` and compare its role id with
+the id of the admin role, which every worker keeps for ROLE_CACHE_TTL
+seconds, so a check costs no query.
+"""
+from flask_jwt_extended import jwt_required, current_user
+from flask_smorest import abort
+from sqlalchemy import select
+from cache_utils import TTLCache
+from functools import wraps
+from database import db
+import models
+import os
+
+ADMIN_ROLE = "admin"
+
+ROLE_CACHE_TTL = float(os.getenv("ROLE_CACHE_TTL", 300))
+
+role_ids_cache = TTLCache(ROLE_CACHE_TTL)
+
+
+def role_id(name):
+    """
+    :param name: Name of the role.
+    :return: Id of the role, None if it does not exist.
+    """
+    cached = role_ids_cache.get(name)
+    if cached is not None:
+        return cached
+
+    cached = db.session.scalar(select(models.RoleModel.id).where(models.RoleModel.name == name))
+    if cached is not None:
+        role_ids_cache.set(name, cached)
+    return cached
+
+
+def is_admin(user):
+    """
+    :param user: User of the request, as loaded in ``current_user``.
+    :return: True if there is a user and it has the admin role.
+    """
+    return user is not None and user.role_id == role_id(ADMIN_ROLE)
+
+
+def admin_required(fn):
+    """
+    Decorator that only lets through requests with a valid access token of an
+    admin, other users get a 403.
+    """
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if not is_admin(current_user):
+            abort(403, message="Admin role required.")
+        return fn(*args, **kwargs)
+    return wrapper
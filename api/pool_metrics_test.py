@@ -0,0 +1,98 @@
+import threading
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from database import db, engine_options, pool_stats, InstrumentedQueuePool, POOL_CHECKOUT_WAIT
+from metrics import Histogram
+from controllers import internal
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db", poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.2)
+    yield engine
+    engine.dispose()
+
+# Test the histogram buckets are cumulative
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 5):
+        histogram.observe(seconds)
+
+    assert histogram.snapshot() == {"buckets": {"0.1": 1, "1.0": 3, "+Inf": 4}, "count": 4, "sum": 6.05}
+
+# Test the pool options are read from the environment and skipped on SQLite
+def test_engine_options(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "7")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+
+    options = engine_options("postgresql://user:password@db/biocloudlabs")
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["pool_size"] == 3
+    assert options["max_overflow"] == 7
+    assert options["pool_pre_ping"] is False
+    assert options["pool_recycle"] == 1800
+
+    assert engine_options("sqlite:///test.db") == {}
+
+# Test the checkouts are timed and the in-use connections counted
+def test_pool_stats(engine):
+    before = POOL_CHECKOUT_WAIT.snapshot()["count"]
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        stats = pool_stats(engine)
+        assert stats["checked_out"] == 1
+        assert stats["size"] == 1
+
+    stats = pool_stats(engine)
+    assert stats["checked_out"] == 0
+    assert stats["checked_in"] == 1
+    assert stats["checkout_wait_seconds"]["count"] == before + 1
+
+# Test a checkout that gives up waiting is counted as a timeout
+def test_pool_timeout(engine):
+    timeouts = InstrumentedQueuePool.timeouts
+    errors = []
+
+    def checkout():
+        try:
+            with engine.connect():
+                pass
+        except PoolTimeoutError as e:
+            errors.append(e)
+
+    with engine.connect():
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        thread.join()
+
+    assert len(errors) == 1
+    assert InstrumentedQueuePool.timeouts == timeouts + 1
+    assert POOL_CHECKOUT_WAIT.snapshot()["sum"] >= 0.2
+
+# Test the pool endpoint is only served locally or with the metrics token
+def test_pool_endpoint(app, client, monkeypatch):
+    with app.app_context():
+        response = client.get('/api/internal/pool')
+        assert response.status_code == 200
+        assert "checkout_wait_seconds" in response.json
+
+        assert client.get('/api/internal/pool', environ_base={"REMOTE_ADDR": "10.0.0.8"}).status_code == 404
+
+        monkeypatch.setattr(internal, "METRICS_TOKEN", "scrape-token")
+        assert client.get('/api/internal/pool').status_code == 404
+        response = client.get('/api/internal/pool', headers={"Authorization": "Bearer scrape-token"},
+                              environ_base={"REMOTE_ADDR": "10.0.0.8"})
+        assert response.status_code == 200
+
+# Test the metrics endpoint answers in the Prometheus text format
+def test_metrics_endpoint(app, client):
+    with app.app_context():
+        response = client.get('/api/internal/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain")
+        assert b"db_pool_checkout_wait_seconds_count" in response.data
+
+        assert client.get('/api/internal/metrics', environ_base={"REMOTE_ADDR": "10.0.0.8"}).status_code == 404
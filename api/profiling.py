@@ -0,0 +1,261 @@
+"""
+This file contains the opt-in request profiler. A request is profiled when an
+admin sends the X-Profile header, or at random with PROFILE_SAMPLE_RATE.
+A profiled request records a cProfile of its handler and every SQL statement
+it ran with its duration.
+
+Requests profiled through the header are always kept and answer with an
+X-Profile-Id header. Sampled requests are only kept when they are slower than
+PROFILE_SLOW_MS. Kept profiles are written as JSON files to PROFILE_DIR, which
+keeps the last PROFILE_RING_SIZE of them, and are read back by the admins
+through the profiles endpoint.
+
+cProfile can only run once per process at a time, so a request arriving while
+another one of the worker is being profiled runs without the profiler.
+"""
+from flask_jwt_extended import verify_jwt_in_request, get_current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from datetime import datetime, timezone
+from permissions import is_admin
+from flask import request
+import threading
+import tempfile
+import cProfile
+import pstats
+import random
+import uuid
+import json
+import time
+import re
+import os
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 1000))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "biocloudlabs_profiles"))
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", 50))
+# Functions of the profile kept in the record, by cumulative time
+PROFILE_TOP_FUNCTIONS = 40
+# SQL statements kept in the record and characters kept of every statement
+PROFILE_MAX_STATEMENTS = 500
+PROFILE_STATEMENT_LENGTH = 2000
+
+PROFILE_ID = re.compile(r"^\d+-[0-9a-f]{8}$")
+
+
+class ProfileStore:
+    """
+    Ring buffer of profiles on disk, shared by every worker of the host. The
+    file names start with the time they were written, the oldest files are
+    deleted once the folder holds more than ``size`` of them.
+
+    :param directory: Folder of the profiles.
+    :param size: Profiles kept.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, size=PROFILE_RING_SIZE):
+        self.directory = directory
+        self.size = size
+
+    def save(self, profile_id, record):
+        """
+        :param profile_id: Id from new_profile_id().
+        :param record: Profile to store.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = os.path.join(self.directory, f"{profile_id}.json")
+
+        # Written aside and renamed, so a reader never sees half a profile
+        with open(path + ".tmp", "w") as file:
+            json.dump({"id": profile_id, **record}, file)
+        os.replace(path + ".tmp", path)
+
+        for stale in self._ids()[:-self.size]:
+            try:
+                os.remove(os.path.join(self.directory, f"{stale}.json"))
+            except FileNotFoundError:
+                # Another worker pruned it first
+                pass
+
+    def get(self, profile_id):
+        """
+        :param profile_id: Id of the profile.
+        :return: The profile or None if it is not in the buffer anymore.
+        """
+        if not PROFILE_ID.match(profile_id):
+            return None
+
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json")) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def list(self):
+        """
+        :return: Summary of every stored profile, newest first.
+        """
+        summaries = []
+        for profile_id in reversed(self._ids()):
+            record = self.get(profile_id)
+            if record is not None:
+                summaries.append({key: record[key] for key in
+                                  ("id", "started_at", "method", "path", "endpoint", "status", "duration_ms", "trigger")})
+        return summaries
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json") and PROFILE_ID.match(name[:-5]))
+
+
+def new_profile_id():
+    """
+    :return: Id of a new profile, ids sort in the order they were made.
+    """
+    return f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+
+
+store = ProfileStore()
+
+# cProfile allows one active profiler per process
+_profiler_lock = threading.Lock()
+# SQL statements of the request being profiled on this thread
+_active = threading.local()
+
+
+class RequestProfile:
+    def __init__(self, trigger):
+        self.id = new_profile_id()
+        self.trigger = trigger
+        self.profiler = cProfile.Profile()
+        self.statements = []
+        self.status = None
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+
+
+def requested_by_admin():
+    """
+    :return: True if the request carries the profile header and an admin access token.
+    """
+    if request.headers.get(PROFILE_HEADER) != "1":
+        return False
+
+    try:
+        verify_jwt_in_request(optional=True)
+        user = get_current_user()
+    except Exception:
+        return False
+
+    return is_admin(user)
+
+
+def start_profile():
+    if requested_by_admin():
+        trigger = "header"
+    elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        trigger = "sample"
+    else:
+        return
+
+    if not _profiler_lock.acquire(blocking=False):
+        return
+
+    profile = RequestProfile(trigger)
+    request.environ["profiling.profile"] = profile
+    _active.statements = profile.statements
+    profile.profiler.enable()
+
+
+def tag_profile(response):
+    profile = request.environ.get("profiling.profile")
+    if profile is not None:
+        profile.status = response.status_code
+        if profile.trigger == "header":
+            response.headers["X-Profile-Id"] = profile.id
+    return response
+
+
+def finish_profile(exception):
+    profile = request.environ.pop("profiling.profile", None)
+    if profile is None:
+        return
+
+    try:
+        profile.profiler.disable()
+    finally:
+        _active.statements = None
+        _profiler_lock.release()
+
+    duration_ms = (time.perf_counter() - profile.start) * 1000
+    if profile.trigger == "sample" and duration_ms < PROFILE_SLOW_MS:
+        return
+
+    store.save(profile.id, {
+        "started_at": profile.started_at.isoformat(),
+        "method": request.method,
+        # Without the query string, it may carry a token
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": profile.status or 500,
+        "duration_ms": round(duration_ms, 3),
+        "trigger": profile.trigger,
+        "sql": profile.statements,
+        "functions": top_functions(profile.profiler),
+    })
+
+
+def top_functions(profiler, limit=PROFILE_TOP_FUNCTIONS):
+    """
+    :param profiler: Disabled profiler.
+    :param limit: Functions to keep.
+    :return: The functions with the highest cumulative time.
+    """
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (file_name, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{file_name}:{line}({name})",
+            "calls": calls,
+            "total_ms": round(total * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:limit]
+
+
+def start_statement(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_active, "statements", None) is not None:
+        conn.info["profiling_statement_start"] = time.perf_counter()
+
+
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("profiling_statement_start", None)
+    statements = getattr(_active, "statements", None)
+    if start is None or statements is None or len(statements) >= PROFILE_MAX_STATEMENTS:
+        return
+
+    statements.append({
+        "statement": statement[:PROFILE_STATEMENT_LENGTH],
+        "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+    })
+
+
+def init_profiling(app):
+    """
+    Register the profiler on the requests of the app and the queries of every engine.
+
+    :param app: Flask app to profile.
+    """
+    app.before_request(start_profile)
+    app.after_request(tag_profile)
+    app.teardown_request(finish_profile)
+
+    if not event.contains(Engine, "before_cursor_execute", start_statement):
+        event.listen(Engine, "before_cursor_execute", start_statement)
+        event.listen(Engine, "after_cursor_execute", record_statement)
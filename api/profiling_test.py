@@ -0,0 +1,79 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from database import db
+import models
+import profiling
+from profiling import ProfileStore
+
+def slow():
+    return {"users": models.UserModel.query.count()}
+
+@pytest.fixture(autouse=True)
+def database(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "store", ProfileStore(str(tmp_path), size=3))
+    monkeypatch.setattr("controllers.profiles.store", profiling.store)
+    app.add_url_rule("/api/slow", view_func=slow)
+    with app.app_context():
+        db.session.add(models.UserModel(id=1, email="user1@example.com", password="x", name="Test", surname="User",
+                                        location_id=1, role_id=1))
+        db.session.add(models.UserModel(id=2, email="admin@example.com", password="x", name="Test", surname="Admin",
+                                        location_id=1, role_id=3))
+        db.session.commit()
+
+def auth(app, user_id):
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+# Test an admin gets the profile of a request sent with the profile header
+def test_admin_profile(app, client):
+    response = client.get("/api/slow?token=secret", headers={"X-Profile": "1", **auth(app, 2)})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    response = client.get(f"/api/profiles/{profile_id}", headers=auth(app, 2))
+    assert response.status_code == 200
+    profile = response.json
+    assert profile["trigger"] == "header"
+    assert profile["path"] == "/api/slow"
+    assert profile["status"] == 200
+    assert any("FROM users" in query["statement"] for query in profile["sql"])
+    assert any("slow" in function["function"] for function in profile["functions"])
+
+    assert client.get("/api/profiles/", headers=auth(app, 2)).json["profiles"][0]["id"] == profile_id
+
+# Test the profile header is ignored for other users
+def test_header_needs_admin(app, client):
+    for headers in ({"X-Profile": "1", **auth(app, 1)}, {"X-Profile": "1"}):
+        response = client.get("/api/slow", headers=headers)
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+
+    assert profiling.store.list() == []
+
+# Test sampled requests are only kept when they are slow
+def test_sampled_requests(client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+
+    monkeypatch.setattr(profiling, "PROFILE_SLOW_MS", 60000)
+    client.get("/api/slow")
+    assert profiling.store.list() == []
+
+    monkeypatch.setattr(profiling, "PROFILE_SLOW_MS", 0)
+    response = client.get("/api/slow")
+    assert "X-Profile-Id" not in response.headers
+    profiles = profiling.store.list()
+    assert len(profiles) == 1
+    assert profiles[0]["trigger"] == "sample"
+
+# Test the ring buffer keeps the newest profiles
+def test_ring_buffer(app, client):
+    ids = [client.get("/api/slow", headers={"X-Profile": "1", **auth(app, 2)}).headers["X-Profile-Id"] for _ in range(5)]
+
+    assert [profile["id"] for profile in profiling.store.list()] == ids[:1:-1]
+    assert client.get(f"/api/profiles/{ids[0]}", headers=auth(app, 2)).status_code == 404
+
+# Test only admins can read the profiles
+def test_profiles_admin_only(app, client):
+    assert client.get("/api/profiles/", headers=auth(app, 1)).status_code == 403
+    assert client.get("/api/profiles/").status_code == 401
+    assert client.get("/api/profiles/..%2Fsecret", headers=auth(app, 2)).status_code == 404
@@ -0,0 +1,109 @@
+import os
+import re
+import pytest
+from datetime import datetime, timezone, timedelta
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, text
+from database import db
+import models
+from credit_sweeper import find_overdrawn_vms
+
+HOT_TABLES = ("virtualmachines", "invoices")
+USERS = 200
+VMS_PER_USER = 10
+INVOICES_PER_USER = 5
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Runs against SQLite by default, point it to Postgres to check the real planner
+@pytest.fixture
+def app_config():
+    return {"SQLALCHEMY_DATABASE_URI": os.getenv("QUERY_PLAN_DATABASE_URI", "sqlite://")}
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.execute(models.UserModel.__table__.insert(), [
+            {"id": user_id, "email": f"user{user_id}@example.com", "password": "x", "name": "Test",
+             "surname": str(user_id), "credits": 100, "location_id": 1, "role_id": 1}
+            for user_id in range(1, USERS + 1)
+        ])
+        # Most VMs are powered off, only the last one of every user is running
+        db.session.execute(models.VirtualMachineModel.__table__.insert(), [
+            {"name": f"vm{user_id}-{i}.westeurope.cloudapp.azure.com", "user_id": user_id,
+             "created_at": START + timedelta(hours=i),
+             "powered_off_at": None if i == VMS_PER_USER - 1 else START + timedelta(hours=i, minutes=30)}
+            for user_id in range(1, USERS + 1) for i in range(VMS_PER_USER)
+        ])
+        db.session.execute(models.InvoiceModel.__table__.insert(), [
+            {"price": 3.99, "status": "completed", "credits": 100, "user_id": user_id}
+            for user_id in range(1, USERS + 1) for _ in range(INVOICES_PER_USER)
+        ])
+        db.session.commit()
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+
+@pytest.fixture
+def statements(app):
+    """Record the SELECTs run on the hot tables while the test runs."""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and any(t in statement for t in HOT_TABLES):
+            captured.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield captured
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+def sequential_scans(app, statement, parameters):
+    """Tables of the hot set the planner reads without an index."""
+    with app.app_context():
+        connection = db.session.connection()
+        if connection.dialect.name == "sqlite":
+            plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            scans = [re.match(r"SCAN (\w+)$", line) for line in plan]
+        else:
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            plan = [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)]
+            scans = [re.search(r"Seq Scan on (\w+)", line) for line in plan]
+        db.session.rollback()
+
+    return [scan.group(1) for scan in scans if scan and scan.group(1) in HOT_TABLES]
+
+def assert_no_sequential_scans(app, statements):
+    assert statements
+    for statement, parameters in statements:
+        assert sequential_scans(app, statement, parameters) == [], statement
+
+def headers(app, user_id):
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+
+# Test the history pages are read through an index
+def test_history_plan(app, client, statements):
+    response = client.get('/api/azurevm/history?limit=3', headers=headers(app, 7))
+    assert response.status_code == 200
+    client.get(f'/api/azurevm/history?limit=3&cursor={response.json["next_cursor"]}', headers=headers(app, 7))
+    client.get('/api/azurevm/history?running=true', headers=headers(app, 7))
+    assert_no_sequential_scans(app, statements)
+
+# Test the VM of a credits check is found through an index
+def test_check_credits_plan(app, client, statements):
+    response = client.get('/api/azurevm/check/vm7-0.westeurope.cloudapp.azure.com')
+    assert response.json == {"message": "VM Already Powered off"}
+    assert_no_sequential_scans(app, statements)
+
+# Test the sweeper reads only the running VMs
+def test_running_vms_plan(app, statements):
+    with app.app_context():
+        overdrawn, running = find_overdrawn_vms(START + timedelta(hours=VMS_PER_USER))
+    assert running == USERS
+    assert_no_sequential_scans(app, statements)
+
+# Test the invoices of a user are read through an index
+def test_user_invoices_plan(app, statements):
+    with app.app_context():
+        assert len(db.session.get(models.UserModel, 7).invoices) == INVOICES_PER_USER
+    assert_no_sequential_scans(app, statements)
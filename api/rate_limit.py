@@ -0,0 +1,228 @@
+"""
+This file contains the throttling of the credential endpoints. Every hash
+verification costs a full PBKDF2 run, so a burst of logins can use up the CPU
+of every worker. Two mechanisms protect them:
+
+- Token buckets keyed by client IP and by account, refilled at a fixed rate.
+  The storage is chosen with the RATE_LIMIT_BACKEND environment variable:
+  ``memory`` keeps the buckets in the worker (every worker has its own), and
+  ``redis`` shares them between every worker through RATE_LIMIT_REDIS_URL.
+- A cap of MAX_CONCURRENT_HASHES password hashes running at once in a worker.
+  A request over the cap is rejected straight away instead of waiting.
+
+Both answer 429 with a Retry-After header.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask_smorest import abort
+from flask import current_app
+import threading
+import math
+import time
+import os
+
+MEMORY_BUCKETS = int(os.getenv("RATE_LIMIT_MEMORY_BUCKETS", 100000))
+MAX_CONCURRENT_HASHES = int(os.getenv("MAX_CONCURRENT_HASHES", 2))
+
+# Limits as "requests/seconds", the bucket holds ``requests`` tokens and
+# refills completely in ``seconds``.
+DEFAULT_LIMITS = {
+    ("login", "ip"): "20/60",
+    ("login", "email"): "5/60",
+    ("register", "ip"): "5/300",
+    ("change-password", "ip"): "10/60",
+    ("change-password", "user"): "5/60",
+    ("recover-password-email", "ip"): "5/300",
+    ("recover-password-email", "email"): "3/3600",
+}
+
+
+def parse_limit(value):
+    """
+    :param value: Limit as "requests/seconds".
+    :return: Tuple with the bucket capacity and its refill rate in tokens per second.
+    """
+    requests, seconds = value.split("/")
+    return int(requests), int(requests) / float(seconds)
+
+
+def load_limits():
+    """
+    Read the limits, every default can be overridden with an environment
+    variable such as RATE_LIMIT_LOGIN_IP=20/60. An empty value disables it.
+
+    :return: Dict of (endpoint, key kind) -> (capacity, refill rate).
+    """
+    limits = {}
+    for (endpoint, kind), default in DEFAULT_LIMITS.items():
+        name = f"RATE_LIMIT_{endpoint.replace('-', '_').upper()}_{kind.upper()}"
+        value = os.getenv(name, default)
+        if value:
+            limits[(endpoint, kind)] = parse_limit(value)
+    return limits
+
+
+class MemoryRateLimitBackend:
+    """
+    Buckets kept in the current process. The least recently used bucket is
+    dropped beyond ``maxsize`` keys, which only forgives that client.
+    """
+
+    def __init__(self, maxsize=MEMORY_BUCKETS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return retry_after == 0.0, retry_after
+
+
+class RedisRateLimitBackend:
+    """
+    Buckets stored as Redis hashes and updated by a Lua script, so the read,
+    refill and take of a token are atomic between every worker. A bucket
+    expires once it would be full again.
+    """
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+    return tostring(retry_after)
+    """
+
+    def __init__(self, client, prefix="ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, rate, now):
+        retry_after = float(self._script(keys=[self.prefix + key], args=[capacity, rate, now]))
+        return retry_after == 0.0, retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket limits of the credential endpoints.
+
+    :param backend: Storage of the buckets.
+    :param limits: Dict of (endpoint, key kind) -> (capacity, refill rate).
+    """
+
+    def __init__(self, backend, limits=None):
+        self.backend = backend
+        self.limits = load_limits() if limits is None else limits
+
+    def check(self, endpoint, **keys):
+        """
+        Take a token from the bucket of every key with a limit.
+
+        :param endpoint: Endpoint name used in the limits.
+        :param keys: Keys of the request by kind, such as ``ip`` or ``email``.
+        :return: Seconds to wait before retrying, 0 if the request is allowed.
+        """
+        now = time.time()
+        retry_after = 0.0
+
+        for kind, value in keys.items():
+            limit = self.limits.get((endpoint, kind))
+            if limit is None or value is None:
+                continue
+
+            allowed, wait = self.backend.consume(f"{endpoint}:{kind}:{str(value).lower()}", *limit, now)
+            if not allowed:
+                retry_after = max(retry_after, wait)
+
+        return retry_after
+
+    def enforce(self, endpoint, **keys):
+        """
+        Abort the request with 429 if any of its buckets is empty. Setting
+        RATE_LIMIT_ENABLED to False in the app config turns the limits off.
+
+        :param endpoint: Endpoint name used in the limits.
+        :param keys: Keys of the request by kind, such as ``ip`` or ``email``.
+        """
+        if not current_app.config.get("RATE_LIMIT_ENABLED", True):
+            return
+
+        retry_after = self.check(endpoint, **keys)
+        if retry_after:
+            abort(429, message="Too many requests, please try again later.",
+                  headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+class HashAdmission:
+    """
+    Cap of password hashes computed at once by this worker.
+
+    :param limit: Hashes allowed at once.
+    """
+
+    def __init__(self, limit=MAX_CONCURRENT_HASHES):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+
+    @contextmanager
+    def slot(self):
+        """
+        Run the block holding a hash slot, or abort with 429 if every slot
+        is taken.
+        """
+        if not self._slots.acquire(blocking=False):
+            abort(429, message="The server is busy, please try again.", headers={"Retry-After": "1"})
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+def create_rate_limiter(backend_name=None):
+    """
+    Build the rate limiter for the backend configured in the environment.
+
+    :param backend_name: Backend name, defaults to RATE_LIMIT_BACKEND.
+    :return: A RateLimiter instance.
+    """
+    backend_name = backend_name or os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+    match backend_name:
+        case "memory":
+            return RateLimiter(MemoryRateLimitBackend())
+        case "redis":
+            import redis
+            client = redis.Redis.from_url(os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0"))
+            return RateLimiter(RedisRateLimitBackend(client))
+
+    raise ValueError(f"Unknown rate limit backend: {backend_name}")
+
+
+RATE_LIMITER = create_rate_limiter()
+HASH_ADMISSION = HashAdmission()
@@ -0,0 +1,107 @@
+import os
+import pytest
+from passlib.hash import pbkdf2_sha256
+from database import db
+import models
+from controllers import user as user_controller
+from rate_limit import (
+    MemoryRateLimitBackend, RedisRateLimitBackend, RateLimiter, HashAdmission, parse_limit
+)
+
+@pytest.fixture
+def app_config():
+    return {"RATE_LIMIT_ENABLED": True}
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.add(models.UserModel(email="test@example.com", password=pbkdf2_sha256.using(rounds=1000).hash("Password123!"),
+                                        name="Test", surname="User", location_id=1))
+        db.session.commit()
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Allow 3 logins per IP and 2 per email, refilled in a minute."""
+    limiter = RateLimiter(MemoryRateLimitBackend(), {
+        ("login", "ip"): parse_limit("3/60"),
+        ("login", "email"): parse_limit("2/60"),
+    })
+    monkeypatch.setattr(user_controller, "RATE_LIMITER", limiter)
+    return limiter
+
+def login(client, email="test@example.com", password="Password123!"):
+    return client.post('/api/user/login', json={"email": email, "password": password})
+
+# Test the bucket empties and refills over time
+def test_memory_bucket():
+    backend = MemoryRateLimitBackend()
+    capacity, rate = parse_limit("2/10")
+
+    assert backend.consume("key", capacity, rate, now=100) == (True, 0.0)
+    assert backend.consume("key", capacity, rate, now=100) == (True, 0.0)
+    allowed, retry_after = backend.consume("key", capacity, rate, now=100)
+    assert not allowed
+    assert retry_after == pytest.approx(5)
+
+    # Half a token back after 2.5 seconds, a whole one after 5
+    assert backend.consume("key", capacity, rate, now=102.5)[0] is False
+    assert backend.consume("key", capacity, rate, now=110)[0] is True
+
+# Test the memory backend keeps a bounded number of buckets
+def test_memory_bucket_bounded():
+    backend = MemoryRateLimitBackend(maxsize=2)
+    for key in ("a", "b", "c"):
+        backend.consume(key, 1, 1, now=0)
+    assert list(backend._buckets) == ["b", "c"]
+
+# Test the login is limited by email whatever the IP
+def test_login_limited_by_email(client, limiter):
+    assert login(client).status_code == 200
+    assert login(client, password="Wrong1234!").status_code == 401
+
+    response = login(client)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) == 30
+
+# Test the login is limited by IP whatever the email
+def test_login_limited_by_ip(client, limiter):
+    for i in range(3):
+        assert login(client, email=f"user{i}@example.com").status_code == 401
+    assert login(client, email="user3@example.com").status_code == 429
+
+# Test a request over the hash cap is rejected instead of queued
+def test_hash_admission(client, monkeypatch):
+    admission = HashAdmission(limit=1)
+    monkeypatch.setattr(user_controller, "HASH_ADMISSION", admission)
+
+    # Another request is hashing
+    admission._slots.acquire()
+    response = login(client)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+    admission._slots.release()
+    assert login(client).status_code == 200
+    # The slot of the login is released
+    assert admission._slots.acquire(blocking=False)
+
+# Test the limits can be turned off from the app config
+def test_rate_limit_disabled(app, client, limiter):
+    app.config["RATE_LIMIT_ENABLED"] = False
+    for _ in range(5):
+        assert login(client).status_code == 200
+
+# Test the redis buckets are shared, only against a real server
+@pytest.mark.skipif(not os.getenv("RATE_LIMIT_TEST_REDIS_URL"), reason="RATE_LIMIT_TEST_REDIS_URL not set")
+def test_redis_bucket():
+    import redis
+    client = redis.Redis.from_url(os.getenv("RATE_LIMIT_TEST_REDIS_URL"))
+    client.delete("ratelimit-test:key")
+    worker_1 = RedisRateLimitBackend(client, prefix="ratelimit-test:")
+    worker_2 = RedisRateLimitBackend(client, prefix="ratelimit-test:")
+
+    assert worker_1.consume("key", 1, 0.1, now=100) == (True, 0.0)
+    allowed, retry_after = worker_2.consume("key", 1, 0.1, now=100)
+    assert not allowed
+    assert retry_after == pytest.approx(10)
+    assert client.pttl("ratelimit-test:key") > 0
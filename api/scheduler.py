@@ -0,0 +1,61 @@
+"""
+This file contains the background scheduler shared by the API. It runs the
+slow work (VM provisioning, periodic maintenance) on a thread pool so that
+requests never wait for it.
+
+Every worker starts its own scheduler once it serves: its threads would not
+survive the fork if the gunicorn master started it while preloading the app.
+"""
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
+import threading
+import os
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+
+scheduler = BackgroundScheduler(
+    executors={"default": ThreadPoolExecutor(JOB_WORKERS)},
+    job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 60},
+    timezone="UTC"
+)
+
+_periodic_jobs = []
+_start_lock = threading.Lock()
+
+
+def periodic_job(seconds):
+    """
+    Decorator that registers a function to run every ``seconds`` seconds once
+    the scheduler is started. The function receives the Flask app.
+
+    :param seconds: Interval between runs, 0 or less disables the job.
+    """
+    def decorator(func):
+        if seconds > 0:
+            _periodic_jobs.append((func, seconds))
+        return func
+    return decorator
+
+
+def init_scheduler(app):
+    """
+    Start the scheduler of this process and register the periodic jobs,
+    unless SCHEDULER_ENABLED is false in the app config.
+
+    :param app: Flask app the jobs run against.
+    """
+    with _start_lock:
+        if scheduler.running or not app.config.get("SCHEDULER_ENABLED", True):
+            return
+
+        for func, seconds in _periodic_jobs:
+            scheduler.add_job(
+                func,
+                "interval",
+                seconds=seconds,
+                args=[app],
+                id=f"{func.__module__}.{func.__name__}",
+                replace_existing=True
+            )
+
+        scheduler.start()
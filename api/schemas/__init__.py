@@ -1,4 +1,5 @@
 from schemas.user_password_schema import UserPasswordSchema
 from schemas.user_schema import UserSchema
 from schemas.invoice_schema import InvoiceSchema
-from schemas.vm_schema import VmSchema
\ No newline at end of file
+from schemas.vm_schema import VmSchema
+from schemas.vm_history_schema import VmHistoryQuerySchema
\ No newline at end of file
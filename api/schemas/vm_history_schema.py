@@ -0,0 +1,8 @@
+from marshmallow import Schema, fields, validate
+
+class VmHistoryQuerySchema(Schema):
+    limit = fields.Integer(load_default=50, validate=validate.Range(min=1, max=200))
+    cursor = fields.Str()
+    running = fields.Boolean()
+    created_from = fields.DateTime()
+    created_to = fields.DateTime()
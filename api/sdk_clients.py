@@ -0,0 +1,36 @@
+"""
+This file contains the SDKs of the external services. They are imported and
+given their API key on first use, so importing the app (or preloading it in
+the gunicorn master) never loads them and a worker that never calls a
+service does not pay for it.
+
+The keys are read when the SDK is first used, after the app has loaded the
+.env file.
+"""
+import os
+
+_sdks = {}
+
+
+def stripe_sdk():
+    """
+    :return: The stripe module, configured with STRIPE_KEY.
+    """
+    sdk = _sdks.get("stripe")
+    if sdk is None:
+        import stripe
+        stripe.api_key = os.getenv("STRIPE_KEY")
+        sdk = _sdks.setdefault("stripe", stripe)
+    return sdk
+
+
+def resend_sdk():
+    """
+    :return: The resend module, configured with EMAIL_API_KEY.
+    """
+    sdk = _sdks.get("resend")
+    if sdk is None:
+        import resend
+        resend.api_key = os.getenv("EMAIL_API_KEY")
+        sdk = _sdks.setdefault("resend", resend)
+    return sdk
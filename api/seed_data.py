@@ -0,0 +1,122 @@
+"""
+This file contains the reference data the API needs in its database: the
+user roles and the Azure locations users pick in their profile. It is
+written by the ``flask seed`` command in one bulk statement per table.
+Running it again inserts the missing rows and updates the display names,
+so it is safe to run on every deploy.
+"""
+from database import db, insert_or_ignore, upsert
+from controllers.azuredata import mark_locations_changed
+from flask.cli import with_appcontext
+import models
+import click
+
+# Inserted in this order on an empty table, users get role 1 by default
+ROLES = ["registered", "staff", "admin"]
+
+LOCATIONS = [
+    {"name": "eastus", "display_name": "(US) East US"},
+    {"name": "eastus2", "display_name": "(US) East US 2"},
+    {"name": "southcentralus", "display_name": "(US) South Central US"},
+    {"name": "westus2", "display_name": "(US) West US 2"},
+    {"name": "westus3", "display_name": "(US) West US 3"},
+    {"name": "australiaeast", "display_name": "(Asia Pacific) Australia East"},
+    {"name": "southeastasia", "display_name": "(Asia Pacific) Southeast Asia"},
+    {"name": "northeurope", "display_name": "(Europe) North Europe"},
+    {"name": "swedencentral", "display_name": "(Europe) Sweden Central"},
+    {"name": "uksouth", "display_name": "(Europe) UK South"},
+    {"name": "westeurope", "display_name": "(Europe) West Europe"},
+    {"name": "centralus", "display_name": "(US) Central US"},
+    {"name": "southafricanorth", "display_name": "(Africa) South Africa North"},
+    {"name": "centralindia", "display_name": "(Asia Pacific) Central India"},
+    {"name": "eastasia", "display_name": "(Asia Pacific) East Asia"},
+    {"name": "japaneast", "display_name": "(Asia Pacific) Japan East"},
+    {"name": "koreacentral", "display_name": "(Asia Pacific) Korea Central"},
+    {"name": "canadacentral", "display_name": "(Canada) Canada Central"},
+    {"name": "francecentral", "display_name": "(Europe) France Central"},
+    {"name": "germanywestcentral", "display_name": "(Europe) Germany West Central"},
+    {"name": "norwayeast", "display_name": "(Europe) Norway East"},
+    {"name": "polandcentral", "display_name": "(Europe) Poland Central"},
+    {"name": "switzerlandnorth", "display_name": "(Europe) Switzerland North"},
+    {"name": "uaenorth", "display_name": "(Middle East) UAE North"},
+    {"name": "brazilsouth", "display_name": "(South America) Brazil South"},
+    {"name": "centraluseuap", "display_name": "(US) Central US EUAP"},
+    {"name": "qatarcentral", "display_name": "(Middle East) Qatar Central"},
+    {"name": "centralusstage", "display_name": "(US) Central US (Stage)"},
+    {"name": "eastusstage", "display_name": "(US) East US (Stage)"},
+    {"name": "eastus2stage", "display_name": "(US) East US 2 (Stage)"},
+    {"name": "northcentralusstage", "display_name": "(US) North Central US (Stage)"},
+    {"name": "southcentralusstage", "display_name": "(US) South Central US (Stage)"},
+    {"name": "westusstage", "display_name": "(US) West US (Stage)"},
+    {"name": "westus2stage", "display_name": "(US) West US 2 (Stage)"},
+    {"name": "asia", "display_name": "Asia"},
+    {"name": "asiapacific", "display_name": "Asia Pacific"},
+    {"name": "australia", "display_name": "Australia"},
+    {"name": "brazil", "display_name": "Brazil"},
+    {"name": "canada", "display_name": "Canada"},
+    {"name": "europe", "display_name": "Europe"},
+    {"name": "france", "display_name": "France"},
+    {"name": "germany", "display_name": "Germany"},
+    {"name": "global", "display_name": "Global"},
+    {"name": "india", "display_name": "India"},
+    {"name": "japan", "display_name": "Japan"},
+    {"name": "korea", "display_name": "Korea"},
+    {"name": "norway", "display_name": "Norway"},
+    {"name": "singapore", "display_name": "Singapore"},
+    {"name": "southafrica", "display_name": "South Africa"},
+    {"name": "switzerland", "display_name": "Switzerland"},
+    {"name": "uae", "display_name": "United Arab Emirates"},
+    {"name": "uk", "display_name": "United Kingdom"},
+    {"name": "unitedstates", "display_name": "United States"},
+    {"name": "unitedstateseuap", "display_name": "United States EUAP"},
+    {"name": "eastasiastage", "display_name": "(Asia Pacific) East Asia (Stage)"},
+    {"name": "southeastasiastage", "display_name": "(Asia Pacific) Southeast Asia (Stage)"},
+    {"name": "brazilus", "display_name": "(South America) Brazil US"},
+    {"name": "eastusstg", "display_name": "(US) East US STG"},
+    {"name": "northcentralus", "display_name": "(US) North Central US"},
+    {"name": "westus", "display_name": "(US) West US"},
+    {"name": "jioindiawest", "display_name": "(Asia Pacific) Jio India West"},
+    {"name": "eastus2euap", "display_name": "(US) East US 2 EUAP"},
+    {"name": "southcentralusstg", "display_name": "(US) South Central US STG"},
+    {"name": "westcentralus", "display_name": "(US) West Central US"},
+    {"name": "southafricawest", "display_name": "(Africa) South Africa West"},
+    {"name": "australiacentral", "display_name": "(Asia Pacific) Australia Central"},
+    {"name": "australiacentral2", "display_name": "(Asia Pacific) Australia Central 2"},
+    {"name": "australiasoutheast", "display_name": "(Asia Pacific) Australia Southeast"},
+    {"name": "japanwest", "display_name": "(Asia Pacific) Japan West"},
+    {"name": "jioindiacentral", "display_name": "(Asia Pacific) Jio India Central"},
+    {"name": "koreasouth", "display_name": "(Asia Pacific) Korea South"},
+    {"name": "southindia", "display_name": "(Asia Pacific) South India"},
+    {"name": "westindia", "display_name": "(Asia Pacific) West India"},
+    {"name": "canadaeast", "display_name": "(Canada) Canada East"},
+    {"name": "francesouth", "display_name": "(Europe) France South"},
+    {"name": "germanynorth", "display_name": "(Europe) Germany North"},
+    {"name": "norwaywest", "display_name": "(Europe) Norway West"},
+    {"name": "switzerlandwest", "display_name": "(Europe) Switzerland West"},
+    {"name": "ukwest", "display_name": "(Europe) UK West"},
+    {"name": "uaecentral", "display_name": "(Middle East) UAE Central"},
+    {"name": "brazilsoutheast", "display_name": "(South America) Brazil Southeast"}
+]
+
+
+def seed():
+    """
+    Insert the missing roles and locations and update the display name of
+    the stored locations.
+
+    :return: Tuple with the number of roles and of locations seeded.
+    """
+    db.session.execute(insert_or_ignore(models.RoleModel, ["name"]), [{"name": name} for name in ROLES])
+    db.session.execute(upsert(models.LocationModel, ["name"], ["display_name"]), LOCATIONS)
+    mark_locations_changed(db.session)
+    db.session.commit()
+
+    return len(ROLES), len(LOCATIONS)
+
+
+@click.command("seed")
+@with_appcontext
+def seed_command():
+    """Insert or update the roles and the Azure locations."""
+    roles, locations = seed()
+    click.echo(f"Seeded {roles} roles and {locations} locations.")
@@ -0,0 +1,43 @@
+import pytest
+from database import db
+import models
+from seed_data import seed, seed_command, ROLES, LOCATIONS
+
+@pytest.fixture(autouse=True)
+def database(app):
+    # The seed starts from the empty reference tables of a new database
+    with app.app_context():
+        models.LocationModel.query.delete()
+        models.RoleModel.query.delete()
+        db.session.commit()
+
+# Test the seed inserts the roles in order and every location
+def test_seed_inserts_reference_data(app):
+    with app.app_context():
+        assert seed() == (len(ROLES), len(LOCATIONS))
+        roles = models.RoleModel.query.order_by(models.RoleModel.id).all()
+        assert [(role.id, role.name) for role in roles] == [(1, "registered"), (2, "staff"), (3, "admin")]
+        assert models.LocationModel.query.count() == len(LOCATIONS)
+
+# Test running the seed again keeps the ids and restores the display names
+def test_seed_is_idempotent(app):
+    with app.app_context():
+        seed()
+        location = models.LocationModel.query.filter_by(name="eastus").one()
+        location_id = location.id
+        location.display_name = "Outdated"
+        db.session.commit()
+
+        seed()
+        db.session.expire_all()
+        assert models.RoleModel.query.count() == len(ROLES)
+        assert models.LocationModel.query.count() == len(LOCATIONS)
+        location = models.LocationModel.query.filter_by(name="eastus").one()
+        assert location.id == location_id
+        assert location.display_name == "(US) East US"
+
+# Test the flask seed command reports what it seeded
+def test_seed_command(app):
+    result = app.test_cli_runner().invoke(seed_command)
+    assert result.exit_code == 0
+    assert f"Seeded {len(ROLES)} roles and {len(LOCATIONS)} locations." in result.output
@@ -0,0 +1,139 @@
+"""
+This file contains the static file layer that serves the built React client.
+The dist/ folder is indexed once at startup so a request only costs a dict
+lookup, and the file is handed to the WSGI server file wrapper (sendfile on
+gunicorn) instead of being read by the worker.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.wsgi import wrap_file
+from flask import Response
+import mimetypes
+import hashlib
+import os
+
+# Vite puts the content hashed build output under assets/, those files never change
+IMMUTABLE_PREFIX = os.getenv("STATIC_IMMUTABLE_PREFIX", "assets/")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Precompressed variants written at build time, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+@dataclass
+class StaticFile:
+    path: str
+    size: int
+    mtime: datetime
+    mimetype: str
+    etag: str
+    cache_control: str
+    # Encoding -> (path, size) of the precompressed variants
+    variants: dict = field(default_factory=dict)
+
+
+class StaticFiles:
+    """
+    In-memory manifest of a build folder.
+
+    :param root: Folder with the build output.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+        self.scan()
+
+    def scan(self):
+        """
+        Index every file of the folder. A missing folder gives an empty
+        manifest, so the API can run without the client being built.
+        """
+        files = {}
+        compressed_suffixes = tuple(suffix for _, suffix in ENCODINGS)
+
+        for dir_path, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if file_name.endswith(compressed_suffixes):
+                    continue
+
+                path = os.path.join(dir_path, file_name)
+                url_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                stat = os.stat(path)
+
+                variants = {}
+                for encoding, suffix in ENCODINGS:
+                    if os.path.isfile(path + suffix):
+                        variant_size = os.path.getsize(path + suffix)
+                        # A variant bigger than the original is never worth sending
+                        if variant_size < stat.st_size:
+                            variants[encoding] = (path + suffix, variant_size)
+
+                files[url_path] = StaticFile(
+                    path=path,
+                    size=stat.st_size,
+                    mtime=datetime.fromtimestamp(int(stat.st_mtime), timezone.utc),
+                    mimetype=mimetypes.guess_type(file_name)[0] or "application/octet-stream",
+                    etag=hashlib.sha1(f"{url_path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:20],
+                    cache_control=IMMUTABLE_CACHE_CONTROL if url_path.startswith(IMMUTABLE_PREFIX) else REVALIDATE_CACHE_CONTROL,
+                    variants=variants
+                )
+
+        self.files = files
+
+    def get(self, url_path):
+        """
+        :param url_path: Path relative to the build folder.
+        :return: The StaticFile or None if the build has no such file.
+        """
+        return self.files.get(url_path)
+
+    def serve(self, url_path, request):
+        """
+        Build the response for a file of the manifest, sending the first
+        precompressed variant of ENCODINGS the client accepts.
+
+        :param url_path: Path relative to the build folder.
+        :param request: Current request.
+        :return: The response or None if the build has no such file.
+        """
+        static_file = self.get(url_path)
+        if static_file is None:
+            return None
+
+        encoding = None
+        path, size = static_file.path, static_file.size
+        for candidate, _ in ENCODINGS:
+            if candidate in static_file.variants and request.accept_encodings.quality(candidate) > 0:
+                encoding = candidate
+                path, size = static_file.variants[candidate]
+                break
+
+        etag = f"{static_file.etag}-{encoding}" if encoding else static_file.etag
+
+        headers = {
+            "Cache-Control": static_file.cache_control,
+            "Last-Modified": http_date(static_file.mtime),
+        }
+        if static_file.variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        if not is_resource_modified(request.environ, etag=etag, last_modified=static_file.mtime):
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+
+        response = Response(
+            wrap_file(request.environ, open(path, "rb")),
+            mimetype=static_file.mimetype,
+            headers=headers,
+            direct_passthrough=True
+        )
+        response.content_length = size
+        if encoding:
+            response.content_encoding = encoding
+        response.set_etag(etag)
+
+        return response
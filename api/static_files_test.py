@@ -0,0 +1,84 @@
+import gzip
+import pytest
+from flask import Flask, request
+from static_files import StaticFiles
+
+INDEX = b"<!doctype html><html><body><div id='root'></div></body></html>" * 20
+SCRIPT = b"console.log('BioCloudLabs');\n" * 200
+
+@pytest.fixture
+def dist(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_bytes(INDEX)
+    (tmp_path / "index.html.gz").write_bytes(gzip.compress(INDEX))
+    (tmp_path / "assets" / "index-4f2a9c.js").write_bytes(SCRIPT)
+    (tmp_path / "assets" / "index-4f2a9c.js.gz").write_bytes(gzip.compress(SCRIPT))
+    (tmp_path / "assets" / "index-4f2a9c.js.br").write_bytes(b"brotli" * 10)
+    (tmp_path / "favicon.ico").write_bytes(b"\x00" * 64)
+    return tmp_path
+
+@pytest.fixture
+def client(dist):
+    app = Flask(__name__, static_folder=None)
+    static_files = StaticFiles(str(dist))
+
+    @app.route("/<path:path>")
+    def static_proxy(path):
+        return static_files.serve(path, request) or ("Not found", 404)
+
+    with app.test_client() as client:
+        yield client
+
+# Test the manifest indexes the build and skips the compressed variants
+def test_manifest(dist):
+    static_files = StaticFiles(str(dist))
+    assert sorted(static_files.files) == ["assets/index-4f2a9c.js", "favicon.ico", "index.html"]
+    assert sorted(static_files.get("assets/index-4f2a9c.js").variants) == ["br", "gzip"]
+    assert static_files.get("../app.py") is None
+
+# Test a missing build folder gives an empty manifest
+def test_manifest_no_build(tmp_path):
+    assert StaticFiles(str(tmp_path / "dist")).files == {}
+
+# Test brotli is preferred when the client accepts it
+def test_serve_brotli(client):
+    response = client.get("/assets/index-4f2a9c.js", headers={"Accept-Encoding": "gzip, deflate, br"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.data == b"brotli" * 10
+
+# Test gzip is served to clients without brotli
+def test_serve_gzip(client):
+    response = client.get("/assets/index-4f2a9c.js", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == SCRIPT
+    assert response.headers["Content-Type"].startswith("text/javascript")
+
+# Test the original file is served when no encoding is accepted
+def test_serve_identity(client):
+    response = client.get("/assets/index-4f2a9c.js")
+    assert "Content-Encoding" not in response.headers
+    assert response.data == SCRIPT
+    assert int(response.headers["Content-Length"]) == len(SCRIPT)
+
+# Test hashed assets are immutable while index.html is revalidated
+def test_cache_control(client):
+    assert client.get("/assets/index-4f2a9c.js").headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert client.get("/index.html").headers["Cache-Control"] == "no-cache"
+
+# Test a revalidation with the same ETag answers 304
+def test_not_modified(client):
+    etag = client.get("/index.html", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    response = client.get("/index.html", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # Every encoding has its own ETag
+    response = client.get("/index.html", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+# Test files outside the manifest are not served
+def test_not_found(client):
+    assert client.get("/missing.js").status_code == 404
+    assert client.get("/assets/../../secret").status_code == 404
@@ -0,0 +1,164 @@
+"""
+This file contains the cached Stripe product catalog. The catalog is read on
+every products listing and every checkout, so it is kept in memory and only
+reloaded from Stripe when its TTL runs out or a product/price webhook arrives.
+"""
+from cache_utils import TTLCache
+from metrics import track_outbound
+from outbound import limiter
+from sdk_clients import stripe_sdk
+import threading
+import time
+import os
+
+CATALOG_TTL = float(os.getenv("STRIPE_CATALOG_TTL", 300))
+CATALOG_MAXSIZE = int(os.getenv("STRIPE_CATALOG_MAXSIZE", 4))
+CATALOG_PAGE_SIZE = 100
+
+
+def load_products():
+    """
+    Function that retrieve all the products on stripe with their default price
+    already expanded, paging through the whole list.
+
+    :return data: Return a dict with all the stripe products and a price_id -> credits lookup
+    """
+    stripe = stripe_sdk()
+    data = {"products": [], "credits_by_price_id": {}}
+    with track_outbound("stripe", "product_list"), limiter.slot("stripe"):
+        products = list(stripe.Product.list(active=True, limit=CATALOG_PAGE_SIZE,
+                                            expand=["data.default_price"]).auto_paging_iter())
+
+    for product in products:
+        price = product["default_price"]
+        if price is None:
+            continue
+
+        credits = int(product["name"].replace(' Credits', ''))
+        data["products"].append({"name": product["name"],
+                                 "price_id": price["id"],
+                                 "price": "{:.2f}".format(price["unit_amount"]/100) + " €",
+                                 "credits": credits})
+        data["credits_by_price_id"][price["id"]] = credits
+    return data
+
+
+class ProductCatalog:
+    """
+    In-process cache in front of a catalog loader.
+
+    Fresh entries are served from memory. Stale entries are still served while a
+    background thread reloads them, so only a cold cache pays for the Stripe
+    round-trips. On a cold cache a single request loads the catalog, the
+    concurrent ones wait for it instead of calling Stripe too. A catalog loaded
+    while the cache was invalidated is not cached, it may predate the change.
+    """
+
+    def __init__(self, loader, ttl=CATALOG_TTL, maxsize=CATALOG_MAXSIZE):
+        self.loader = loader
+        self._cache = TTLCache(ttl, maxsize)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = set()
+        # Bumped by every invalidation, a load started before it is not cached after it
+        self._generation = 0
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "invalidations": 0,
+            "cached_seconds": 0.0,
+            "uncached_seconds": 0.0,
+        }
+
+    def get(self, key="products"):
+        """
+        Return the catalog, loading it from Stripe only on a cold cache.
+
+        :param key: Catalog key.
+        :return: The catalog built by the loader.
+        """
+        start = time.perf_counter()
+        entry = self._cache.peek(key)
+
+        if entry is None:
+            with self._load_lock:
+                # Loaded by the request that held the lock while this one waited
+                entry = self._cache.peek(key)
+                if entry is None:
+                    generation = self._generation
+                    value = self.loader()
+                    self._store(key, value, generation)
+                    self._count("misses", "uncached_seconds", start)
+                    return value
+
+        value, is_fresh = entry
+        if is_fresh:
+            self._count("hits", "cached_seconds", start)
+        else:
+            self._refresh_in_background(key)
+            self._count("stale_hits", "cached_seconds", start)
+        return value
+
+    def invalidate(self):
+        """
+        Drop every cached catalog, the next read reloads it from Stripe.
+        """
+        with self._lock:
+            self._generation += 1
+            self._cache.invalidate()
+            self._counters["invalidations"] += 1
+
+    def stats(self):
+        """
+        Return the cache counters with the average latency of cached and uncached reads.
+
+        :return: Dict with the counters.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+
+        cached, cached_seconds = counters["hits"] + counters["stale_hits"], counters.pop("cached_seconds")
+        uncached, uncached_seconds = counters["misses"], counters.pop("uncached_seconds")
+        counters["avg_cached_ms"] = round(cached_seconds * 1000 / cached, 4) if cached else None
+        counters["avg_uncached_ms"] = round(uncached_seconds * 1000 / uncached, 4) if uncached else None
+        return counters
+
+    def _count(self, counter, timer, start):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._counters[counter] += 1
+            self._counters[timer] += elapsed
+
+    def _store(self, key, value, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._cache.set(key, value)
+
+    def _refresh_in_background(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        threading.Thread(target=self._refresh, args=(key,), daemon=True).start()
+
+    def _refresh(self, key):
+        generation = self._generation
+        try:
+            self._store(key, self.loader(), generation)
+            counter = "refreshes"
+        except Exception:
+            # Keep serving the stale catalog, the next read will try again
+            counter = "refresh_errors"
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+        with self._lock:
+            self._counters[counter] += 1
+
+
+catalog = ProductCatalog(load_products)
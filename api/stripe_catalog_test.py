@@ -0,0 +1,140 @@
+import pytest
+import threading
+import time
+from stripe_catalog import ProductCatalog, load_products
+import stripe
+
+
+class FakeLoader:
+    """Catalog loader that counts how many times Stripe would have been called."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.release.wait(1)
+        self.calls += 1
+        return {"products": [{"name": "100 Credits", "price_id": "price_1", "price": "3.99 €", "credits": 100}], "version": self.calls}
+
+@pytest.fixture
+def loader():
+    return FakeLoader()
+
+# Test catalog only calls the loader once while the entry is fresh
+def test_catalog_fresh_hit(loader):
+    catalog = ProductCatalog(loader, ttl=60)
+    first = catalog.get()
+    second = catalog.get()
+    assert loader.calls == 1
+    assert first is second
+    assert catalog.stats()["hits"] == 1
+    assert catalog.stats()["misses"] == 1
+
+# Test concurrent reads of a cold catalog call the loader once
+def test_catalog_cold_stampede(loader):
+    catalog = ProductCatalog(loader, ttl=60)
+    loader.release.clear()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(catalog.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    loader.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+    assert catalog.stats()["misses"] == 1
+    assert catalog.stats()["hits"] == 7
+
+# Test catalog serves the stale entry and refreshes it in background
+def test_catalog_stale_refresh(loader):
+    catalog = ProductCatalog(loader, ttl=0.01)
+    catalog.get()
+    time.sleep(0.02)
+
+    loader.release.clear()
+    stale = catalog.get()
+    assert stale["version"] == 1
+    loader.release.set()
+
+    for _ in range(100):
+        if catalog.stats()["refreshes"] == 1:
+            break
+        time.sleep(0.01)
+
+    assert loader.calls == 2
+    assert catalog.stats()["stale_hits"] == 1
+
+# Test catalog reloads from the loader after an invalidation
+def test_catalog_invalidate(loader):
+    catalog = ProductCatalog(loader, ttl=60)
+    catalog.get()
+    catalog.invalidate()
+    assert catalog.get()["version"] == 2
+    assert catalog.stats()["invalidations"] == 1
+
+# Test a background refresh started before an invalidation does not cache the old catalog
+def test_catalog_invalidate_during_refresh(loader):
+    catalog = ProductCatalog(loader, ttl=0.01)
+    catalog.get()
+    time.sleep(0.02)
+
+    loader.release.clear()
+    catalog.get()
+    catalog.invalidate()
+    loader.release.set()
+
+    for _ in range(100):
+        if catalog.stats()["refreshes"] == 1:
+            break
+        time.sleep(0.01)
+
+    assert catalog.get()["version"] == 3
+    assert catalog.stats()["misses"] == 2
+
+# Test catalog propagates loader errors on a cold cache
+def test_catalog_loader_error():
+    def failing_loader():
+        raise RuntimeError("Stripe is down")
+
+    catalog = ProductCatalog(failing_loader, ttl=60)
+    with pytest.raises(RuntimeError):
+        catalog.get()
+
+# Test catalog cache never grows over its max size
+def test_catalog_bounded_size(loader):
+    catalog = ProductCatalog(loader, ttl=60, maxsize=2)
+    for key in ("eur", "usd", "gbp"):
+        catalog.get(key)
+    assert len(catalog._cache) == 2
+
+# Test loader builds the catalog from one expanded, paginated list call
+def test_load_products_expanded(monkeypatch):
+    calls = []
+
+    class FakeList:
+        def auto_paging_iter(self):
+            yield {"name": "20 Credits", "default_price": {"id": "price_20", "unit_amount": 99}}
+            yield {"name": "100 Credits", "default_price": {"id": "price_100", "unit_amount": 399}}
+            yield {"name": "Archived", "default_price": None}
+
+    def fake_list(**params):
+        calls.append(params)
+        return FakeList()
+
+    def fake_retrieve(*args, **kwargs):
+        raise AssertionError("Price.retrieve must not be called")
+
+    monkeypatch.setattr(stripe.Product, "list", fake_list)
+    monkeypatch.setattr(stripe.Price, "retrieve", fake_retrieve)
+
+    data = load_products()
+    assert len(calls) == 1
+    assert calls[0]["expand"] == ["data.default_price"]
+    assert data["credits_by_price_id"] == {"price_20": 20, "price_100": 100}
+    assert data["products"][1] == {"name": "100 Credits", "price_id": "price_100", "price": "3.99 €", "credits": 100}
@@ -0,0 +1,171 @@
+"""
+This file contains the processing of the Stripe webhook events. The webhook
+only verifies the signature and stores the raw event in the stripe_events
+table, keyed by the Stripe event id, so a replayed event is stored once and
+Stripe gets its answer without waiting for the database work.
+
+The event is applied later on the scheduler thread pool. Its effects and the
+processed mark are committed in the same transaction, so an event is applied
+exactly once even when several workers try it at once.
+"""
+from datetime import datetime, timezone, timedelta
+from scheduler import scheduler, periodic_job
+from sqlalchemy import select, update
+from credit_ledger import apply_credits, PURCHASE
+from stripe_catalog import catalog
+from database import db, insert_or_ignore
+import models
+import json
+import os
+
+EVENT_POLL_SECONDS = int(os.getenv("STRIPE_EVENT_POLL_SECONDS", 30))
+EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", 5))
+# An event claimed longer ago than this belongs to a worker that died while applying it
+EVENT_STALE_AFTER = timedelta(seconds=int(os.getenv("STRIPE_EVENT_STALE_AFTER", 300)))
+
+
+def store_event(event_id, event_type, payload):
+    """
+    Persist a verified event, ignoring events already received.
+
+    :param event_id: Stripe event id.
+    :param event_type: Stripe event type.
+    :param payload: Raw JSON body of the webhook.
+    :return: True if the event is new.
+    """
+    result = db.session.execute(
+        insert_or_ignore(models.StripeEventModel, ["id"])
+        .values(id=event_id, type=event_type, payload=payload, status="pending", attempts=0)
+    )
+    db.session.commit()
+
+    return result.rowcount == 1
+
+
+def schedule_event(app, event_id):
+    """
+    Apply an event as soon as a scheduler thread is free.
+
+    :param app: Flask app the event is applied against.
+    :param event_id: Event to apply.
+    """
+    scheduler.add_job(process_event, args=[app, event_id], id=f"stripe-event-{event_id}", replace_existing=True)
+
+
+def claim_event(event_id, now):
+    """
+    Atomically move an event from pending to processing.
+
+    :param event_id: Event to claim.
+    :param now: Current time.
+    :return: True if this caller owns the event.
+    """
+    result = db.session.execute(
+        update(models.StripeEventModel)
+        .where(models.StripeEventModel.id == event_id, models.StripeEventModel.status == "pending")
+        .values(status="processing", claimed_at=now, attempts=models.StripeEventModel.attempts + 1)
+    )
+    db.session.commit()
+
+    return result.rowcount == 1
+
+
+def complete_invoice(invoice_id):
+    """
+    Mark an invoice as paid, only once.
+
+    :param invoice_id: Invoice paid by the checkout.
+    :return: True if the invoice was not completed yet.
+    """
+    return db.session.execute(
+        update(models.InvoiceModel)
+        .where(models.InvoiceModel.id == invoice_id, models.InvoiceModel.status != "completed")
+        .values(status="completed")
+    ).rowcount == 1
+
+
+def apply_event(event):
+    """
+    Apply the effects of an event to the session, without committing them.
+
+    :param event: Event decoded from its JSON payload.
+    """
+    metadata = event["data"]["object"].get("metadata") or {}
+
+    match event["type"]:
+        case "checkout.session.completed":
+            # An invoice paid twice, by two different events, is credited once
+            if complete_invoice(metadata["invoice_id"]):
+                apply_credits(metadata["user_id"], int(metadata["credits"]), PURCHASE, metadata["invoice_id"])
+        case "checkout.session.expired":
+            db.session.execute(
+                update(models.InvoiceModel)
+                .where(models.InvoiceModel.id == metadata["invoice_id"], models.InvoiceModel.status == "pending")
+                .values(status="expired")
+            )
+        case event_type if event_type.startswith(("product.", "price.")):
+            catalog.invalidate()
+
+
+def process_event(app, event_id):
+    """
+    Apply a stored event and mark it processed in the same transaction. A
+    failed event goes back to pending until it runs out of attempts.
+
+    :param app: Flask app the event is applied against.
+    :param event_id: Event to apply.
+    """
+    with app.app_context():
+        if not claim_event(event_id, datetime.now(timezone.utc)):
+            return
+
+        stored = db.session.get(models.StripeEventModel, event_id)
+
+        try:
+            apply_event(json.loads(stored.payload))
+            stored.status = "processed"
+            stored.error = None
+            stored.processed_at = datetime.now(timezone.utc)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception("Stripe event %s failed", event_id)
+            stored = db.session.get(models.StripeEventModel, event_id)
+            stored.status = "failed" if stored.attempts >= EVENT_MAX_ATTEMPTS else "pending"
+            stored.error = str(e)[:500]
+            db.session.commit()
+
+
+@periodic_job(EVENT_POLL_SECONDS)
+def resume_pending_events(app):
+    """
+    Retry the pending events, and the ones left processing by a worker that
+    went away. A stale event that already used every attempt is marked failed,
+    so an event that kills its worker every time is not retried forever.
+
+    :param app: Flask app the events are applied against.
+    """
+    with app.app_context():
+        now = datetime.now(timezone.utc)
+        stale = (models.StripeEventModel.status == "processing", models.StripeEventModel.claimed_at < now - EVENT_STALE_AFTER)
+
+        db.session.execute(
+            update(models.StripeEventModel)
+            .where(*stale, models.StripeEventModel.attempts >= EVENT_MAX_ATTEMPTS)
+            .values(status="failed", error="The worker applying the event went away.")
+        )
+        db.session.execute(
+            update(models.StripeEventModel)
+            .where(*stale, models.StripeEventModel.attempts < EVENT_MAX_ATTEMPTS)
+            .values(status="pending")
+        )
+        db.session.commit()
+
+        pending = db.session.execute(
+            select(models.StripeEventModel.id)
+            .where(models.StripeEventModel.status == "pending")
+            .order_by(models.StripeEventModel.created_at)
+        ).scalars().all()
+
+    for event_id in pending:
+        schedule_event(app, event_id)
@@ -0,0 +1,170 @@
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime, timezone, timedelta
+import pytest
+from database import db
+import models
+import stripe_events
+from controllers import stripe as stripe_controller
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "stripe")
+SECRET = "whsec_test_fixture_secret"
+
+@pytest.fixture(autouse=True)
+def database(app, monkeypatch):
+    monkeypatch.setattr(stripe_controller, "ENDPOINT_SECRET", SECRET)
+    with app.app_context():
+        db.session.add(models.UserModel(id=1, email="user1@example.com", password="x", name="Test", surname="User",
+                                        location_id=1, credits=10))
+        db.session.add(models.InvoiceModel(id=1, price=3.99, status="pending", credits=100, user_id=1))
+        db.session.add(models.InvoiceModel(id=2, price=3.99, status="pending", credits=100, user_id=1))
+        db.session.commit()
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    """Events handed to the scheduler, applied when the test says so."""
+    events = []
+    monkeypatch.setattr(stripe_events.scheduler, "add_job", lambda func, args, **kwargs: events.append(args[1]))
+    return events
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, f"{name}.json"), "rb") as file:
+        return file.read()
+
+def signed(payload, secret=SECRET):
+    """Headers of the payload signed the way Stripe signs its webhooks."""
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return {"Stripe-Signature": f"t={timestamp},v1={signature}", "Content-Type": "application/json"}
+
+def send(client, name):
+    payload = fixture(name)
+    return client.post('/api/stripe/webhook', data=payload, headers=signed(payload))
+
+def process(app, scheduled):
+    for event_id in scheduled:
+        stripe_events.process_event(app, event_id)
+
+def user_credits(app):
+    with app.app_context():
+        return db.session.get(models.UserModel, 1).credits
+
+# Test the webhook acknowledges once the event is stored, before applying it
+def test_webhook_acknowledges_stored_event(app, client, scheduled):
+    response = send(client, "checkout_session_completed")
+    assert response.status_code == 200
+    assert scheduled == ["evt_1PcompletedFixture0001"]
+    assert user_credits(app) == 10
+
+    with app.app_context():
+        assert db.session.get(models.StripeEventModel, "evt_1PcompletedFixture0001").status == "pending"
+
+# Test a completed checkout credits the user and completes the invoice
+def test_checkout_completed(app, client, scheduled):
+    send(client, "checkout_session_completed")
+    process(app, scheduled)
+
+    assert user_credits(app) == 110
+    with app.app_context():
+        assert db.session.get(models.InvoiceModel, 1).status == "completed"
+        assert db.session.get(models.StripeEventModel, "evt_1PcompletedFixture0001").status == "processed"
+
+# Test a replayed event is a no-op
+def test_replayed_event(app, client, scheduled):
+    for _ in range(3):
+        assert send(client, "checkout_session_completed").status_code == 200
+    assert scheduled == ["evt_1PcompletedFixture0001"]
+
+    process(app, scheduled * 3)
+    assert user_credits(app) == 110
+
+# Test an invoice paid by two different events is credited once
+def test_invoice_credited_once(app, client, scheduled):
+    send(client, "checkout_session_completed")
+    event = json.loads(fixture("checkout_session_completed"))
+    event["id"] = "evt_1PcompletedFixture0002"
+    payload = json.dumps(event).encode()
+    client.post('/api/stripe/webhook', data=payload, headers=signed(payload))
+
+    process(app, scheduled)
+    assert len(scheduled) == 2
+    assert user_credits(app) == 110
+
+# Test an expired checkout expires the invoice
+def test_checkout_expired(app, client, scheduled):
+    send(client, "checkout_session_expired")
+    process(app, scheduled)
+
+    with app.app_context():
+        assert db.session.get(models.InvoiceModel, 2).status == "expired"
+    assert user_credits(app) == 10
+
+# Test a price change invalidates the product catalog
+def test_price_updated(app, client, scheduled, monkeypatch):
+    invalidations = []
+    monkeypatch.setattr(stripe_events.catalog, "invalidate", lambda: invalidations.append(True))
+    send(client, "price_updated")
+    process(app, scheduled)
+    assert invalidations == [True]
+
+# Test events with a wrong signature are rejected and not stored
+def test_invalid_signature(app, client, scheduled):
+    payload = fixture("checkout_session_completed")
+    response = client.post('/api/stripe/webhook', data=payload, headers=signed(payload, "whsec_other"))
+    assert response.status_code == 400
+    assert client.post('/api/stripe/webhook', data=payload).status_code == 400
+    assert scheduled == []
+
+    with app.app_context():
+        assert models.StripeEventModel.query.count() == 0
+
+# Test a failed event is retried and applied once
+def test_failed_event_retried(app, client, scheduled, monkeypatch):
+    send(client, "checkout_session_completed")
+    apply_event = stripe_events.apply_event
+    monkeypatch.setattr(stripe_events, "apply_event", lambda event: 1 / 0)
+    process(app, scheduled)
+
+    with app.app_context():
+        stored = db.session.get(models.StripeEventModel, "evt_1PcompletedFixture0001")
+        assert stored.status == "pending"
+        assert "division by zero" in stored.error
+    assert user_credits(app) == 10
+
+    monkeypatch.setattr(stripe_events, "apply_event", apply_event)
+    scheduled.clear()
+    stripe_events.resume_pending_events(app)
+    process(app, scheduled)
+    assert user_credits(app) == 110
+
+# Test an event left processing by dead workers is failed once it used every attempt
+def test_stale_event_runs_out_of_attempts(app, client, scheduled):
+    send(client, "checkout_session_completed")
+    claimed_at = datetime.now(timezone.utc) - stripe_events.EVENT_STALE_AFTER - timedelta(seconds=1)
+
+    with app.app_context():
+        stored = db.session.get(models.StripeEventModel, "evt_1PcompletedFixture0001")
+        stored.status, stored.claimed_at, stored.attempts = "processing", claimed_at, stripe_events.EVENT_MAX_ATTEMPTS - 1
+        db.session.commit()
+
+    scheduled.clear()
+    stripe_events.resume_pending_events(app)
+    with app.app_context():
+        assert db.session.get(models.StripeEventModel, "evt_1PcompletedFixture0001").status == "pending"
+
+    with app.app_context():
+        stored = db.session.get(models.StripeEventModel, "evt_1PcompletedFixture0001")
+        stored.status, stored.claimed_at, stored.attempts = "processing", claimed_at, stripe_events.EVENT_MAX_ATTEMPTS
+        db.session.commit()
+
+    scheduled.clear()
+    stripe_events.resume_pending_events(app)
+    assert scheduled == []
+    with app.app_context():
+        stored = db.session.get(models.StripeEventModel, "evt_1PcompletedFixture0001")
+        assert stored.status == "failed"
+        assert stored.error
+    assert user_credits(app) == 10
@@ -6,6 +6,7 @@ import os
 from flask_jwt_extended import JWTManager, create_access_token
 from datetime import timedelta
 from database import db
+from user_identity import init_user_loader
 from flask_migrate import Migrate
 from controllers.user import blp as UserBlueprint
 from dotenv import load_dotenv
@@ -19,6 +20,7 @@ app.config["API_VERSION"] = os.getenv("API_VERSION")
 app.config["OPENAPI_VERSION"] = os.getenv("OPENAPI_VERSION")
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("TEST_SQLALCHEMY_DATABASE_URI")
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
+app.config["RATE_LIMIT_ENABLED"] = False
 
 db.init_app(app)
 
@@ -28,6 +30,8 @@ api: Api = Api(app)
 
 jwt = JWTManager(app)
 
+init_user_loader(jwt)
+
 api.register_blueprint(UserBlueprint)
 
 @pytest.fixture
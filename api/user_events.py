@@ -0,0 +1,313 @@
+"""
+This file contains the live events of a user, streamed to the client by the
+/api/user/events Server-Sent Events endpoint instead of polling /credits and
+/history:
+
+- ``credits``: the balance after every credit change.
+- ``vm``: a VM of the user started or was powered off.
+- ``cost``: every USER_EVENTS_TICK_SECONDS, the cost so far of the running
+  VMs and the balance left once they are paid.
+
+Changes are published once their transaction commits, to the subscribers of
+the worker that made them. The tick also rereads the balance through the
+cached user loader, so a change made by another worker reaches the stream
+within the loader TTL.
+
+Every subscriber holds at most USER_EVENTS_QUEUE_SIZE pending events. A new
+event replaces a pending one of the same kind and key (only the last balance
+matters), and the oldest event is dropped when the queue is full.
+
+A stream holds its request for up to USER_EVENTS_MAX_AGE seconds, so it is
+only served by the cooperative (gevent) workers, where it holds a greenlet.
+A sync worker answers 503 and the client polls instead.
+
+EventSource can not send headers, so the stream is opened with a ticket in
+the query string instead of the access token: the client exchanges its token
+for a ticket valid USER_EVENTS_TICKET_TTL seconds and only once, so a ticket
+written in an access or proxy log can not be used. A ticket is used by
+inserting its id in the token_blocklist table, whose unique key makes the
+claim atomic across every worker whatever the BLOCKLIST_BACKEND.
+"""
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import event, select, delete
+from sqlalchemy.orm import Session
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from flask import current_app
+from user_identity import load_user
+from vm_costs import calc_vm_credits_costs
+from database import db, insert_or_ignore
+import threading
+import models
+import json
+import time
+import uuid
+import os
+
+USER_EVENTS_QUEUE_SIZE = int(os.getenv("USER_EVENTS_QUEUE_SIZE", 32))
+# Streams served at once by one worker
+USER_EVENTS_MAX_SUBSCRIBERS = int(os.getenv("USER_EVENTS_MAX_SUBSCRIBERS", 1000))
+USER_EVENTS_TICK_SECONDS = float(os.getenv("USER_EVENTS_TICK_SECONDS", 15))
+# Seconds between two reads of the running VMs when no VM event arrived
+USER_EVENTS_VMS_REFRESH = float(os.getenv("USER_EVENTS_VMS_REFRESH", 60))
+# A stream is closed after this long, the browser reconnects with a fresh token check
+USER_EVENTS_MAX_AGE = float(os.getenv("USER_EVENTS_MAX_AGE", 3600))
+# Milliseconds the browser waits before reconnecting
+USER_EVENTS_RETRY_MS = 5000
+USER_EVENTS_TICKET_TTL = int(os.getenv("USER_EVENTS_TICKET_TTL", 30))
+
+
+class Subscription:
+    """
+    Bounded queue of the events of one stream.
+
+    :param user_id: User whose events are received.
+    :param maxsize: Pending events kept.
+    """
+
+    def __init__(self, user_id, maxsize=USER_EVENTS_QUEUE_SIZE):
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._events = OrderedDict()
+        self._condition = threading.Condition()
+
+    def put(self, name, data, key=None):
+        """
+        :param name: Event name.
+        :param data: JSON serializable payload.
+        :param key: Events with the same name and key replace each other.
+        """
+        with self._condition:
+            self._events.pop((name, key), None)
+            self._events[(name, key)] = data
+            while len(self._events) > self.maxsize:
+                self._events.popitem(last=False)
+                self.dropped += 1
+            self._condition.notify()
+
+    def get(self, timeout):
+        """
+        Wait until there are pending events or the timeout runs out.
+
+        :param timeout: Seconds to wait.
+        :return: List of (name, data) tuples in the order they were published.
+        """
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+            events = [(name, data) for (name, _), data in self._events.items()]
+            self._events.clear()
+        return events
+
+
+class EventBus:
+    """
+    Subscriptions of the streams served by this worker, by user.
+
+    :param max_subscribers: Subscriptions allowed at once.
+    """
+
+    def __init__(self, max_subscribers=USER_EVENTS_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscriptions = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """
+        :param user_id: User whose events are received.
+        :return: A new Subscription, None if the worker serves too many streams.
+        """
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            subscription = Subscription(user_id)
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        :param subscription: Subscription to close.
+        """
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            if subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self._count -= 1
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, user_id, name, data, key=None):
+        """
+        Send an event to every stream of a user.
+
+        :param user_id: User the event is about.
+        :param name: Event name.
+        :param data: JSON serializable payload.
+        :param key: Events with the same name and key replace each other.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(int(user_id), ()))
+        for subscription in subscriptions:
+            subscription.put(name, data, key)
+
+
+bus = EventBus()
+
+
+def ticket_serializer():
+    return URLSafeTimedSerializer(current_app.config["JWT_SECRET_KEY"], salt="user-events-ticket")
+
+
+def issue_ticket(user_id, expires_at):
+    """
+    :param user_id: User the stream belongs to.
+    :param expires_at: ``exp`` of the access token, the stream does not outlive it.
+    :return: Ticket that opens one stream within USER_EVENTS_TICKET_TTL seconds.
+    """
+    return ticket_serializer().dumps({"sub": user_id, "exp": expires_at, "jti": uuid.uuid4().hex})
+
+
+def redeem_ticket(ticket):
+    """
+    Check a ticket and mark it used. Expired tickets and tokens are purged
+    from the table on the way.
+
+    :param ticket: Ticket from the query string.
+    :return: Dict with the ``sub`` and ``exp`` of the ticket, None if it is invalid, expired or used.
+    """
+    try:
+        data = ticket_serializer().loads(ticket, max_age=USER_EVENTS_TICKET_TTL)
+    except BadSignature:
+        return None
+
+    now = datetime.now(timezone.utc)
+    db.session.execute(delete(models.TokenBlocklistModel).where(models.TokenBlocklistModel.expires_at <= now))
+    # Only the first redemption inserts the id, on any worker
+    claimed = db.session.execute(
+        insert_or_ignore(models.TokenBlocklistModel, ["jti"])
+        .values(jti=data["jti"], expires_at=now + timedelta(seconds=USER_EVENTS_TICKET_TTL))
+        .returning(models.TokenBlocklistModel.id)
+    ).first()
+    db.session.commit()
+
+    return data if claimed is not None else None
+
+
+def publish_after_commit(session, user_id, name, data, key=None):
+    """
+    Publish an event once the transaction of the session commits, a rolled
+    back change is never published.
+
+    :param session: Session making the change.
+    :param user_id: User the event is about.
+    :param name: Event name.
+    :param data: JSON serializable payload.
+    :param key: Events with the same name and key replace each other.
+    """
+    session.info.setdefault("user_events", []).append((int(user_id), name, data, key))
+
+
+@event.listens_for(Session, "after_commit")
+def publish_committed_events(session):
+    for user_id, name, data, key in session.info.pop("user_events", ()):
+        bus.publish(user_id, name, data, key)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_rolled_back_events(session):
+    session.info.pop("user_events", None)
+
+
+def format_event(name, data):
+    """
+    :param name: Event name.
+    :param data: JSON serializable payload.
+    :return: The event in the Server-Sent Events format.
+    """
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+def running_vms(user_id):
+    """
+    :param user_id: Owner of the VMs.
+    :return: Rows with the id, name, created_at and powered_off_at of the running VMs.
+    """
+    VM = models.VirtualMachineModel
+    try:
+        return db.session.execute(
+            select(VM.id, VM.name, VM.created_at, VM.powered_off_at)
+            .where(VM.user_id == user_id, VM.powered_off_at.is_(None))
+            .order_by(VM.id)
+        ).all()
+    finally:
+        # A stream lives for minutes, it must not keep a pool connection
+        db.session.close()
+
+
+def current_credits(user_id, default):
+    user = load_user(user_id)
+    db.session.close()
+    return default if user is None else user.credits
+
+
+def cost_event(vms, credits):
+    """
+    :param vms: Running VMs.
+    :param credits: Current balance.
+    :return: Payload of the cost event.
+    """
+    now = datetime.now(timezone.utc)
+    running = [{"id": vm.id, "name": vm.name, "cost": calc_vm_credits_costs(vm, now)} for vm in vms]
+    return {"running": running, "projected_credits": credits - sum(vm["cost"] for vm in running)}
+
+
+def stream_events(subscription, credits, max_age=USER_EVENTS_MAX_AGE, tick=USER_EVENTS_TICK_SECONDS):
+    """
+    Generate the stream of a subscription, it ends after ``max_age`` seconds.
+
+    :param subscription: Subscription of the stream, closed when the stream ends.
+    :param credits: Balance of the user when the stream starts.
+    :param max_age: Seconds the stream is served.
+    :param tick: Seconds between two cost events.
+    """
+    user_id = subscription.user_id
+
+    try:
+        vms = running_vms(user_id)
+        vms_read_at = time.monotonic()
+
+        yield f"retry: {USER_EVENTS_RETRY_MS}\n\n"
+        yield format_event("credits", {"credits": credits})
+        yield format_event("cost", cost_event(vms, credits))
+
+        deadline = time.monotonic() + max_age
+        next_tick = time.monotonic() + tick
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            for name, data in subscription.get(max(0.0, min(next_tick, deadline) - now)):
+                if name == "credits":
+                    credits = data["credits"]
+                elif name == "vm":
+                    vms, vms_read_at = running_vms(user_id), time.monotonic()
+                yield format_event(name, data)
+
+            if time.monotonic() >= next_tick:
+                latest = current_credits(user_id, credits)
+                if latest != credits:
+                    credits = latest
+                    yield format_event("credits", {"credits": credits})
+
+                if time.monotonic() - vms_read_at >= USER_EVENTS_VMS_REFRESH:
+                    vms, vms_read_at = running_vms(user_id), time.monotonic()
+
+                yield format_event("cost", cost_event(vms, credits))
+                next_tick = time.monotonic() + tick
+    finally:
+        bus.unsubscribe(subscription)
@@ -0,0 +1,208 @@
+import pytest
+from datetime import datetime, timezone, timedelta
+from flask_jwt_extended import create_access_token
+from database import db
+from user_events import Subscription, EventBus, stream_events, publish_after_commit, bus
+from credit_ledger import apply_credits, charge_vm_usage, PURCHASE
+import models
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.add(models.UserModel(id=1, email="user1@example.com", password="x", name="Test", surname="User",
+                                        location_id=1, credits=50))
+        db.session.commit()
+
+@pytest.fixture
+def subscription():
+    subscription = bus.subscribe(1)
+    yield subscription
+    bus.unsubscribe(subscription)
+
+def parse(body):
+    """Events of a Server-Sent Events body as (name, data) tuples."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        if "event" in fields:
+            events.append((fields["event"], fields["data"]))
+    return events
+
+# Test a new event replaces a pending one of the same name and key
+def test_subscription_coalesces():
+    subscription = Subscription(1)
+
+    subscription.put("credits", {"credits": 10})
+    subscription.put("vm", {"id": 1}, key=1)
+    subscription.put("credits", {"credits": 20})
+
+    assert subscription.get(0) == [("vm", {"id": 1}), ("credits", {"credits": 20})]
+    assert subscription.get(0) == []
+
+# Test a subscription keeps at most maxsize events, dropping the oldest
+def test_subscription_is_bounded():
+    subscription = Subscription(1, maxsize=3)
+
+    for vm_id in range(5):
+        subscription.put("vm", {"id": vm_id}, key=vm_id)
+
+    assert [data["id"] for _, data in subscription.get(0)] == [2, 3, 4]
+    assert subscription.dropped == 2
+
+# Test the bus refuses subscriptions over its limit and frees them on unsubscribe
+def test_bus_limit():
+    event_bus = EventBus(max_subscribers=1)
+
+    first = event_bus.subscribe(1)
+    assert event_bus.subscribe(2) is None
+
+    event_bus.unsubscribe(first)
+    assert event_bus.subscribe(2) is not None
+
+# Test credit changes are published once committed and never when rolled back
+def test_publish_after_commit(app, subscription):
+    with app.app_context():
+        apply_credits(1, 10, PURCHASE, "cs_1")
+        assert subscription.get(0) == []
+
+        db.session.rollback()
+        assert subscription.get(0) == []
+
+        apply_credits(1, 10, PURCHASE, "cs_2")
+        db.session.commit()
+
+    assert subscription.get(0) == [("credits", {"credits": 60})]
+
+# Test powering off a VM publishes the VM and the new balance
+def test_vm_usage_events(app, subscription):
+    with app.app_context():
+        vm = models.VirtualMachineModel(name="vm1", user_id=1)
+        db.session.add(vm)
+        db.session.commit()
+
+        charge_vm_usage(vm.id, 1, 5)
+        db.session.commit()
+
+        assert subscription.get(0) == [
+            ("vm", {"id": vm.id, "state": "powered_off", "cost": 5}),
+            ("credits", {"credits": 45}),
+        ]
+
+# Test events of other users are not received
+def test_publish_other_user(app, subscription):
+    with app.app_context():
+        publish_after_commit(db.session, 2, "credits", {"credits": 1})
+        db.session.commit()
+
+    assert subscription.get(0) == []
+
+# Test the stream starts with the balance and the cost of the running VMs and forwards events
+def test_stream_events(app, subscription):
+    with app.app_context():
+        db.session.add(models.VirtualMachineModel(name="vm1", user_id=1,
+                                                  created_at=datetime.now(timezone.utc) - timedelta(hours=1)))
+        db.session.commit()
+
+        stream = stream_events(subscription, 50, max_age=0.5, tick=0.2)
+
+        assert next(stream) == "retry: 5000\n\n"
+        assert next(stream) == 'event: credits\ndata: {"credits":50}\n\n'
+
+        name, data = parse(next(stream))[0]
+        assert name == "cost"
+        assert '"name":"vm1"' in data
+
+        subscription.put("credits", {"credits": 40})
+        assert next(stream) == 'event: credits\ndata: {"credits":40}\n\n'
+
+        rest = parse("".join(stream))
+
+    # The tick rereads the balance, the event published above was not committed
+    assert rest[0] == ("credits", '{"credits":50}')
+    assert [name for name, _ in rest[1:]] and all(name == "cost" for name, _ in rest[1:])
+    assert subscription not in bus._subscriptions.get(1, ())
+
+@pytest.fixture
+def streaming(monkeypatch):
+    """Serve the streams as a gevent worker does."""
+    monkeypatch.setattr("controllers.user.cooperative", lambda: True)
+
+def ticket(client, token):
+    response = client.post('/api/user/events/ticket', headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    return response.json["ticket"]
+
+# Test the stream is opened with a ticket and ends with the access token
+def test_events_endpoint(app, client, streaming):
+    with app.app_context():
+        token = create_access_token(identity="1", expires_delta=timedelta(seconds=1))
+
+    response = client.get(f'/api/user/events?ticket={ticket(client, token)}')
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert parse(response.get_data(as_text=True))[0] == ("credits", '{"credits":50}')
+
+# Test a ticket opens one stream only and an access token is not accepted in the query string
+def test_events_ticket_single_use(app, client, streaming):
+    with app.app_context():
+        token = create_access_token(identity="1", expires_delta=timedelta(seconds=1))
+
+    stream_ticket = ticket(client, token)
+    assert client.get(f'/api/user/events?ticket={stream_ticket}').status_code == 200
+    assert client.get(f'/api/user/events?ticket={stream_ticket}').status_code == 401
+    assert client.get(f'/api/user/events?jwt={token}').status_code == 401
+    assert client.get(f'/api/user/events?ticket={token}').status_code == 401
+
+# Test a ticket used on one worker is refused on another, whose blocklist is its own
+def test_events_ticket_other_worker(app, client, streaming, monkeypatch):
+    from blocklist import create_blocklist
+
+    with app.app_context():
+        token = create_access_token(identity="1", expires_delta=timedelta(seconds=1))
+
+    stream_ticket = ticket(client, token)
+    assert client.get(f'/api/user/events?ticket={stream_ticket}').status_code == 200
+
+    monkeypatch.setattr("blocklist.BLOCKLIST", create_blocklist("memory"))
+    monkeypatch.setattr("controllers.user.BLOCKLIST", create_blocklist("memory"))
+    assert client.get(f'/api/user/events?ticket={stream_ticket}').status_code == 401
+
+    with app.app_context():
+        assert models.TokenBlocklistModel.query.count() == 1
+
+# Test an expired ticket is refused
+def test_events_ticket_expired(app, client, streaming, monkeypatch):
+    with app.app_context():
+        token = create_access_token(identity="1")
+
+    stream_ticket = ticket(client, token)
+    monkeypatch.setattr("user_events.USER_EVENTS_TICKET_TTL", -1)
+    assert client.get(f'/api/user/events?ticket={stream_ticket}').status_code == 401
+
+# Test the ticket endpoint requires a token
+def test_events_endpoint_unauthorized(client, streaming):
+    assert client.post('/api/user/events/ticket').status_code == 401
+    assert client.get('/api/user/events').status_code == 401
+
+# Test a sync worker refuses to stream so the client polls instead
+def test_events_endpoint_sync_worker(app, client):
+    with app.app_context():
+        token = create_access_token(identity="1")
+
+    response = client.post('/api/user/events/ticket', headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 503
+    assert client.get('/api/user/events?ticket=x').status_code == 503
+
+# Test the endpoint answers 503 when the worker serves too many streams
+def test_events_endpoint_full(app, client, streaming, monkeypatch):
+    monkeypatch.setattr(bus, "max_subscribers", 0)
+
+    with app.app_context():
+        token = create_access_token(identity="1")
+
+    response = client.get(f'/api/user/events?ticket={ticket(client, token)}')
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
@@ -0,0 +1,125 @@
+"""
+This file contains the user behind the access token of a request. The JWT
+user lookup loader resolves it once per request, reading only the columns
+the handlers use (never the password hash), and every worker keeps the
+resolved users for USER_CACHE_TTL seconds so read-only endpoints such as
+/credits or /profile answer without a database round-trip.
+
+A change of a user made through this worker drops its cached entry once the
+transaction commits. Changes made by other workers are seen once the entry
+expires, so the TTL is the staleness bound of the cached fields.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from cache_utils import TTLCache
+from database import db
+import threading
+import models
+import os
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 5))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    id: int
+    email: str
+    name: str
+    surname: str
+    location_id: int
+    credits: int
+    role_id: int
+    updated_at: datetime | None
+
+
+CURRENT_USER_COLUMNS = [getattr(models.UserModel, name) for name in CurrentUser.__dataclass_fields__]
+
+users_cache = TTLCache(USER_CACHE_TTL, maxsize=USER_CACHE_SIZE)
+
+# Bumped by every invalidation, a user read before it is not cached after it
+_invalidations = 0
+_invalidations_lock = threading.Lock()
+
+
+def load_user(user_id):
+    """
+    :param user_id: Id of the user, as stored in the token.
+    :return: The CurrentUser or None if the user does not exist.
+    """
+    user_id = int(user_id)
+
+    user = users_cache.get(user_id)
+    if user is not None:
+        return user
+
+    invalidations = _invalidations
+    row = db.session.execute(select(*CURRENT_USER_COLUMNS).where(models.UserModel.id == user_id)).first()
+    if row is None:
+        return None
+
+    user = CurrentUser(**row._mapping)
+    with _invalidations_lock:
+        # A change committed while the row was read may not be in it
+        if invalidations == _invalidations:
+            users_cache.set(user_id, user)
+
+    return user
+
+
+def invalidate_user(user_id=None):
+    """
+    Drop a user from the cache, or every user when no id is given.
+
+    :param user_id: Id of the user.
+    """
+    global _invalidations
+    with _invalidations_lock:
+        _invalidations += 1
+        users_cache.invalidate(None if user_id is None else int(user_id))
+
+
+def mark_user_changed(session, user_id):
+    """
+    Drop the cached user once the transaction of the session commits. Changes
+    made with the ORM are tracked already, UPDATE statements must call this.
+
+    :param session: Session making the change.
+    :param user_id: Id of the changed user.
+    """
+    session.info.setdefault("changed_users", set()).add(int(user_id))
+
+
+@event.listens_for(models.UserModel, "after_update")
+@event.listens_for(models.UserModel, "after_delete")
+def track_user_change(mapper, connection, target):
+    mark_user_changed(object_session(target), target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_users", ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_users(session):
+    session.info.pop("changed_users", None)
+
+
+def init_user_loader(jwt):
+    """
+    Resolve ``current_user`` of flask_jwt_extended with load_user. A token of
+    a user that does not exist anymore is answered with a 404.
+
+    :param jwt: JWTManager of the app.
+    """
+    @jwt.user_lookup_loader
+    def user_lookup_callback(jwt_header, jwt_payload):
+        return load_user(jwt_payload["sub"])
+
+    @jwt.user_lookup_error_loader
+    def user_lookup_error_callback(jwt_header, jwt_payload):
+        return {"message": "User not found"}, 404
@@ -0,0 +1,109 @@
+import threading
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from database import db
+from user_identity import load_user, users_cache
+from credit_ledger import apply_credits, PURCHASE
+import user_identity
+import models
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.add(models.LocationModel(name="westeurope", display_name="(Europe) West Europe"))
+        db.session.add(models.UserModel(id=1, email="user1@example.com", password="x", name="Test", surname="User",
+                                        location_id=1, credits=50))
+        db.session.commit()
+
+@pytest.fixture
+def statements(app):
+    """SQL statements run while the test is running."""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", record)
+        yield executed
+        event.remove(db.engine, "before_cursor_execute", record)
+
+def auth(app, user_id=1):
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+# Test the current user is read once and then served from the cache
+def test_cached_user(app, client, statements):
+    headers = auth(app)
+
+    assert client.get('/api/user/credits', headers=headers).json == {"credits": 50}
+    assert len(statements) == 1
+
+    assert client.get('/api/user/credits', headers=headers).json == {"credits": 50}
+    assert client.get('/api/user/profile', headers=headers).json["email"] == "user1@example.com"
+    assert len(statements) == 1
+
+# Test the loader does not read the password hash
+def test_projection(app, client, statements):
+    client.get('/api/user/profile', headers=auth(app))
+    assert "users.credits" in statements[0]
+    assert "password" not in statements[0]
+
+# Test a credit change drops the cached user once committed
+def test_credit_change_invalidates(app, client):
+    headers = auth(app)
+    client.get('/api/user/credits', headers=headers)
+
+    with app.app_context():
+        apply_credits(1, 100, PURCHASE, "invoice-1")
+        assert users_cache.get(1) is not None
+        db.session.commit()
+        assert users_cache.get(1) is None
+
+    assert client.get('/api/user/credits', headers=headers).json == {"credits": 150}
+
+# Test a rolled back change keeps the cached user
+def test_rollback_keeps_cache(app, client):
+    client.get('/api/user/credits', headers=auth(app))
+
+    with app.app_context():
+        apply_credits(1, 100, PURCHASE, "invoice-1")
+        db.session.rollback()
+        db.session.commit()
+
+    assert users_cache.get(1) is not None
+
+# Test a profile edit is seen by the next read
+def test_profile_edit_invalidates(app, client):
+    headers = auth(app)
+    client.get('/api/user/profile', headers=headers)
+
+    response = client.put('/api/user/profile', json={"name": "New", "surname": "Name", "location_id": 2}, headers=headers)
+    assert response.status_code == 201
+
+    profile = client.get('/api/user/profile', headers=headers).json
+    assert (profile["name"], profile["surname"], profile["location_id"]) == ("New", "Name", 2)
+
+# Test a user read while it changes is not cached
+def test_concurrent_change_not_cached(app, monkeypatch):
+    with app.app_context():
+        execute = db.session.execute
+
+        def execute_during_change(*args, **kwargs):
+            result = execute(*args, **kwargs)
+            # Another request commits a change after the row was read
+            thread = threading.Thread(target=user_identity.invalidate_user, args=(1,))
+            thread.start()
+            thread.join()
+            return result
+
+        monkeypatch.setattr(db.session, "execute", execute_during_change)
+        assert load_user(1).credits == 50
+        assert users_cache.get(1) is None
+
+# Test a token of a deleted user is answered with a 404
+def test_missing_user(app, client):
+    response = client.get('/api/user/credits', headers=auth(app, 2))
+    assert response.status_code == 404
+    assert response.json == {"message": "User not found"}
@@ -0,0 +1,54 @@
+"""
+This file contains the VM cost calculation shared by the endpoints and the
+credit sweeper.
+"""
+from datetime import datetime, timezone, timedelta
+
+# 1€ equals to 100 / 3.99 = 25.06 credits.
+
+VM_EUROS_MINUTE = 0.001625
+IP_EUROS_MINUTE = 0.00015625
+DISK_EUROS_MINUTE = 0.00012592592
+
+VM_CREDITS_MINUTE = VM_EUROS_MINUTE * 25.06
+IP_CREDITS_MINUTE = IP_EUROS_MINUTE * 25.06
+DISK_CREDITS_MINUTE = DISK_EUROS_MINUTE * 25.06
+
+TOTAL_CREDITS_MINUTE = VM_CREDITS_MINUTE + IP_CREDITS_MINUTE + DISK_CREDITS_MINUTE
+
+UTC = timezone(timedelta(hours=0))
+
+def calc_vm_credits_costs(vm, now=None):
+    """
+    Function that calcs VM cost by the used time.
+
+    :param vm: VM instance
+    :param now: Time used for VMs still running, defaults to the current time
+    :return: the total of credits spent by the vm
+    """
+    return calc_vm_credits_costs_batch([vm.created_at], [vm.powered_off_at], now)[0]
+
+def calc_vm_credits_costs_batch(created_at, powered_off_at, now=None):
+    """
+    Function that calcs the cost of many VMs in one pass over their columns,
+    without loading them as ORM objects. Gives the same result as calling
+    calc_vm_credits_costs on every VM with the same ``now``.
+
+    :param created_at: Sequence with the created_at column.
+    :param powered_off_at: Sequence with the powered_off_at column, None for running VMs.
+    :param now: Time used for VMs still running, defaults to the current time
+    :return: List with the total of credits spent by every vm
+    """
+    now = now or datetime.now(UTC)
+    rate = TOTAL_CREDITS_MINUTE
+
+    costs = []
+    for created, off in zip(created_at, powered_off_at):
+        end = now if off is None else off
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=UTC)
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=UTC)
+        costs.append(round((end - created).total_seconds() / 60.0 * rate + 1))
+
+    return costs
@@ -0,0 +1,32 @@
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+from hypothesis import given, strategies as st
+from vm_costs import calc_vm_credits_costs, calc_vm_credits_costs_batch
+
+NOW = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+created_times = st.datetimes(
+    min_value=datetime(2020, 1, 1),
+    max_value=datetime(2024, 6, 1),
+    timezones=st.sampled_from([timezone.utc, timezone(timedelta(hours=2)), None])
+).map(lambda created: created if created.tzinfo is None else created.astimezone(timezone.utc))
+
+@st.composite
+def vm_columns(draw):
+    created_at = draw(created_times)
+    aware_created_at = created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+    running_minutes = draw(st.one_of(st.none(), st.floats(min_value=0, max_value=60 * 24 * 365)))
+    powered_off_at = None if running_minutes is None else aware_created_at + timedelta(minutes=running_minutes)
+    return created_at, powered_off_at
+
+# Test the batch calculation matches the per-VM function for every VM
+@given(st.lists(vm_columns(), max_size=50))
+def test_batch_matches_per_vm(vms):
+    expected = [calc_vm_credits_costs(SimpleNamespace(created_at=created, powered_off_at=off), NOW) for created, off in vms]
+    assert calc_vm_credits_costs_batch([created for created, _ in vms], [off for _, off in vms], NOW) == expected
+
+# Test a VM running for one hour costs the hourly rate plus the starting credit
+def test_one_hour_cost():
+    vm = SimpleNamespace(created_at=NOW - timedelta(hours=1), powered_off_at=NOW)
+    assert calc_vm_credits_costs(vm) == 4
+    assert calc_vm_credits_costs_batch([vm.created_at], [vm.powered_off_at]) == [4]
@@ -0,0 +1,68 @@
+import pytest
+from datetime import datetime, timezone, timedelta
+from flask_jwt_extended import create_access_token
+from database import db
+import models
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        for user_id in (1, 2):
+            db.session.add(models.UserModel(id=user_id, email=f"user{user_id}@example.com", password="x",
+                                            name="Test", surname="User", location_id=1))
+        # 7 VMs of user 1, one per day, the even ones still running. Two share the same created_at.
+        for day in range(7):
+            db.session.add(models.VirtualMachineModel(
+                name=f"vm{day}",
+                user_id=1,
+                created_at=START + timedelta(days=min(day, 5)),
+                powered_off_at=None if day % 2 == 0 else START + timedelta(days=day, hours=1)
+            ))
+        db.session.add(models.VirtualMachineModel(name="other", user_id=2, created_at=START))
+        db.session.commit()
+
+@pytest.fixture
+def headers(app):
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+
+def read_all_pages(client, headers, query=""):
+    names, cursor = [], None
+    while True:
+        url = f'/api/azurevm/history?limit=3{query}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json["vm_list"]) <= 3
+        names += [vm["name"] for vm in response.json["vm_list"]]
+        cursor = response.json["next_cursor"]
+        if cursor is None:
+            return names
+
+# Test history pages cover every VM of the user once, newest first
+def test_history_pages(client, headers):
+    assert read_all_pages(client, headers) == ["vm6", "vm5", "vm4", "vm3", "vm2", "vm1", "vm0"]
+
+# Test history running filter
+def test_history_running_filter(client, headers):
+    assert read_all_pages(client, headers, "&running=true") == ["vm6", "vm4", "vm2", "vm0"]
+    assert read_all_pages(client, headers, "&running=false") == ["vm5", "vm3", "vm1"]
+
+# Test history date range filter
+def test_history_date_filter(client, headers):
+    query = "&created_from=2024-01-02T00:00:00%2B00:00&created_to=2024-01-05T00:00:00%2B00:00"
+    assert read_all_pages(client, headers, query) == ["vm3", "vm2", "vm1"]
+
+# Test history answers 304 when the ETag did not change
+def test_history_etag(client, headers):
+    response = client.get('/api/azurevm/history?running=false', headers=headers)
+    etag = response.headers["ETag"]
+
+    response = client.get('/api/azurevm/history?running=false', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+# Test history rejects a malformed cursor
+def test_history_invalid_cursor(client, headers):
+    response = client.get('/api/azurevm/history?cursor=notacursor', headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,159 @@
+"""
+This file contains the VM provisioning jobs. A setup request only inserts a
+row in the vm_jobs table, the orchestrator call runs later on the scheduler
+thread pool and its outcome is written back to the row so the client can poll it.
+
+Jobs live in the database, so a job queued by a worker that dies is picked up
+again by the periodic resume task of any other worker.
+"""
+from datetime import datetime, timezone, timedelta
+from scheduler import scheduler, periodic_job
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import update
+from orchestrator import orchestrator, OrchestratorError
+from database import db
+from user_events import publish_after_commit
+import models
+import uuid
+import os
+
+JOB_POLL_SECONDS = int(os.getenv("VM_JOB_POLL_SECONDS", 15))
+JOB_STALE_AFTER = timedelta(seconds=int(os.getenv("VM_JOB_STALE_AFTER", 3600)))
+
+
+def enqueue_setup(app, user_id):
+    """
+    Persist a new provisioning job and hand it to the scheduler.
+
+    :param app: Flask app the job runs against.
+    :param user_id: Owner of the VM.
+    :return: The queued job.
+    """
+    job = models.VmJobModel(id=str(uuid.uuid4()), user_id=user_id, status="queued")
+
+    db.session.add(job)
+    db.session.commit()
+
+    schedule_job(app, job.id)
+
+    return job
+
+
+def schedule_job(app, job_id):
+    """
+    Run a job as soon as a scheduler thread is free.
+
+    :param app: Flask app the job runs against.
+    :param job_id: Job to run.
+    """
+    scheduler.add_job(run_setup_job, args=[app, job_id], id=f"vm-setup-{job_id}", replace_existing=True)
+
+
+def claim_job(job_id):
+    """
+    Atomically move a job from queued to running, so only one thread of one
+    worker ever runs it.
+
+    :param job_id: Job to claim.
+    :return: True if this caller owns the job.
+    """
+    result = db.session.execute(
+        update(models.VmJobModel)
+        .where(models.VmJobModel.id == job_id, models.VmJobModel.status == "queued")
+        .values(status="running", started_at=datetime.now(timezone.utc))
+    )
+    db.session.commit()
+
+    return result.rowcount == 1
+
+
+def finish_job(job, status, error=None):
+    job.status = status
+    job.error = error
+    job.finished_at = datetime.now(timezone.utc)
+    db.session.commit()
+
+
+def run_setup_job(app, job_id):
+    """
+    Ask the orchestrator for a new VM and record it for the job owner. Any
+    unexpected error fails the job, so the client does not poll it until
+    JOB_STALE_AFTER.
+
+    :param app: Flask app the job runs against.
+    :param job_id: Job to run.
+    """
+    with app.app_context():
+        if not claim_job(job_id):
+            return
+
+        job = db.session.get(models.VmJobModel, job_id)
+
+        try:
+            create_vm(app, job)
+        except Exception:
+            app.logger.exception("Setup job %s failed", job_id)
+            db.session.rollback()
+            finish_job(job, "failed", "Error trying to create a VM, please try again.")
+
+
+def create_vm(app, job):
+    """
+    :param app: Flask app the job runs against.
+    :param job: Claimed job.
+    """
+    try:
+        json_res = orchestrator.setup()
+    except OrchestratorError:
+        finish_job(job, "failed", "Error trying to create a VM, please try again.")
+        return
+
+    if not json_res.get("dns") or not json_res.get("ip"):
+        app.logger.error("Setup job %s got an orchestrator answer without dns or ip: %s", job.id, json_res)
+        finish_job(job, "failed", "Error trying to create a VM, please try again.")
+        return
+
+    try:
+        vm = models.VirtualMachineModel(
+            type="Standard_B2s",
+            name=json_res["dns"],
+            user_id=job.user_id
+        )
+
+        db.session.add(vm)
+        publish_after_commit(db.session, job.user_id, "vm", {"name": json_res["dns"], "state": "running"},
+                             key=json_res["dns"])
+        job.ip = json_res["ip"]
+        job.dns = json_res["dns"]
+        finish_job(job, "succeeded")
+
+    except IntegrityError:
+        db.session.rollback()
+        finish_job(job, "failed", "An integrity error has ocurred.")
+
+
+@periodic_job(JOB_POLL_SECONDS)
+def resume_pending_jobs(app):
+    """
+    Reschedule queued jobs whose worker went away and fail the ones that have
+    been running for too long. A running setup is not retried since the
+    orchestrator may already have created the VM.
+
+    :param app: Flask app the jobs run against.
+    """
+    with app.app_context():
+        now = datetime.now(timezone.utc)
+
+        db.session.execute(
+            update(models.VmJobModel)
+            .where(models.VmJobModel.status == "running", models.VmJobModel.started_at < now - JOB_STALE_AFTER)
+            .values(status="failed", error="Provisioning was interrupted, please try again.", finished_at=now)
+        )
+        db.session.commit()
+
+        queued = db.session.execute(
+            db.select(models.VmJobModel.id).where(models.VmJobModel.status == "queued")
+        ).scalars().all()
+
+    for job_id in queued:
+        schedule_job(app, job_id)
@@ -0,0 +1,136 @@
+import pytest
+from datetime import datetime, timezone, timedelta
+from flask_jwt_extended import create_access_token
+from database import db
+import models
+import vm_provisioning
+from orchestrator import OrchestratorUnavailable
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.session.add(models.UserModel(email="test@example.com", password="x", name="Test", surname="User", location_id=1, credits=10))
+        db.session.commit()
+
+@pytest.fixture
+def orchestrator(monkeypatch):
+    calls = []
+
+    def fake_setup():
+        calls.append("/vm/setup")
+        return {"dns": "vm1.westeurope.cloudapp.azure.com", "ip": "10.0.0.1"}
+
+    monkeypatch.setattr(vm_provisioning.orchestrator, "setup", fake_setup)
+    return calls
+
+# Test setup endpoint answers 202 with a job and the job endpoint reports it
+def test_setup_returns_job(app, client, orchestrator):
+    with app.app_context():
+        token = create_access_token(identity="1")
+
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.get('/api/azurevm/setup', headers=headers)
+    assert response.status_code == 202
+    assert response.json["status"] == "queued"
+    assert response.headers["Location"].endswith(response.json["job_id"])
+    assert orchestrator == []
+
+    response = client.get(response.headers["Location"], headers=headers)
+    assert response.status_code == 200
+    assert response.json["status"] == "queued"
+
+# Test job endpoint does not show jobs of other users
+def test_job_other_user(app, client):
+    with app.app_context():
+        job = vm_provisioning.enqueue_setup(app, 1)
+        token = create_access_token(identity="2")
+
+    response = client.get(f'/api/azurevm/jobs/{job.id}', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 404
+
+# Test running a job creates the VM and stores the result
+def test_run_setup_job_succeeded(app, orchestrator):
+    with app.app_context():
+        job_id = vm_provisioning.enqueue_setup(app, 1).id
+
+    vm_provisioning.run_setup_job(app, job_id)
+
+    with app.app_context():
+        job = db.session.get(models.VmJobModel, job_id)
+        assert job.status == "succeeded"
+        assert job.dns == "vm1.westeurope.cloudapp.azure.com"
+        assert models.VirtualMachineModel.query.filter_by(user_id=1).count() == 1
+
+# Test a job only runs once even if it is scheduled twice
+def test_run_setup_job_once(app, orchestrator):
+    with app.app_context():
+        job_id = vm_provisioning.enqueue_setup(app, 1).id
+
+    vm_provisioning.run_setup_job(app, job_id)
+    vm_provisioning.run_setup_job(app, job_id)
+
+    assert len(orchestrator) == 1
+
+# Test a job fails when the orchestrator can not be reached
+def test_run_setup_job_failed(app, monkeypatch):
+    def failing_setup():
+        raise OrchestratorUnavailable("Connection refused")
+
+    monkeypatch.setattr(vm_provisioning.orchestrator, "setup", failing_setup)
+
+    with app.app_context():
+        job_id = vm_provisioning.enqueue_setup(app, 1).id
+
+    vm_provisioning.run_setup_job(app, job_id)
+
+    with app.app_context():
+        job = db.session.get(models.VmJobModel, job_id)
+        assert job.status == "failed"
+        assert models.VirtualMachineModel.query.count() == 0
+
+# Test a job fails right away when the orchestrator answers without the VM address
+def test_run_setup_job_incomplete_answer(app, monkeypatch):
+    monkeypatch.setattr(vm_provisioning.orchestrator, "setup", lambda: {"message": "VM created"})
+
+    with app.app_context():
+        job_id = vm_provisioning.enqueue_setup(app, 1).id
+
+    vm_provisioning.run_setup_job(app, job_id)
+
+    with app.app_context():
+        job = db.session.get(models.VmJobModel, job_id)
+        assert job.status == "failed"
+        assert job.finished_at is not None
+        assert models.VirtualMachineModel.query.count() == 0
+
+# Test a job fails right away on an unexpected error instead of staying running
+def test_run_setup_job_unexpected_error(app, monkeypatch):
+    monkeypatch.setattr(vm_provisioning.orchestrator, "setup", lambda: ["not", "a", "dict"])
+
+    with app.app_context():
+        job_id = vm_provisioning.enqueue_setup(app, 1).id
+
+    vm_provisioning.run_setup_job(app, job_id)
+
+    with app.app_context():
+        job = db.session.get(models.VmJobModel, job_id)
+        assert job.status == "failed"
+        assert job.error == "Error trying to create a VM, please try again."
+        assert job.finished_at is not None
+
+# Test resume fails jobs left running by a dead worker
+def test_resume_stale_running_job(app):
+    with app.app_context():
+        job = models.VmJobModel(
+            id="stale",
+            user_id=1,
+            status="running",
+            started_at=datetime.now(timezone.utc) - vm_provisioning.JOB_STALE_AFTER - timedelta(minutes=1)
+        )
+        db.session.add(job)
+        db.session.commit()
+
+    vm_provisioning.resume_pending_jobs(app)
+
+    with app.app_context():
+        assert db.session.get(models.VmJobModel, "stale").status == "failed"
@@ -9,5 +9,10 @@ cp ../certs/* api/certs/
 cd client/
 echo "Compilando el cliente..."
 npx vite build
+echo "Comprimiendo el cliente (gzip y brotli)..."
+find dist -type f \( -name '*.js' -o -name '*.css' -o -name '*.html' -o -name '*.svg' -o -name '*.json' \) -exec gzip -k -f -9 {} \;
+if command -v brotli > /dev/null; then
+    find dist -type f \( -name '*.js' -o -name '*.css' -o -name '*.html' -o -name '*.svg' -o -name '*.json' \) -exec brotli -k -f -q 11 {} \;
+fi
 echo "Moviendo el cliente a la carpeta dist de la api..."
 mv dist/ ../api/
@@ -20,6 +20,7 @@ import { ToastContainer, notify } from './utils/notificationUtils';
 import { invalidateToken, logoutUserLocally } from './services/userService';
 import RecoverPasswordPage from './components/auth/RecoverPassword';
 import { fetchUserCredits } from './services/userService';
+import { subscribeToUserEvents } from './services/eventsService';
 
 function App() {
   const [isAuthenticated, setIsAuthenticated] = useState<boolean>(!!localStorage.getItem('token'));
@@ -51,26 +52,21 @@ function App() {
     }
   }, []);
 
-  // New useEffect for handling credits update
+  // Credits are pushed by the server through the user events stream
   useEffect(() => {
-    const handleCreditsUpdate = async () => {
-      if (isAuthenticated) {
-        const updatedCredits = await fetchUserCredits();
-        setUserCredits(updatedCredits);
-      } else {
-        setUserCredits(null);
-      }
-    };
+    if (!isAuthenticated) {
+      setUserCredits(null);
+      return;
+    }
 
-    handleCreditsUpdate();
+    fetchUserCredits().then(setUserCredits).catch(() => {});
 
-    // Subscribe to storage event
-    window.addEventListener('storage', handleCreditsUpdate);
+    const unsubscribe = subscribeToUserEvents({ onCredits: setUserCredits });
 
     return () => {
-      window.removeEventListener('storage', handleCreditsUpdate);
+      unsubscribe?.();
     };
-  }, [isAuthenticated, location]); // Now this effect depends on both authentication status and location
+  }, [isAuthenticated]);
 
 
   const handleLogout = async () => {
@@ -2,6 +2,7 @@ import { useEffect, useState } from 'react';
 import { getVirtualMachinesHistory, powerOffVirtualMachine } from './../../services/vmService';
 import { VirtualMachineHistory } from './../../models/VirtualMachineHistory';
 import { notify } from './../../utils/notificationUtils';
+import { subscribeToUserEvents } from './../../services/eventsService';
 
 
 function DashboardPage() {
@@ -101,7 +102,6 @@ function DashboardPage() {
                         powered_off_at: vm.powered_off_at ? new Date(Date.parse(vm.powered_off_at)).toLocaleString('en-GB', { timeZone: 'Europe/Madrid' }) : 'Still Running',
                         cost: vm.cost
                     }))
-                    .reverse() // Reverse the order to show the newest first
             );
         } catch (error) {
             // console.error("Error fetching VM history:", error);
@@ -112,6 +112,13 @@ function DashboardPage() {
     
     useEffect(() => {
         fetchVmHistory();
+
+        // Started and powered off VMs are pushed by the server
+        const unsubscribe = subscribeToUserEvents({ onVm: () => fetchVmHistory() });
+
+        return () => {
+            unsubscribe?.();
+        };
     }, []);
     
     
@@ -0,0 +1,156 @@
+import { fetchUserCredits } from './userService';
+
+/****************** USER EVENTS SECTION START ******************/
+
+export interface RunningVmCost {
+  id: number;
+  name: string;
+  cost: number;
+}
+
+export interface UserEventHandlers {
+  onCredits?: (credits: number) => void;
+  onVm?: (vm: { id?: number; name?: string; state: string; cost?: number }) => void;
+  onCost?: (cost: { running: RunningVmCost[]; projected_credits: number }) => void;
+}
+
+const TICKET_URL = '/api/user/events/ticket';
+const RECONNECT_DELAY_MS = 5000;
+const POLL_INTERVAL_MS = 30000;
+
+// Every subscriber of the tab shares one stream
+const subscribers = new Set<UserEventHandlers>();
+let closeStream: (() => void) | null = null;
+
+const dispatch = (notify: (handlers: UserEventHandlers) => void) => {
+  subscribers.forEach(notify);
+};
+
+/**
+ * Opens the /api/user/events stream shared by the subscribers of the tab.
+ * EventSource can not send headers, so every connection first exchanges the
+ * token for a single use ticket that goes in the query string. When the
+ * stream closes, a new ticket is requested and the stream reopened.
+ * When the server does not stream (503 on the ticket), the credits are polled instead.
+ * @returns A function closing the stream.
+ */
+const openStream = (): (() => void) => {
+  let source: EventSource | null = null;
+  let timer: ReturnType<typeof setTimeout> | null = null;
+  let closed = false;
+
+  const later = (callback: () => void, delay: number) => {
+    if (!closed) {
+      timer = setTimeout(callback, delay);
+    }
+  };
+
+  const poll = () => {
+    fetchUserCredits()
+      .then((credits) => {
+        if (!closed && credits !== null) {
+          dispatch((handlers) => handlers.onCredits?.(credits));
+        }
+      })
+      .catch(() => {});
+    later(poll, POLL_INTERVAL_MS);
+  };
+
+  const connect = async () => {
+    let response: Response;
+    try {
+      response = await fetch(TICKET_URL, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` },
+      });
+    } catch {
+      later(connect, RECONNECT_DELAY_MS);
+      return;
+    }
+
+    if (closed) {
+      return;
+    }
+    if (response.status === 503) {
+      later(poll, POLL_INTERVAL_MS);
+      return;
+    }
+    if (!response.ok) {
+      // The token is no longer valid, the rest of the app handles the logout
+      return;
+    }
+
+    const { ticket } = await response.json();
+    if (closed) {
+      return;
+    }
+
+    source = new EventSource(`/api/user/events?ticket=${encodeURIComponent(ticket)}`);
+
+    source.addEventListener('credits', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      localStorage.setItem('userCredits', data.credits.toString());
+      dispatch((handlers) => handlers.onCredits?.(data.credits));
+    });
+
+    source.addEventListener('vm', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      dispatch((handlers) => handlers.onVm?.(data));
+    });
+
+    source.addEventListener('cost', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      dispatch((handlers) => handlers.onCost?.(data));
+    });
+
+    // The ticket was used, the browser can not reconnect with it
+    source.onerror = () => {
+      source?.close();
+      source = null;
+      later(connect, RECONNECT_DELAY_MS);
+    };
+  };
+
+  connect();
+
+  return () => {
+    closed = true;
+    source?.close();
+    if (timer) {
+      clearTimeout(timer);
+    }
+  };
+};
+
+/**
+ * Subscribes to the events of the logged in user. The first subscriber of
+ * the tab opens the stream and the last one to leave closes it.
+ * @param handlers Callbacks of the credits, vm and cost events.
+ * @returns A function removing the subscriber, or null if there is no token.
+ */
+export const subscribeToUserEvents = (handlers: UserEventHandlers): (() => void) | null => {
+  if (!localStorage.getItem('token')) {
+    return null;
+  }
+
+  subscribers.add(handlers);
+  if (!closeStream) {
+    closeStream = openStream();
+  }
+
+  let subscribed = true;
+
+  return () => {
+    if (!subscribed) {
+      return;
+    }
+    subscribed = false;
+    subscribers.delete(handlers);
+    if (subscribers.size === 0 && closeStream) {
+      closeStream();
+      closeStream = null;
+    }
+  };
+};
+
+/****************** USER EVENTS SECTION END ******************/
@@ -65,11 +65,14 @@ export async function createVirtualMachine(): Promise<VirtualMachine> { // Remov
       throw new Error(`HTTP error! Status: ${response.status} Message: ${data.message}`);
     }
 
+    // The API only queues the setup, poll the job until the VM is ready
+    const job = await waitForVirtualMachineJob(data.job_id, token);
+
     return {
-      dns: data.dns,
-      ip: data.ip,
-      url: `https://${data.dns}`,
-      price: data.price // Assuming the API response includes the price
+      dns: job.dns,
+      ip: job.ip,
+      url: `https://${job.dns}`,
+      price: job.price // Assuming the API response includes the price
     };
   } catch (error) {
     // console.error("Failed to create virtual machine:", error);
@@ -77,6 +80,43 @@ export async function createVirtualMachine(): Promise<VirtualMachine> { // Remov
   }
 }
 
+const JOB_POLL_INTERVAL_MS = 5000;
+
+/**
+ * Function to wait for a VM setup job to finish.
+ * @param jobId The job ID returned by the setup endpoint.
+ * @param token The user token.
+ * @returns A promise that resolves to the finished job.
+ */
+async function waitForVirtualMachineJob(jobId: string, token: string): Promise<any> {
+  const apiUrl = `/api/azurevm/jobs/${jobId}`;
+
+  while (true) {
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+
+    const response = await fetch(apiUrl, {
+      method: 'GET',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+        'Content-Type': 'application/json',
+      }
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(`HTTP error! Status: ${response.status} Message: ${data.message}`);
+    }
+
+    if (data.status === 'succeeded') {
+      return data;
+    }
+
+    if (data.status === 'failed') {
+      throw new Error(data.error || 'Error trying to create a VM, please try again.');
+    }
+  }
+}
+
 export async function powerOffVirtualMachine(vmId: number): Promise<string> {
   const apiUrl = `/api/azurevm/poweroff`;
 
@@ -108,41 +148,74 @@ export async function powerOffVirtualMachine(vmId: number): Promise<string> {
   }
 }
 
-export async function getVirtualMachinesHistory(): Promise<VirtualMachineHistory[]> {
-  const apiUrl = `/api/azurevm/history`;
+// Last response of every history page, revalidated with If-None-Match
+const historyPageCache = new Map<string, { etag: string; data: any }>();
+
+/**
+ * Function to fetch one page of the VM history, reusing the cached page when
+ * the server answers 304 Not Modified.
+ * @param apiUrl The URL of the page.
+ * @param token The user token.
+ * @returns A promise that resolves to the page body.
+ */
+async function fetchHistoryPage(apiUrl: string, token: string): Promise<any> {
+  const cached = historyPageCache.get(apiUrl);
+  const headers: Record<string, string> = {
+    'Authorization': `Bearer ${token}`,
+    'Content-Type': 'application/json',
+  };
+  if (cached) {
+    headers['If-None-Match'] = cached.etag;
+  }
 
+  const response = await fetch(apiUrl, { method: 'GET', headers });
+
+  if (response.status === 304 && cached) {
+    return cached.data;
+  }
+
+  if (!response.ok) {
+    const errorData = await response.json();
+
+    if (response.status === 404 && errorData.message === "User not found") {
+      throw new Error('User account not found. Please log in again.');
+    } else if (response.status === 401 && errorData.message === 'Token has expired') {
+      throw new Error('Your session has expired. Please log in again.');
+    }
+
+    throw new Error(errorData.message || 'Failed to retrieve virtual machine history. Please try again later.');
+  }
+
+  const data = await response.json();
+  const etag = response.headers.get('ETag');
+  if (etag) {
+    historyPageCache.set(apiUrl, { etag, data });
+  }
+  return data;
+}
+
+export async function getVirtualMachinesHistory(): Promise<VirtualMachineHistory[]> {
   try {
     const token = localStorage.getItem('token');
     if (!token) {
       throw new Error('Authorization token not found. Please log in again.');
     }
 
-    const response = await fetch(apiUrl, {
-      method: 'GET',
-      headers: {
-        'Authorization': `Bearer ${token}`,
-        'Content-Type': 'application/json',
-      }
-    });
-
-    if (!response.ok) {
-      const errorData = await response.json();
-
-      if (response.status === 404) {
-        if (errorData.message === "User not found") {
-          throw new Error('User account not found. Please log in again.');
-        } else if (errorData.message === "No VMs found") {
-          throw new Error('No virtual machines found in your history.');
-        }
-      } else if (response.status === 401 && errorData.message === 'Token has expired') {
-        throw new Error('Your session has expired. Please log in again.');
-      }
-
-      throw new Error(errorData.message || 'Failed to retrieve virtual machine history. Please try again later.');
+    // The history is paginated, follow next_cursor until the last page
+    const vmList: any[] = [];
+    let cursor: string | null = null;
+    do {
+      const apiUrl: string = cursor ? `/api/azurevm/history?cursor=${encodeURIComponent(cursor)}` : `/api/azurevm/history`;
+      const data = await fetchHistoryPage(apiUrl, token);
+      vmList.push(...data.vm_list);
+      cursor = data.next_cursor;
+    } while (cursor);
+
+    if (vmList.length === 0) {
+      throw new Error('No virtual machines found in your history.');
     }
 
-    const data = await response.json();
-    return data.vm_list.map((vm: any) => ({
+    return vmList.map((vm: any) => ({
       id: vm.id.toString(),
       name: vm.name,
       created_at: new Date(Date.parse(vm.created_at)).toLocaleString('en-US', { timeZone: 'UTC' }),